@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Measures recall against latency of the approximate nearest neighbor search of the article archive (see src/archiveindex.py)
+on a generated archive: for several signature lengths, band sizes, numbers of candidates and budgets of bucket sizes, the approximate top k of every
+fixture user is compared with the exact top k, with and without the filter by the user's main section
+(run e.g. python benchmarks/bench_archive.py --articles 200000 --output archive.json)
+"""
+
+# Imports
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+from results import REPO, environment, summarize, peak_memory, write_results
+
+# The modules under test live in the src folder
+sys.path.insert(0, os.path.join(REPO, "src"))
+from archiveindex import build_archive, ArchiveIndex, MAX_HITS
+from minhash import MinHasher
+from tokenizer import Tokenizer
+
+# Settings of the index as (signature length, values per band), and of the search as (number of exactly ranked candidates
+# (None for all that share a band), budget of articles in the used buckets (None for all buckets))
+INDEXES = [(64, 1), (128, 1), (128, 2), (256, 1)]
+SEARCHES = [(300, None), (1000, None), (3000, None), (10000, None), (None, None), (10000, MAX_HITS), (10000, 20000), (10000, 5000), (3000, 5000), (1000, 2000)]
+
+
+def make_word(number):
+    """
+    Makes an alphabetic word for a number, so that the tokenizer keeps it
+
+    number (int): word number
+    returns string
+    """
+    letters = []
+    while True:
+        letters.append(chr(ord("a") + number % 26))
+        number //= 26
+        if not number:
+            return "q" + "".join(letters)
+
+
+def make_archive(rng, words, number_of_articles, vocabulary = 50000):
+    """
+    Draws articles of 20 to 60 words: 30% from the characteristic words of their section, the rest from a large vocabulary
+    with Zipf-distributed word frequencies, like names and rare words in real articles
+
+    rng (RandomState): random number generator
+    words (dictionary): words per section, as in the sections fixture
+    number_of_articles (int): number of articles, the sections take turns
+    vocabulary (int): size of the large vocabulary
+    returns list of tuples of (list of words, label)
+    """
+    sections = sorted(section for section in words if section != "filler")
+    articles = []
+    for idx in range(number_of_articles):
+        length, section = rng.randint(20, 61), words[sections[idx % len(sections)]]
+        characteristic = rng.random_sample(length) < 0.3
+        picks, common = rng.randint(len(section), size = length), np.minimum(rng.zipf(1.2, size = length), vocabulary) - 1
+        articles.append(([section[pick] if flag else make_word(number) for flag, pick, number in zip(characteristic, picks, common)], idx % len(sections)))
+    return articles
+
+
+def recall(approximate, exact):
+    """
+    Fraction of the exact neighbors that the approximate search found, articles at the same distance as the last exact
+    neighbor count as found
+
+    approximate (list of tuples): (article number, distance) of the approximate search
+    exact (list of tuples): (article number, distance) of the exact search
+    returns float
+    """
+    if not exact:
+        return 1.0
+    found = set(article for article, distance in exact) & set(article for article, distance in approximate)
+    ties = sum(1 for article, distance in approximate if article not in found and distance <= exact[-1][1])
+    return min(len(found) + ties, len(exact)) / float(len(exact))
+
+
+
+def main():
+    """
+    Main function
+    """
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--articles", type = int, default = 100000, help = "articles in the archive")
+    parser.add_argument("--k", type = int, default = 10, help = "neighbors per query")
+    parser.add_argument("--tweets", type = int, default = 100, help = "tweets per user")
+    parser.add_argument("--output", help = "json file for the results, by default stdout")
+    args = parser.parse_args()
+
+    # Archive and the words of the fixture users (user number modulo the sections is the user's main section)
+    with gzip.open(os.path.join(REPO, "benchmarks", "fixtures", "sections.json.gz")) as f:
+        words = json.load(f)
+    with gzip.open(os.path.join(REPO, "benchmarks", "fixtures", "timelines.json.gz")) as f:
+        timelines = json.load(f)
+    tokenizer = Tokenizer(stopwords = ["RT"])
+    articles = make_archive(np.random.RandomState(0), words, args.articles)
+    users = sorted(timelines, key = lambda user: int(user.rsplit("_", 1)[1]))
+    queries = [([word for status in timelines[user][:args.tweets] for word in tokenizer.tokenize(status["text"])], idx % 14) for idx, user in enumerate(users)]
+
+    # Build every index, then measure the exact and the approximate search against it
+    folder = tempfile.mkdtemp(prefix = "rlyt-archive-")
+    indexes = []
+    try:
+        for num_perm, rows in INDEXES:
+            print >> sys.stderr, "Index with {} hash functions in bands of {}...".format(num_perm, rows)
+            path = os.path.join(folder, "{}_{}".format(num_perm, rows))
+            start = time.time()
+            build_archive(((words_, label, {}) for words_, label in articles), path, hasher = MinHasher(num_perm = num_perm, shingle = 1), rows = rows)
+            build = time.time() - start
+            index = ArchiveIndex(path)
+            result = {"num_perm": num_perm, "rows": rows, "build_seconds": round(build, 3), "megabytes": round(sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1024.0**2, 1)}
+
+            # Exact search over all articles and over the user's section
+            for name, filtered in [("all", False), ("section", True)]:
+                exact, latencies = [], []
+                for words_, label in queries:
+                    start = time.time()
+                    exact.append(index.exact(words_, k = args.k, labels = [label] if filtered else None))
+                    latencies.append(time.time() - start)
+                result[name] = {"exact": summarize(latencies), "approximate": []}
+
+                # Approximate search with more and more candidates, and with bounded buckets
+                for candidates, max_hits in SEARCHES:
+                    recalls, latencies = [], []
+                    for (words_, label), neighbors in zip(queries, exact):
+                        start = time.time()
+                        approximate = index.top_k(words_, k = args.k, labels = [label] if filtered else None, candidates = candidates, max_hits = max_hits)
+                        latencies.append(time.time() - start)
+                        recalls.append(recall(approximate, neighbors))
+                    result[name]["approximate"].append({"candidates": candidates, "max_hits": max_hits, "recall": round(float(np.mean(recalls)), 3), "latency": summarize(latencies)})
+            indexes.append(result)
+    finally:
+        shutil.rmtree(folder)
+
+    write_results({"benchmark": "archive", "environment": environment(), "settings": vars(args), "indexes": indexes, "memory": peak_memory()}, args.output)
+
+
+
+if __name__ == '__main__':
+    main()
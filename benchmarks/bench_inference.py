@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Checks that the fused inference engine predicts exactly like the pickled scikit-learn model and compares their latency
+"""
+
+# Imports
+import os
+import sys
+import random
+import timeit
+import pickle
+import warnings
+import numpy as np
+
+# The modules under test live in the src folder, the model artifacts in the data folder
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPO, "src"))
+from modelfile import ModelFile
+from inference import InferenceEngine
+
+
+
+def main():
+    """
+    Main function
+    """
+    # Both ways of predicting (the pickles were written with an older scikit-learn)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        model = pickle.load(open(os.path.join(REPO, "data", "log_regression_model.pkl")))
+        tfidf = pickle.load(open(os.path.join(REPO, "data", "tfidf_vectorizer.pkl")))
+    engine = InferenceEngine(ModelFile(os.path.join(REPO, "data", "model.bin")))
+
+    # Random tweets from the model's vocabulary mixed with unknown and repeated words, including empty ones
+    rng = random.Random(0)
+    terms = sorted(tfidf.vocabulary_)
+    tweets = [" ".join([rng.choice(terms) if rng.random() < 0.5 else rng.choice(["Trump", "lol", "RT", "amazing", "the"]) for j in range(rng.randint(0, 20))]) for i in range(20000)]
+
+    # Identical predictions and (up to rounding) identical probabilities
+    labels, scores = engine.predict(tweets)
+    assert (labels == model.predict(tfidf.transform(tweets))).all()
+    assert np.allclose(scores, model.decision_function(tfidf.transform(tweets)))
+    assert np.allclose(engine.predict_proba(scores), model.predict_proba(tfidf.transform(tweets)))
+    print "Identical predictions for {} tweets".format(len(tweets))
+
+    # Latency of one request with 100 tweets
+    request = tweets[:100]
+    runs = 50
+    sklearn = min(timeit.repeat(lambda: model.predict(tfidf.transform(request)), number = runs, repeat = 3)) / runs
+    fused = min(timeit.repeat(lambda: engine.predict(request), number = runs, repeat = 3)) / runs
+    print "100 tweets   scikit-learn: {:.2f} ms   inference engine: {:.2f} ms   speedup: {:.1f}x".format(sklearn * 1000, fused * 1000, sklearn / fused)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Measures the latency of the website's predictor per stage and end to end, and the throughput of batch recommendations,
+against the local stand-ins of the Twitter and Top Stories APIs (run e.g. python benchmarks/bench_predictor.py --output predictor.json)
+"""
+
+# Imports
+import os
+import sys
+import time
+import argparse
+import warnings
+
+# The website's predictor reads its keys from the environment, the stand-ins accept any
+for key in ["TW_CON_SECRET_KEY", "TW_CON_SECRET", "TW_TOKEN_KEY", "TW_TOKEN", "NYT_TOP_STORIES_KEY"]:
+    os.environ.setdefault(key, "benchmark")
+
+# The predictor under test lives in the website folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "website"))
+from predictor import Predictor
+from standins import StandIns, StandInServer
+from results import REPO, environment, summarize, peak_memory, write_results
+
+
+def stage_totals(predictor):
+    """
+    Reads the count and the summed duration of every stage from the predictor's metrics
+
+    predictor (Predictor): predictor
+    returns dictionary of stage -> (count, seconds)
+    """
+    with predictor.metrics.lock:
+        samples = dict(predictor.metrics.metrics.get("stage_duration_seconds", (None, None, {}))[2])
+        return dict((dict(key)["stage"], (sum(histogram.counts), histogram.sum)) for key, histogram in samples.items())
+
+
+def stage_means(before, after):
+    """
+    Mean duration of every stage between two readings of stage_totals
+
+    before (dictionary): earlier reading
+    after (dictionary): later reading
+    returns dictionary of stage -> dictionary with the count, the mean and the total in milliseconds
+    """
+    means = {}
+    for stage, (count, seconds) in after.items():
+        count, seconds = count - before.get(stage, (0, 0.0))[0], seconds - before.get(stage, (0, 0.0))[1]
+        if count > 0:
+            means[stage] = {"count": count, "mean_ms": round(seconds / count * 1000.0, 3), "total_ms": round(seconds * 1000.0, 3)}
+    return means
+
+
+def run_scenario(predictor, users, recommend, clear_sections = False):
+    """
+    Recommends to users one after the other and measures every request
+
+    predictor (Predictor): predictor
+    users (list of strings): twitter handles
+    recommend (function): recommends to one user
+    clear_sections (boolean): If true, the cached top stories are dropped before every request, so that every request fetches them
+    returns dictionary with the end-to-end latencies, the throughput and the stages
+    """
+    before = stage_totals(predictor)
+    latencies = []
+    start = time.time()
+    for user in users:
+        if clear_sections:
+            with predictor.topstories.lock:
+                predictor.topstories.entries.clear()
+        begin = time.time()
+        recommend(user)
+        latencies.append(time.time() - begin)
+    elapsed = time.time() - start
+    return {"end_to_end": summarize(latencies), "requests_per_second": round(len(users) / elapsed, 2), "stages": stage_means(before, stage_totals(predictor))}
+
+
+
+def main():
+    """
+    Main function
+    """
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--requests", type = int, default = 100, help = "requests per scenario")
+    parser.add_argument("--batch", type = int, default = 200, help = "users in the batch scenario")
+    parser.add_argument("--latency-twitter", type = float, default = 0.05, help = "seconds per timeline response")
+    parser.add_argument("--latency-topstories", type = float, default = 0.08, help = "seconds per Top Stories response")
+    parser.add_argument("--pickles", action = "store_true", help = "use the pickled scikit-learn model instead of the model file")
+    parser.add_argument("--output", help = "json file for the results, by default stdout")
+    args = parser.parse_args()
+
+    # Everything the predictor prints goes to stderr, stdout is kept for the results
+    stdout, sys.stdout = sys.stdout, sys.stderr
+
+    # Stand-ins and a predictor pointed at them
+    standins = StandIns(latency = {"twitter": args.latency_twitter, "topstories": args.latency_topstories})
+    server = StandInServer(standins)
+    start = time.time()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        predictor = Predictor(model_pickle = os.path.join(REPO, "website", "log_regression_model.pkl"), tfidf_pickle = os.path.join(REPO, "website", "tfidf_vectorizer.pkl"),
+            stopwords_pickle = os.path.join(REPO, "website", "stopwords.pkl"), model_file = None if args.pickles else os.path.join(REPO, "website", "model.bin"))
+    startup = time.time() - start
+    predictor.timeline.base_url = server.url + "1.1/"
+    predictor.topstories.base_url = server.url + "svc/topstories/v2/"
+
+    # New users with the sections not cached, the same users returning, and the multi-section recommendations of returning users
+    users = ["bench_{}".format(idx) for idx in range(args.requests)]
+    scenarios = {}
+    scenarios["cold"] = run_scenario(predictor, users, lambda user: predictor.recommend_user(user = user), clear_sections = True)
+    scenarios["warm"] = run_scenario(predictor, users, lambda user: predictor.recommend_user(user = user))
+    def multi_section(user):
+        tweets = predictor.fetch_tweets(user = user, number_of_tweets = 100)
+        predictor.recommend_sections(tweets = tweets, sections = predictor.predict_sections(tweets = tweets, number_of_sections = 3), number_of_articles = 3)
+    scenarios["multi_section_warm"] = run_scenario(predictor, users, multi_section)
+
+    # Returning users who posted some tweets since their last visit, only these are fetched, in one request per user
+    for user in users:
+        standins.post(user, 20)
+    twitter = standins.requests["twitter"]
+    scenarios["returning_new_tweets"] = run_scenario(predictor, users, lambda user: predictor.recommend_user(user = user))
+    scenarios["returning_new_tweets"]["twitter_requests_per_user"] = round((standins.requests["twitter"] - twitter) / float(len(users)), 2)
+
+    # Returning users with fewer tweets than are used, their whole timeline is known after the first visit so only the new tweets are fetched
+    quiet_users = ["quiet_{}".format(idx) for idx in range(args.requests)]
+    for user in quiet_users:
+        predictor.recommend_user(user = user)
+        standins.post(user, 5)
+    served = standins.served_tweets
+    scenarios["returning_quiet_users"] = run_scenario(predictor, quiet_users, lambda user: predictor.recommend_user(user = user))
+    scenarios["returning_quiet_users"]["tweets_fetched_per_user"] = round((standins.served_tweets - served) / float(len(quiet_users)), 2)
+
+    # Batch of new users with the sections not cached
+    with predictor.topstories.lock:
+        predictor.topstories.entries.clear()
+    before = stage_totals(predictor)
+    start = time.time()
+    recommendations = predictor.recommend_batch(users = ["batch_{}".format(idx) for idx in range(args.batch)])
+    elapsed = time.time() - start
+    scenarios["batch"] = {"users": args.batch, "seconds": round(elapsed, 3), "users_per_second": round(args.batch / elapsed, 2), "failed": sum(1 for result in recommendations.values() if not isinstance(result, tuple)),
+        "stages": stage_means(before, stage_totals(predictor))}
+
+    sys.stdout = stdout
+    server.shutdown()
+    write_results({"benchmark": "predictor", "environment": environment(), "settings": dict(vars(args), model = "pickles" if args.pickles else "model file"), "startup_seconds": round(startup, 3),
+        "scenarios": scenarios, "upstream_requests": standins.requests, "memory": peak_memory()}, args.output)
+
+
+
+if __name__ == '__main__':
+    main()
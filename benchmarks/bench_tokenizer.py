@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Micro-benchmark comparing the old character-by-character text cleaning with the shared tokenizer
+"""
+
+# Imports
+import os
+import sys
+import random
+import timeit
+
+# The modules under test live in the src folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from tokenizer import Tokenizer
+
+
+# Helper list of all single alphabetic letters, as used by the old cleaning code
+SINGLELETTERS = [chr(i) for i in range(97,123)] + [chr(i).upper() for i in range(97,123)]
+
+# A few stopwords similar to the pickled NLTK ones
+STOPWORDS = ["i", "me", "my", "we", "our", "you", "he", "she", "it", "they", "what", "which", "who", "this", "that", "is", "are", "was", "be", "have", "has", "had", "do", "a", "an", "the", "and", "but", "if", "or", "as", "of", "at", "by", "for", "with", "to", "from", "in", "out", "on", "off", "over", "under", "again", "then", "once", "here", "there", "all", "any", "both", "each", "few", "more", "most", "other", "some", "such", "no", "not", "only", "own", "same", "so", "than", "too", "very", "can", "will", "just", "should", "now"]
+
+
+def legacy_clean(text, removelist):
+    """
+    The cleaning as it was done before the shared tokenizer
+
+    text (string): raw text
+    removelist (list of strings): words to be removed in addition to single letters
+    returns cleaned string
+    """
+    wordlist = "".join( [char if char in SINGLELETTERS else " " for char in text] ).split()
+    return " ".join([word for word in wordlist if word not in SINGLELETTERS + removelist])
+
+
+def make_documents(number, words_per_document, seed):
+    """
+    Generates random tweet-like documents with punctuation, numbers, mentions and urls
+
+    number (int): number of documents
+    words_per_document (int): number of words per document
+    seed (int): random seed
+    returns list of strings
+    """
+    rng = random.Random(seed)
+    vocabulary = STOPWORDS + ["Senate", "election", "Obama", "market", "stocks", "game", "Yankees", "recipe", "science", "health", "fashion", "travel", "RT", "x", "New", "York"]
+    extras = ["@nytimes", "#news", "http://t.co/abc123", "2015", "it's", "...", "!", "&amp;", u"caf\xe9"]
+    documents = []
+    for i in range(number):
+        words = [rng.choice(vocabulary) if rng.random() < 0.8 else rng.choice(extras) for j in range(words_per_document)]
+        documents.append(u" ".join(words))
+    return documents
+
+
+
+def main():
+    """
+    Main function
+    """
+    # One request: 100 tweets plus 30 top stories
+    tweets = make_documents(number = 100, words_per_document = 18, seed = 1)
+    articles = make_documents(number = 30, words_per_document = 80, seed = 2)
+
+    tweet_tokenizer = Tokenizer(stopwords = ["RT"])
+    article_tokenizer = Tokenizer(stopwords = STOPWORDS)
+
+    # Make sure that both ways of cleaning give identical results
+    assert [legacy_clean(text, ["RT"]) for text in tweets] == tweet_tokenizer.clean_batch(tweets)
+    assert [legacy_clean(text, STOPWORDS) for text in articles] == article_tokenizer.clean_batch(articles)
+
+    # Time both implementations
+    runs = 20
+    cases = [("tweets", tweets, ["RT"], tweet_tokenizer), ("articles", articles, STOPWORDS, article_tokenizer)]
+    for name, documents, removelist, tokenizer in cases:
+        legacy = min(timeit.repeat(lambda: [legacy_clean(text, removelist) for text in documents], number = runs, repeat = 3)) / (runs * len(documents))
+        shared = min(timeit.repeat(lambda: tokenizer.clean_batch(documents), number = runs, repeat = 3)) / (runs * len(documents))
+        print "{:<9} legacy: {:>9.0f} docs/s   tokenizer: {:>9.0f} docs/s   speedup: {:.1f}x".format(name, 1.0 / legacy, 1.0 / shared, legacy / shared)
+
+
+
+if __name__ == '__main__':
+    main()
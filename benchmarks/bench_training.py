@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Measures wall time and peak memory of the training pipeline on a generated corpus: harvesting the corpus from the local
+stand-in of the Article Search API, cleaning it with the DataPolisher, and training with the Algorithm (in memory and streaming).
+Every stage runs in its own process in a temporary copy of the repository layout, so that its peak memory is its own
+(run e.g. python benchmarks/bench_training.py --pages 200 --output training.json)
+"""
+
+# Imports
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from standins import StandIns, StandInServer
+from results import REPO, environment, peak_memory, write_results
+
+# Stages in the order they run, each needs the output of the ones before
+STAGES = ["harvest", "polish", "fit", "stream"]
+
+
+def run_stage(stage, args, workdir):
+    """
+    Runs one stage (in this process, see main)
+
+    stage (string): name of the stage
+    args (Namespace): command line arguments
+    workdir (string): temporary repository folder, with the apikeyspath module
+    returns dictionary with the measurements
+    """
+    # The modules under test find the repository folder and the keys in the generated apikeyspath module
+    sys.path[:0] = [workdir, os.path.join(REPO, "src")]
+    timings = {}
+
+    if stage == "harvest":
+        import shards
+        from articles import Articles, ArticleStream
+        from harvester import Harvester, RateLimiter
+
+        # Every section from its own pages of the stand-in, without the quotas of the real API
+        AllArticles = Articles(harvester = Harvester(workers = 8, limiter = RateLimiter(per_second = 10**6, per_day = 10**9)), base_url = args.url + "svc/search/v2/articlesearch.json")
+        start = time.time()
+        for section in shards.SECTIONS:
+            stream = ArticleStream(filename = "Articles_" + section + "_start20150101_end20150827")
+            try:
+                AllArticles.fetch_articles(pages = args.pages, items = [section], sec_or_desk = True, begin_date = 20150101, end_date = 20150827, stream = stream)
+            finally:
+                stream.close()
+        timings["harvest"] = time.time() - start
+        result = {"pages": args.pages * len(shards.SECTIONS), "pages_per_second": round(args.pages * len(shards.SECTIONS) / timings["harvest"], 2)}
+
+    elif stage == "polish":
+        from datapreparation import DataPolisher
+
+        # Clean the shards and write the columnar training data, like datapreparation.py does
+        MyDataPolisher = DataPolisher()
+        start = time.time()
+        rows = MyDataPolisher.cleanshards(folder = "articles", filename = "clean_nyt_training_data")
+        timings["clean"] = time.time() - start
+        result = {"rows": rows}
+        if MyDataPolisher.duplicates is not None:
+            result.update(exact_duplicates = MyDataPolisher.duplicates["exact"], near_duplicates = MyDataPolisher.duplicates["near"])
+
+    elif stage == "fit":
+        from algorithm import Algorithm
+
+        # Vectorize the columnar training data and fit the Logistic Regression
+        MyAlgorithm = Algorithm()
+        start = time.time()
+        MyAlgorithm.loaddata(filename = "clean_nyt_training_data")
+        timings["load"] = time.time() - start
+        start = time.time()
+        MyAlgorithm.fitdata()
+        timings["fit"] = time.time() - start
+        result = {"rows": len(MyAlgorithm.data), "features": len(MyAlgorithm.tfidf.vocabulary_)}
+
+    elif stage == "stream":
+        from algorithm import Algorithm
+
+        # Out-of-core training on the harvested shards
+        MyAlgorithm = Algorithm()
+        start = time.time()
+        MyAlgorithm.fitstream(folder = "articles", chunksize = args.chunksize)
+        timings["fit"] = time.time() - start
+        result = {}
+
+    result["seconds"] = dict((name, round(seconds, 3)) for name, seconds in timings.items())
+    result["total_seconds"] = round(sum(timings.values()), 3)
+    result.update(peak_memory())
+    return result
+
+
+
+def main():
+    """
+    Main function
+    """
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--pages", type = int, default = 200, help = "Article Search pages (of 10 articles) per section")
+    parser.add_argument("--chunksize", type = int, default = 10000, help = "articles per chunk of the streaming training")
+    parser.add_argument("--latency-articlesearch", type = float, default = 0.01, help = "seconds per Article Search response")
+    parser.add_argument("--stages", default = ",".join(STAGES), help = "comma separated stages to run")
+    parser.add_argument("--output", help = "json file for the results, by default stdout")
+    parser.add_argument("--stage", help = argparse.SUPPRESS)
+    parser.add_argument("--workdir", help = argparse.SUPPRESS)
+    parser.add_argument("--url", help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # A single stage in a child process: everything it prints goes to stderr, its result to stdout
+    if args.stage is not None:
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        result = run_stage(args.stage, args, args.workdir)
+        sys.stdout = stdout
+        print json.dumps(result)
+        return
+
+    # Temporary repository folder with keys for the stand-ins, and the stand-in of the Article Search API
+    workdir = tempfile.mkdtemp(prefix = "rlyt-bench-")
+    with open(os.path.join(workdir, "apikeyspath.py"), "w") as f:
+        f.write('PATH_TO_REPO = "{}/"\nNYT_ARTICLE_SEARCH_KEY = "benchmark"\n'.format(workdir))
+    server = StandInServer(StandIns(latency = {"articlesearch": args.latency_articlesearch}))
+
+    # Run the stages one after the other, each in a fresh process
+    stages = {}
+    try:
+        for stage in [stage for stage in STAGES if stage in args.stages.split(",")]:
+            start = time.time()
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--stage", stage, "--workdir", workdir, "--url", server.url, "--pages", str(args.pages), "--chunksize", str(args.chunksize)])
+            stages[stage] = json.loads(output.strip().splitlines()[-1])
+            stages[stage]["process_seconds"] = round(time.time() - start, 3)
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir)
+
+    write_results({"benchmark": "training", "environment": environment(), "settings": dict((name, value) for name, value in vars(args).items() if name not in ["stage", "workdir", "url"]), "stages": stages}, args.output)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Measures how much memory every additional web worker costs, with the predictor loaded once before forking (like gunicorn
+does with preload_app, see website/gunicorn_config.py) and loaded by every worker itself. The workers are forked from this
+process, score tweets, and report their private memory (the pages only they use) and their proportional share of the
+shared ones from /proc/self/smaps_rollup after loading and after scoring, so this runs on Linux only (run e.g. python benchmarks/bench_workers.py --workers 4)
+"""
+
+# Imports
+import os
+import gc
+import sys
+import json
+import gzip
+import argparse
+import warnings
+
+# The website's predictor reads its keys from the environment, no API is called here
+for key in ["TW_CON_SECRET_KEY", "TW_CON_SECRET", "TW_TOKEN_KEY", "TW_TOKEN", "NYT_TOP_STORIES_KEY"]:
+    os.environ.setdefault(key, "benchmark")
+
+# The predictor under test lives in the website folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "website"))
+from predictor import Predictor
+from results import REPO, environment, write_results
+
+
+def make_predictor(pickles):
+    """
+    Loads the website's predictor
+
+    pickles (boolean): If true, use the pickled scikit-learn model instead of the model file
+    returns Predictor
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return Predictor(model_pickle = os.path.join(REPO, "website", "log_regression_model.pkl"), tfidf_pickle = os.path.join(REPO, "website", "tfidf_vectorizer.pkl"),
+            stopwords_pickle = os.path.join(REPO, "website", "stopwords.pkl"), model_file = None if pickles else os.path.join(REPO, "website", "model.bin"))
+
+
+def memory():
+    """
+    Memory of this process
+
+    returns dictionary with the resident, proportional and private memory in megabytes
+    """
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024.0
+    return {"rss_mb": fields["Rss"], "pss_mb": fields["Pss"], "private_mb": fields["Private_Clean"] + fields["Private_Dirty"]}
+
+
+def run_workers(number_of_workers, mode, tweets, pickles):
+    """
+    Forks workers that score tweets and waits until all of them have measured their memory, so that the pages they share
+    are still shared when they measure
+
+    number_of_workers (int): number of workers
+    mode (string): "preload" to load the predictor before forking, "per_worker" to load it in every worker, "empty" for workers without predictor
+    tweets (list of lists of strings): tweets of each request to score
+    pickles (boolean): If true, use the pickled scikit-learn model instead of the model file
+    returns list of dictionaries, one per worker, with the memory after loading and after scoring
+    """
+    predictor = make_predictor(pickles) if mode == "preload" else None
+    gc.collect()
+
+    # One pipe for the measurements, and one that the workers wait on until all have measured
+    results_read, results_write = os.pipe()
+    release_read, release_write = os.pipe()
+    pids = []
+    for worker in range(number_of_workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(results_read)
+                os.close(release_write)
+                own = predictor if predictor is not None or mode == "empty" else make_predictor(pickles)
+                loaded = memory()
+                if own is not None:
+                    for request in tweets:
+                        own.predict_tweets(request)
+                os.write(results_write, json.dumps({"loaded": loaded, "scored": memory()}) + "\n")
+                os.read(release_read, 1)
+            finally:
+                os._exit(0)
+        pids.append(pid)
+
+    # Collect the measurements, then let the workers exit
+    os.close(results_write)
+    os.close(release_read)
+    with os.fdopen(results_read) as f:
+        measurements = [json.loads(f.readline()) for pid in pids]
+    os.close(release_write)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    del predictor
+    gc.collect()
+    return measurements
+
+
+
+def main():
+    """
+    Main function
+    """
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--workers", type = int, default = 4, help = "workers per scenario")
+    parser.add_argument("--pickles", action = "store_true", help = "use the pickled scikit-learn model instead of the model file")
+    parser.add_argument("--output", help = "json file for the results, by default stdout")
+    args = parser.parse_args()
+
+    # Requests of 100 tweets of every fixture user
+    with gzip.open(os.path.join(REPO, "benchmarks", "fixtures", "timelines.json.gz")) as f:
+        timelines = json.load(f)
+    tweets = [[status["text"] for status in timelines[user][:100]] for user in sorted(timelines)]
+
+    # Workers without predictor are the baseline, the private memory above it after loading is what the predictor costs
+    # every worker, and after scoring also the memory the requests needed
+    scenarios = {}
+    for mode in ["empty", "preload", "per_worker"]:
+        measurements = run_workers(args.workers, mode, tweets, args.pickles)
+        scenarios[mode] = dict((stage, dict((name, round(sum(measurement[stage][name] for measurement in measurements) / len(measurements), 2)) for name in ["rss_mb", "pss_mb", "private_mb"])) for stage in ["loaded", "scored"])
+    for mode in ["preload", "per_worker"]:
+        for stage in ["loaded", "scored"]:
+            scenarios[mode][stage]["private_above_empty_mb"] = round(scenarios[mode][stage]["private_mb"] - scenarios["empty"]["loaded"]["private_mb"], 2)
+
+    write_results({"benchmark": "workers", "environment": environment(), "settings": dict(vars(args), model = "pickles" if args.pickles else "model file"), "scenarios": scenarios}, args.output)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Writes the synthetic fixtures of the benchmark suite into benchmarks/fixtures: the characteristic words of every section
+(taken from the coefficients of data/model.bin), user timelines and Top Stories responses built from them.
+The fixtures are committed, run this only to regenerate them
+"""
+
+# Imports
+import os
+import sys
+import gzip
+import json
+import random
+import numpy as np
+
+# The modules under test live in the src folder, the model artifacts in the data folder
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPO, "src"))
+from modelfile import ModelFile
+
+# Sections as used by the Top Stories API, in the order of the labels
+SECTIONS_NYT = ["arts", "business", "dining", "health", "nyregion", "politics", "realestate", "science", "sports", "fashion", "technology", "travel", "national", "world"]
+
+# Noise in tweets that the cleaning has to remove
+NOISE = ["RT", "@nytimes", "http://t.co/x7Yz2", "#news", "&amp;", "lol", "1st", "2015", "a", "I"]
+
+
+def section_words(filename, number_of_words = 200):
+    """
+    Characteristic words of every section, i.e. the terms with the largest coefficients, and filler words with small coefficients
+
+    filename (string): model file
+    number_of_words (int): number of words per section
+    returns dictionary of section -> list of words, with the filler words under "filler"
+    """
+    modelfile = ModelFile(filename)
+    terms = modelfile.terms()
+    coef = np.asarray(modelfile.arrays["coef"])
+    words = dict((modelfile.label_names[label], [terms[idx] for idx in np.argsort(-coef[label], kind = "mergesort")[:number_of_words]]) for label in range(coef.shape[0]))
+    words["filler"] = [terms[idx] for idx in np.argsort(np.abs(coef).max(axis = 0), kind = "mergesort")[:number_of_words]]
+    return words
+
+
+def make_text(rng, words, section, length, noise = 0.0):
+    """
+    Draws a text that is mostly about one section
+
+    rng (Random): random number generator
+    words (dictionary): words per section as returned by section_words
+    section (string): main section
+    length (int): number of words
+    noise (float): probability of a noise token instead of a word
+    returns string
+    """
+    tokens = []
+    for idx in range(length):
+        draw = rng.random()
+        if draw < noise:
+            tokens.append(rng.choice(NOISE))
+        elif draw < 0.6:
+            tokens.append(rng.choice(words[section]))
+        else:
+            tokens.append(rng.choice(words["filler"]))
+    return " ".join(tokens)
+
+
+def make_timelines(rng, words, number_of_users = 28, number_of_tweets = 200):
+    """
+    Timelines of users who mostly tweet about one section and sometimes about a second one
+
+    rng (Random): random number generator
+    words (dictionary): words per section as returned by section_words
+    number_of_users (int): number of users
+    number_of_tweets (int): tweets per user
+    returns dictionary of screen name -> list of statuses (id and text), newest first
+    """
+    sections = sorted(section for section in words if section != "filler")
+    timelines = {}
+    for user in range(number_of_users):
+        main, second = sections[user % len(sections)], rng.choice(sections)
+        statuses = []
+        for idx in range(number_of_tweets):
+            text = make_text(rng, words, main if rng.random() < 0.7 else second, rng.randint(4, 18), noise = 0.15)
+            statuses.append({"id": 600000000000000000 + user * 10000 + number_of_tweets - idx, "text": text})
+        timelines["bench_user_{}".format(user)] = statuses
+    return timelines
+
+
+def make_topstories(rng, words, number_of_articles = 30):
+    """
+    Top Stories responses of all sections
+
+    rng (Random): random number generator
+    words (dictionary): words per section as returned by section_words
+    number_of_articles (int): articles per section
+    returns dictionary of section (as used by the Top Stories API) -> response
+    """
+    sections = sorted(section for section in words if section != "filler")
+    responses = {}
+    for section, section_nyt in zip(sections, SECTIONS_NYT):
+        results = []
+        for idx in range(number_of_articles):
+            results.append({"section": section, "subsection": "", "title": make_text(rng, words, section, rng.randint(5, 10)).title(), "abstract": make_text(rng, words, section, rng.randint(15, 30)) + ".",
+                "url": "http://www.nytimes.com/2015/09/01/{}/{}.html".format(section_nyt, idx), "des_facet": [make_text(rng, words, section, 2).title() for facet in range(rng.randint(0, 3))],
+                "org_facet": [make_text(rng, words, section, 2).title() for facet in range(rng.randint(0, 2))], "per_facet": [make_text(rng, words, "filler", 2).title() for facet in range(rng.randint(0, 2))]})
+        responses[section_nyt] = {"status": "OK", "section": section_nyt, "num_results": len(results), "results": results}
+    return responses
+
+
+def write_fixture(data, filename):
+    """
+    Writes a fixture as gzipped json
+
+    data (dictionary): fixture
+    filename (string): filename in the fixtures folder
+    returns nothing
+    """
+    with gzip.open(os.path.join(REPO, "benchmarks", "fixtures", filename), "wb") as f:
+        f.write(json.dumps(data, sort_keys = True))
+
+
+
+def main():
+    """
+    Main function
+    """
+    rng = random.Random(0)
+    words = section_words(os.path.join(REPO, "data", "model.bin"))
+    if not os.path.isdir(os.path.join(REPO, "benchmarks", "fixtures")):
+        os.makedirs(os.path.join(REPO, "benchmarks", "fixtures"))
+    write_fixture(words, "sections.json.gz")
+    write_fixture(make_timelines(rng, words), "timelines.json.gz")
+    write_fixture(make_topstories(rng, words), "topstories.json.gz")
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Helpers to summarize measurements and write the results of the benchmark suite as json, so that runs on different commits can be compared
+"""
+
+# Imports
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import subprocess
+import numpy as np
+
+# Root of the repository
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def environment():
+    """
+    Describes the run: commit, time, python and platform
+
+    returns dictionary
+    """
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd = REPO, stderr = open(os.devnull, "w")).strip()
+    except Exception:
+        commit = None
+    return {"commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "platform": platform.platform(), "cpus": os.sysconf("SC_NPROCESSORS_ONLN")}
+
+
+def summarize(seconds):
+    """
+    Summarizes latencies
+
+    seconds (list of floats): measured latencies in seconds
+    returns dictionary with the count, the mean and the 50th, 95th and 99th percentile and the maximum in milliseconds
+    """
+    if not seconds:
+        return {"count": 0}
+    milliseconds = np.asarray(seconds) * 1000.0
+    return {"count": len(seconds), "mean_ms": round(float(milliseconds.mean()), 3), "p50_ms": round(float(np.percentile(milliseconds, 50)), 3), "p95_ms": round(float(np.percentile(milliseconds, 95)), 3),
+        "p99_ms": round(float(np.percentile(milliseconds, 99)), 3), "max_ms": round(float(milliseconds.max()), 3)}
+
+
+def peak_memory():
+    """
+    Peak resident memory of this process and of its finished child processes (e.g. of a multiprocessing pool)
+
+    returns dictionary with both in megabytes
+    """
+    return {"peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1), "peak_rss_children_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0, 1)}
+
+
+def write_results(results, output = None):
+    """
+    Writes results as json to a file, or to stdout
+
+    results (dictionary): results
+    output (string): filename, by default stdout
+    returns nothing
+    """
+    data = json.dumps(results, indent = 2, sort_keys = True)
+    if output is None:
+        sys.stdout.write(data + "\n")
+    else:
+        with open(output, "w") as f:
+            f.write(data + "\n")
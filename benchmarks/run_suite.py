@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Runs the benchmarks of the predictor and of the training pipeline against the local stand-ins, and those of the archive index and of the memory per web worker, and writes all results
+into one json file, e.g. python benchmarks/run_suite.py --output results-$(git rev-parse --short HEAD).json
+"""
+
+# Imports
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+from results import environment, write_results
+
+# Folder of the benchmarks
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+
+
+
+def main():
+    """
+    Main function
+    """
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--quick", action = "store_true", help = "fewer requests and a smaller corpus, for a fast check")
+    parser.add_argument("--output", help = "json file for the results, by default stdout")
+    args = parser.parse_args()
+
+    # Both benchmarks write json to stdout, their progress goes to stderr
+    commands = {"predictor": ["bench_predictor.py"] + (["--requests", "20", "--batch", "50"] if args.quick else []),
+        "training": ["bench_training.py"] + (["--pages", "40"] if args.quick else []),
+        "archive": ["bench_archive.py"] + (["--articles", "20000"] if args.quick else []),
+        "workers": ["bench_workers.py"] + (["--workers", "2"] if args.quick else [])}
+    results = {"environment": environment(), "quick": args.quick}
+    for name, command in sorted(commands.items()):
+        print >> sys.stderr, "Running the {} benchmark...".format(name)
+        results[name] = json.loads(subprocess.check_output([sys.executable, os.path.join(BENCHMARKS, command[0])] + command[1:]))
+
+    write_results(results, args.output)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Local stand-ins of the Twitter timeline, NYT Top Stories and NYT Article Search APIs, served from the fixtures in
+benchmarks/fixtures with a configurable latency, so that the predictor and the data pipeline run without keys or network
+"""
+
+# Imports
+import os
+import re
+import gzip
+import json
+import time
+import random
+import urllib
+import urlparse
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+# Folder of the fixtures
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture(filename):
+    """
+    Loads a gzipped json fixture
+
+    filename (string): filename in the fixtures folder
+    returns dictionary
+    """
+    with gzip.open(os.path.join(FIXTURES, filename), "rb") as f:
+        return json.loads(f.read())
+
+
+
+class StandIns(object):
+    """
+    Class that holds the fixtures and the state of the stand-ins (latencies, rate limit, counters)
+
+    latency (dictionary): seconds every response of "twitter", "topstories" and "articlesearch" is delayed
+    rate_limit (int): timeline requests per fifteen minute window, as reported in the rate limit headers
+    """
+
+    def __init__(self, latency = None, rate_limit = 900):
+        self.latency = dict({"twitter": 0.0, "topstories": 0.0, "articlesearch": 0.0}, **(latency or {}))
+        self.words = load_fixture("sections.json.gz")
+        self.timelines = load_fixture("timelines.json.gz")
+        self.topstories = load_fixture("topstories.json.gz")
+        self.users = sorted(self.timelines)
+
+        # Rate limit of the timeline endpoint and the number of requests per API
+        self.lock = threading.Lock()
+        self.rate_limit = rate_limit
+        self.remaining = rate_limit
+        self.reset = time.time() + 900
+        self.requests = {"twitter": 0, "topstories": 0, "articlesearch": 0}
+        self.served_tweets = 0
+
+        # Number of tweets every user posted after the fixture, newer than all fixture tweets
+        self.posted = {}
+
+
+    def timeline(self, screen_name):
+        """
+        Timeline of a user. Any screen name works, unknown ones get the timeline of a fixture user (with own tweet ids),
+        after the tweets the user posted since (see post). Users whose name starts with "quiet_" only have the latest 30 tweets
+
+        screen_name (string): twitter handle
+        returns list of statuses, newest first
+        """
+        if screen_name in self.timelines:
+            statuses = self.timelines[screen_name]
+        else:
+            number = int(re.sub(r"\D", "", screen_name) or 0)
+            statuses = [{"id": status["id"] + number * 10**6, "text": status["text"]} for status in self.timelines[self.users[number % len(self.users)]]]
+            if screen_name.startswith("quiet_"):
+                statuses = statuses[:30]
+        with self.lock:
+            posted = self.posted.get(screen_name, 0)
+        return [{"id": statuses[0]["id"] + idx, "text": statuses[idx % len(statuses)]["text"]} for idx in range(posted, 0, -1)] + statuses
+
+
+    def post(self, screen_name, number_of_tweets):
+        """
+        Lets a user post new tweets, e.g. between two visits
+
+        screen_name (string): twitter handle
+        number_of_tweets (int): number of new tweets
+        returns nothing
+        """
+        with self.lock:
+            self.posted[screen_name] = self.posted.get(screen_name, 0) + number_of_tweets
+
+
+    def article(self, section, page, idx):
+        """
+        Article of the Article Search API, drawn from the words of the section (the same for the same section, page and index)
+
+        section (string): section as used by the training data, e.g. "Politics"
+        page (int): page number
+        idx (int): index on the page
+        returns article as dictionary
+        """
+        words = self.words[section] if section in self.words else self.words["filler"]
+        rng = random.Random("{}-{}-{}".format(section, page, idx))
+        draw = lambda length: " ".join([rng.choice(words) if rng.random() < 0.6 else rng.choice(self.words["filler"]) for position in range(length)])
+        return {"_id": "{}{:06d}{}".format(section, page, idx), "web_url": "http://www.nytimes.com/{}/{}/{}.html".format(section.lower(), page, idx), "pub_date": "2015-01-01T00:00:00Z",
+            "document_type": "blogpost" if rng.random() < 0.1 else "article", "news_desk": section, "type_of_material": "News", "abstract": None,
+            "headline": {"main": draw(8).title()}, "keywords": [{"name": "subject", "value": draw(2).title()} for keyword in range(rng.randint(1, 5))],
+            "snippet": draw(25) + "...", "lead_paragraph": draw(40) + "."}
+
+
+    def articlesearch_page(self, section, page):
+        """
+        Page of the Article Search API (the same for the same section and page). About one in twenty articles republishes an
+        article of an earlier page, of the same or another section, with one word of the lead paragraph changed, so that the
+        deduplication has near-duplicates to find
+
+        section (string): section as used by the training data, e.g. "Politics"
+        page (int): page number
+        returns response as dictionary
+        """
+        rng = random.Random("{}-{}".format(section, page))
+        docs = []
+        for idx in range(10):
+            doc = self.article(section, page, idx)
+            if page > 0 and rng.random() < 0.05:
+                original = self.article(rng.choice([section, rng.choice([name for name in sorted(self.words) if name != "filler"])]), rng.randrange(page), rng.randrange(10))
+                lead = original["lead_paragraph"].split()
+                lead[rng.randrange(len(lead) - 1)] = rng.choice(self.words["filler"])
+                doc = dict(original, _id = doc["_id"], web_url = doc["web_url"], news_desk = section, lead_paragraph = " ".join(lead))
+            docs.append(doc)
+        return {"status": "OK", "response": {"meta": {"hits": 10**5, "offset": page * 10}, "docs": docs}}
+
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Request handler that answers like the three APIs
+    """
+
+    def log_message(self, *args):
+        pass
+
+
+    def respond(self, api, body, status = 200, headers = None):
+        """
+        Sends a json response after the latency of the API
+
+        api (string): "twitter", "topstories" or "articlesearch"
+        body (dictionary or list): response
+        status (int): status code
+        headers (dictionary): additional headers
+        returns nothing
+        """
+        time.sleep(self.server.standins.latency[api])
+        data = json.dumps(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    def do_GET(self):
+        standins = self.server.standins
+        url = urlparse.urlparse(self.path)
+        query = dict(urlparse.parse_qsl(url.query))
+
+        # Twitter timeline with since_id, max_id, count and the rate limit headers
+        if url.path.endswith("/statuses/user_timeline.json"):
+            with standins.lock:
+                standins.requests["twitter"] += 1
+                if time.time() > standins.reset:
+                    standins.remaining, standins.reset = standins.rate_limit, time.time() + 900
+                standins.remaining = max(standins.remaining - 1, -1)
+                headers = {"x-rate-limit-limit": str(standins.rate_limit), "x-rate-limit-remaining": str(max(standins.remaining, 0)), "x-rate-limit-reset": str(int(standins.reset))}
+                limited = standins.remaining < 0
+            if limited:
+                return self.respond("twitter", {"errors": [{"code": 88, "message": "Rate limit exceeded"}]}, status = 429, headers = headers)
+            statuses = standins.timeline(query.get("screen_name", ""))
+            if "max_id" in query:
+                statuses = [status for status in statuses if status["id"] <= int(query["max_id"])]
+            if "since_id" in query:
+                statuses = [status for status in statuses if status["id"] > int(query["since_id"])]
+            statuses = statuses[:min(int(query.get("count", 20)), 200)]
+            with standins.lock:
+                standins.served_tweets += len(statuses)
+            return self.respond("twitter", statuses, headers = headers)
+
+        # Top Stories of a section
+        match = re.match(r".*/topstories/v2/(\w+)\.json$", url.path)
+        if match:
+            with standins.lock:
+                standins.requests["topstories"] += 1
+            if match.group(1) not in standins.topstories:
+                return self.respond("topstories", {"status": "ERROR"}, status = 404)
+            return self.respond("topstories", standins.topstories[match.group(1)])
+
+        # Article Search, the section is the first item of the filter query
+        if url.path.endswith("/articlesearch.json"):
+            with standins.lock:
+                standins.requests["articlesearch"] += 1
+            items = re.findall(r'"([^"]+)"', urllib.unquote_plus(query.get("fq", "")))
+            return self.respond("articlesearch", standins.articlesearch_page(items[0] if items else "", int(query.get("page", 0))))
+
+        self.respond("twitter", {"errors": [{"message": "Not found"}]}, status = 404)
+
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded server of the stand-ins on a free local port, running in a background thread
+
+    standins (StandIns): fixtures and state
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, standins):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), Handler)
+        self.standins = standins
+        self.url = "http://127.0.0.1:{}/".format(self.server_address[1])
+        thread = threading.Thread(target = self.serve_forever)
+        thread.daemon = True
+        thread.start()
@@ -7,37 +7,146 @@ September 2015
 """
 
 # Imports
+import os
+import sys
+import json
 import pickle
+import time
+import resource
+import tempfile
+import itertools
+import multiprocessing
+import numpy as np
 import pandas as pd
-from sklearn.linear_model import LogisticRegression
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
 from nltk.corpus import stopwords
 
 # Get path to repository (requires a module named "apikeyspath.py" with path to repo)
 from apikeyspath import PATH_TO_REPO
 
+# Reading the article shards chunk by chunk and the columnar training data, exporting the model
+import shards
+from columnar import ColumnarDataset
+from modelfile import export_model, ModelFile
+from inference import InferenceEngine
+from matrixcache import MatrixCache
+
+# Default settings of the text vectorizer
+TFIDF_SETTINGS = {"stop_words": "english", "ngram_range": (1,1), "max_features": 10000, "min_df": 50, "max_df": .25, "analyzer": "word"}
+
+# Default grids of the hyperparameter search (see Algorithm.search)
+TFIDF_GRID = {"max_features": [5000, 10000, 20000], "min_df": [50], "max_df": [.25], "ngram_range": [(1,1), (1,2)]}
+MODEL_GRID = {"C": [0.1, 1.0, 10.0]}
+
+# Data of a running search. Set before the process pools start, so that their forked workers share it instead of receiving copies
+SEARCH = {}
+
+
+def expand_grid(grid):
+    """
+    Lists all combinations of a grid of settings
+
+    grid (dictionary): name -> list of values
+    returns list of dictionaries of name -> value
+    """
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+
+
+def vectorize_task(task):
+    """
+    Fits a vectorizer of the search on the training texts and vectorizes the training and test texts (runs in a worker process)
+
+    task (tuple): (vectorizer settings, dtype)
+    returns tuple of (fitted vectorizer, training matrix, test matrix, seconds)
+    """
+    settings, dtype = task
+    start = time.time()
+    tfidf = TfidfVectorizer(dtype = dtype, **dict(TFIDF_SETTINGS, **settings))
+    X_train = tfidf.fit_transform(SEARCH["train_texts"])
+    X_test = tfidf.transform(SEARCH["test_texts"])
+
+    # The stop words found in the data are only kept for inspection and can be large
+    tfidf.stop_words_ = None
+    return tfidf, X_train, X_test, time.time() - start
+
+
+def evaluate_task(task):
+    """
+    Fits and evaluates one classifier of the search on an already vectorized matrix (runs in a worker process)
+
+    task (tuple): (index of the vectorizer, classifier settings, solver)
+    returns dictionary with the accuracy, the fit time, the model size and the inference latency
+    """
+    idx, settings, solver = task
+    tfidf, X_train, X_test, vectorize_seconds = SEARCH["vectorized"][idx]
+
+    # Fit and score
+    model = LogisticRegression(solver = solver, **settings)
+    start = time.time()
+    model.fit(X_train, SEARCH["train_labels"])
+    fit_seconds = time.time() - start
+    accuracy = (model.predict(X_test) == SEARCH["test_labels"]).mean()
+
+    # Size of the model file and latency of one request of 100 texts with the inference engine that serves it (see inference.py),
+    # tokenizing included
+    handle, filename = tempfile.mkstemp(suffix = ".bin")
+    os.close(handle)
+    try:
+        export_model(model, tfidf, filename)
+        size = os.path.getsize(filename)
+        engine = InferenceEngine(ModelFile(filename, mmap = False))
+    finally:
+        os.remove(filename)
+    request = SEARCH["test_texts"][:100]
+    latencies = []
+    for repeat in range(10):
+        start = time.time()
+        engine.predict(request)
+        latencies.append(time.time() - start)
+
+    return {"vectorizer": SEARCH["vectorizer_settings"][idx], "classifier": settings, "accuracy": float(accuracy), "vectorize_seconds": vectorize_seconds, "fit_seconds": fit_seconds,
+        "features": len(tfidf.vocabulary_), "model_mb": size / 1024.0**2, "latency_ms": min(latencies) * 1000.0}
+
+
 
 class Algorithm(object):
     """
     This algorithm class has methods for training the algorithm which classifies the New York Times articles into their sections
+
+    solver (string): Solver of the Logistic Regression. The default liblinear works directly on the sparse tfidf matrix
+    dtype (numpy type): Dtype of the tfidf matrix, np.float32 halves its memory
+    tfidf_settings (dictionary): Settings of the Tfidf vectorizer that replace the defaults (TFIDF_SETTINGS), e.g. {"max_features": 20000}
+    model_settings (dictionary): Settings of the Logistic Regression, e.g. {"C": 10.0}
+    matrix_cache (MatrixCache): If given, fitdata takes the vectorized data from this cache when the data and the vectorizer settings did not change
     """
-    def __init__(self):
+    def __init__(self, solver = "liblinear", dtype = np.float64, tfidf_settings = None, model_settings = None, matrix_cache = None):
         # Dataframe to keep the data
         self.data = pd.DataFrame()
+        self.solver = solver
+        self.dtype = dtype
+        self.matrix_cache = matrix_cache
 
         # Set the algorithm's model and its text vectorizer
-        self.model = LogisticRegression()
-        self.tfidf = TfidfVectorizer(stop_words = 'english', ngram_range=(1,1), max_features=10000, min_df=50, max_df=.25, analyzer='word')
+        self.model = LogisticRegression(solver = solver, **(model_settings or {}))
+        self.tfidf = TfidfVectorizer(dtype = dtype, **dict(TFIDF_SETTINGS, **(tfidf_settings or {})))
 
 
-    def loaddata(self, filename):
+    def loaddata(self, filename, start = 0, stop = None, seed = 0):
         """
         Loads the data
 
-        filename (string): filename of the pickled data
+        filename (string): filename of the pickled data, or folder name of a columnar dataset (see columnar.py)
+        start (int): first row to be loaded, only for columnar datasets
+        stop (int): row after the last one to be loaded, by default the end, only for columnar datasets
+        seed (int): seed to shuffle the rows of columnar datasets with (they are stored in the order of the shards), None keeps the stored order
         returns nothing
         """
-        self.data = pd.read_pickle(PATH_TO_REPO + "data/" + filename)
+        if os.path.isdir(PATH_TO_REPO + "data/" + filename):
+            self.data = ColumnarDataset(PATH_TO_REPO + "data/" + filename).to_frame(start, stop, seed = seed)
+        else:
+            self.data = pd.read_pickle(PATH_TO_REPO + "data/" + filename)
 
 
     def fitdata(self):
@@ -46,23 +155,123 @@ class Algorithm(object):
 
         returns nothing
         """
-        # Vectorize the data
+        # Vectorize the data, keep the matrix sparse. If the same data was vectorized with the same settings before, take the cached matrix
         print "Vectorizing the data..."
-        X, y = self.tfidf.fit_transform(self.data.allwords).todense(), self.data.label
-        print "Vectorization done\n"
+        start = time.time()
+        X, y = None, self.data.label
+        if self.matrix_cache is not None:
+            key = self.matrix_cache.key(self.data.allwords, self.tfidf.get_params())
+            X = self.matrix_cache.get(key, self.tfidf)
+            if X is not None:
+                print "Took the vectorized data from the cache"
+        if X is None:
+            X = self.tfidf.fit_transform(self.data.allwords)
+            if self.matrix_cache is not None:
+                self.matrix_cache.put(key, X, self.tfidf)
+        megabytes = (X.data.nbytes + X.indices.nbytes + X.indptr.nbytes) / 1024.0**2
+        print "Vectorization done: {} x {} sparse matrix, {} nonzeros ({:.1f} MB) in {:.1f} s\n".format(X.shape[0], X.shape[1], X.nnz, megabytes, time.time() - start)
 
         # Fit the model
         print "Fitting the model..."
+        start = time.time()
         self.model.fit(X, y)
-        print "Fitting done\n"
+        print "Fitting done in {:.1f} s, peak memory of the process {:.0f} MB\n".format(time.time() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0)
+
+
+    def fitstream(self, folder, chunksize = 10000, n_features = 2**20):
+        """
+        Trains a model directly on the article shards without loading all data at once. The text is vectorized with a stateless
+        hashing vectorizer and the linear classifier is updated chunk by chunk, so memory does not grow with the corpus size.
+        Replaces the algorithm's model and text vectorizer, both can be written with writemodel as usual
+
+        folder (string): folder in which to look for the datafiles
+        chunksize (int): number of articles per chunk
+        n_features (int): number of hashed features
+        returns nothing
+        """
+        # Stateless vectorizer (l2 normalized term frequencies) and a logistic regression trained by stochastic gradient descent.
+        # non_negative instead of alternate_sign, which needs scikit-learn 0.19, so that the website's scikit-learn 0.17.1 can use the pickle
+        # (newer versions warn that non_negative is deprecated, it was removed in 0.21)
+        self.tfidf = HashingVectorizer(stop_words = 'english', ngram_range=(1,1), n_features = n_features, non_negative = True, analyzer='word')
+        self.model = SGDClassifier(loss = "log", alpha = 1e-6)
+        classes = np.arange(len(shards.SECTIONS))
+
+        print "Fitting the model chunk by chunk..."
+        start = time.time()
+        seen, scored, correct = 0, 0, 0
+        for texts, labels in shards.iter_chunks(PATH_TO_REPO + folder, chunksize = chunksize):
+            X = self.tfidf.transform(texts)
+
+            # Progressive validation: score every chunk before the model learns from it
+            if seen > 0:
+                correct += (self.model.predict(X) == np.asarray(labels)).sum()
+                scored += len(labels)
+
+            self.model.partial_fit(X, labels, classes = classes)
+            seen += len(labels)
+            print "{} articles, progressive accuracy {:.3f}, peak memory of the process {:.0f} MB".format(seen, correct / float(max(scored, 1)), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0)
+        print "Fitting done in {:.1f} s\n".format(time.time() - start)
 
 
-    def writemodel(self, filename_model, filename_tfidf, filename_stopwords):
+    def search(self, tfidf_grid = TFIDF_GRID, model_grid = MODEL_GRID, test_size = 0.2, processes = None, seed = 0):
+        """
+        Evaluates a grid of vectorizer and classifier settings on a held out part of the data. Every vectorizer setting is
+        fitted and applied only once, and all classifier settings are then evaluated on its matrices; both steps run in a process pool
+
+        tfidf_grid (dictionary): settings of the Tfidf vectorizer -> list of values to be tried, the other settings are the defaults
+        model_grid (dictionary): settings of the Logistic Regression -> list of values to be tried
+        test_size (float): fraction of the data held out for the accuracy and the latency
+        processes (int): number of processes, by default one per cpu
+        seed (int): seed of the split
+        returns list of result dictionaries (settings, accuracy, fit time, model size, latency), most accurate first
+        """
+        # Shuffled split into training and test data
+        order = np.random.RandomState(seed).permutation(len(self.data))
+        cut = int(len(order) * (1.0 - test_size))
+        texts, labels = self.data.allwords.values, self.data.label.values
+        SEARCH.clear()
+        SEARCH.update({"train_texts": texts[order[:cut]], "test_texts": list(texts[order[cut:]]), "train_labels": labels[order[:cut]], "test_labels": labels[order[cut:]]})
+        SEARCH["vectorizer_settings"] = expand_grid(tfidf_grid)
+        classifier_settings = expand_grid(model_grid)
+        print "Searching {} vectorizer x {} classifier settings on {} training and {} test articles...".format(len(SEARCH["vectorizer_settings"]), len(classifier_settings), cut, len(order) - cut)
+
+        # Vectorize once per vectorizer setting
+        start = time.time()
+        pool = multiprocessing.Pool(processes = processes)
+        SEARCH["vectorized"] = pool.map(vectorize_task, [(settings, self.dtype) for settings in SEARCH["vectorizer_settings"]], chunksize = 1)
+        pool.close()
+        pool.join()
+        print "Vectorized in {:.1f} s".format(time.time() - start)
+
+        # Evaluate every classifier setting on every matrix, in a new pool whose workers inherit the matrices
+        start = time.time()
+        pool = multiprocessing.Pool(processes = processes)
+        results = pool.map(evaluate_task, [(idx, settings, self.solver) for idx in range(len(SEARCH["vectorizer_settings"])) for settings in classifier_settings], chunksize = 1)
+        pool.close()
+        pool.join()
+        SEARCH.clear()
+        print "Evaluated in {:.1f} s\n".format(time.time() - start)
+
+        # Mark the settings on the speed/accuracy frontier, i.e. for which no other setting is at least as accurate and as fast and better in one of both
+        for result in results:
+            result["frontier"] = not any(other["accuracy"] >= result["accuracy"] and other["latency_ms"] <= result["latency_ms"] and (other["accuracy"] > result["accuracy"] or other["latency_ms"] < result["latency_ms"]) for other in results)
+        results.sort(key = lambda result: (-result["accuracy"], result["latency_ms"]))
+
+        # Print the results
+        print "{:>8} {:>8} {:>9} {:>8} {:>10} {:>9}  {}".format("accuracy", "fit [s]", "size [MB]", "features", "100 [ms]", "frontier", "settings")
+        for result in results:
+            print "{:8.4f} {:8.1f} {:9.2f} {:8d} {:10.2f} {:>9}  {} {}".format(result["accuracy"], result["fit_seconds"], result["model_mb"], result["features"], result["latency_ms"], "*" if result["frontier"] else "", result["vectorizer"], result["classifier"])
+        print
+        return results
+
+
+    def writemodel(self, filename_model, filename_tfidf, filename_stopwords, filename_export = None):
         """
         Writes the model and the Tfidf vectorizer to pickle
 
         filename_model (string): filename of the pickled model
         filename_tfidf (string): filename of the pickled tfidf vectorizer
+        filename_export (string): If given, also export the model as compact, memory-mappable model file (see modelfile.py), which loads much faster
         returns nothing
         """
         with open(PATH_TO_REPO + "data/" + filename_model, 'w') as f:
@@ -74,16 +283,33 @@ class Algorithm(object):
         with open(PATH_TO_REPO + "data/" + filename_stopwords, 'w') as f:
             pickle.dump(stopwords.words('english'), f)
 
+        # Model file with only what the predictor needs
+        if filename_export is not None:
+            export_model(self.model, self.tfidf, PATH_TO_REPO + "data/" + filename_export, label_names = dict(enumerate(shards.SECTIONS)))
+
 
 
 def main():
     """
     Main function
     """
-    MyAlgorithm = Algorithm()
-    MyAlgorithm.loaddata(filename = "clean_nyt_training_data.pkl")
-    MyAlgorithm.fitdata()
-    MyAlgorithm.writemodel(filename_model = "log_regression_model.pkl", filename_tfidf = "tfidf_vectorizer.pkl", filename_stopwords = "stopwords.pkl")
+    MyAlgorithm = Algorithm(matrix_cache = MatrixCache(folder = PATH_TO_REPO + "cache/matrices"))
+
+    # Either train out-of-core on the article shards ("python algorithm.py stream"), search for good settings on the cleaned
+    # data ("python algorithm.py search"), or train on the cleaned data (the hashed features of the streaming mode have no vocabulary,
+    # so there is no model file for it)
+    if len(sys.argv) > 1 and sys.argv[1] == "search":
+        MyAlgorithm.loaddata(filename = "clean_nyt_training_data")
+        results = MyAlgorithm.search()
+        with open(PATH_TO_REPO + "data/search_results.json", "w") as f:
+            json.dump(results, f, indent = 2)
+    elif len(sys.argv) > 1 and sys.argv[1] == "stream":
+        MyAlgorithm.fitstream(folder = "articles")
+        MyAlgorithm.writemodel(filename_model = "log_regression_model.pkl", filename_tfidf = "tfidf_vectorizer.pkl", filename_stopwords = "stopwords.pkl")
+    else:
+        MyAlgorithm.loaddata(filename = "clean_nyt_training_data")
+        MyAlgorithm.fitdata()
+        MyAlgorithm.writemodel(filename_model = "log_regression_model.pkl", filename_tfidf = "tfidf_vectorizer.pkl", filename_stopwords = "stopwords.pkl", filename_export = "model.bin")
 
 
 
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Approximate nearest neighbor index over the word sets of the whole article archive, to recommend the articles with the
+smallest Jaccard distance to a user's tweets without comparing them with every article. MinHash signatures of the word
+sets are cut into bands, and only the articles that share at least one band with the user are candidates; the candidates
+that share the most bands are then ranked by their exact Jaccard distance
+(the same file is copied into the website folder, keep both versions identical)
+
+With bands of single signature values, a bucket holds all articles whose smallest hashed word is the user's, so the
+buckets grow linearly with the archive (about 0.4 hits per article over all 128 bands in the benchmark). By default a
+search therefore only uses the smallest buckets that hold at most MAX_HITS articles together, skipping the largest ones
+like stop words, and ranks at most 10000 candidates exactly: apart from the binary searches in the bands its time does
+not grow with the archive, but its recall falls as the archive grows. Recall of the top 10 in benchmarks/bench_archive.py
+was 0.996 with 20k articles, 0.97 with 100k and 0.89 with 200k (0.95 without the budget) at 13 to 16 ms per search,
+against 77 ms for the exact search over 100k articles. Pass max_hits = None for the linear search with a higher recall
+
+An index is a folder with raw binary arrays that are memory-mapped read-only:
+
+    meta.json       format version, sizes, dtypes and the settings of the MinHash signatures and bands
+    labels.bin      encoded section label of each article (int8)
+    sizes.bin       number of distinct words of each article (int32)
+    indptr.bin      start of each article's words in indices.bin (int64, one more entry than articles)
+    indices.bin     the words of each article as sorted term numbers (int32)
+    terms.bin       all words, sorted, as fixed-width byte strings
+    keys.bin        band hashes, sorted within each band (uint64, bands x articles)
+    ids.bin         article of each band hash (int32, bands x articles)
+    info_offsets.bin, info.bin   title, abstract and url of each article as json (int64 offsets and utf-8 blob)
+"""
+
+# Imports
+import os
+import json
+import array
+import numpy as np
+
+from minhash import MinHasher
+
+
+# Version of the on-disk layout, increase when it changes
+FORMAT_VERSION = 1
+
+# Default budget of articles in the buckets a search uses
+MAX_HITS = 40000
+
+
+def band_keys(signatures, multipliers):
+    """
+    Hashes the bands of MinHash signatures
+
+    signatures (numpy array): signatures, one row each
+    multipliers (numpy array): one multiplier per row of a band, the number of multipliers is the band size
+    returns numpy array of uint64 (signatures x bands)
+    """
+    rows = len(multipliers)
+    bands = signatures.reshape(len(signatures), signatures.shape[1] // rows, rows).astype(np.uint64)
+    return (bands * np.asarray(multipliers, dtype = np.uint64)).sum(axis = 2, dtype = np.uint64)
+
+
+def build_archive(items, folder, hasher = None, rows = 1):
+    """
+    Builds an archive index
+
+    items (iterable): tuples of (list of words, label, dictionary with "title", "abstract" and "url") for each article,
+        articles without words are skipped
+    folder (string): full path of the index folder
+    hasher (MinHasher): hasher for the signatures, by default MinHasher(num_perm = 128, shingle = 1), i.e. of the single words
+    rows (int): signature values per band, more rows give fewer but more similar candidates
+    returns number of indexed articles
+    """
+    hasher = hasher if hasher is not None else MinHasher(num_perm = 128, shingle = 1)
+    if hasher.num_perm % rows:
+        raise ValueError("The number of rows per band ({}) must divide the signature length ({})".format(rows, hasher.num_perm))
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    # Word sets with provisional term numbers, signatures and labels, in compact arrays instead of lists of python objects; the info goes straight to disc
+    vocabulary, labels, indices, indptr, signatures = {}, array.array("b"), array.array("i"), array.array("l", [0]), bytearray()
+    offsets = array.array("l", [0])
+    with open(os.path.join(folder, "info.bin"), "wb") as f:
+        for words, label, info in items:
+            wordset = sorted(set(word.encode("utf-8") if isinstance(word, unicode) else word for word in words))
+            if not wordset:
+                continue
+            indices.extend(vocabulary.setdefault(word, len(vocabulary)) for word in wordset)
+            indptr.append(len(indices))
+            signatures.extend(hasher.signature(wordset).tostring())
+            labels.append(label)
+            encoded = json.dumps({"title": info.get("title") or "", "abstract": info.get("abstract") or "", "url": info.get("url") or ""})
+            f.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+
+    # Renumber the terms in sorted order, so that words can be looked up by binary search, and sort each word set again
+    terms = sorted(vocabulary)
+    renumber = np.zeros(len(terms), dtype = np.int32)
+    renumber[[vocabulary[term] for term in terms]] = np.arange(len(terms), dtype = np.int32)
+    indices = renumber[np.frombuffer(indices, dtype = np.int32)] if indices else np.zeros(0, dtype = np.int32)
+    indptr = np.frombuffer(indptr, dtype = np.int64)
+    for start, stop in zip(indptr[:-1], indptr[1:]):
+        indices[start:stop].sort()
+
+    # Band hashes, and for each band the articles sorted by their hash
+    multipliers = np.random.RandomState(len(terms)).randint(1, 2**31, size = rows).tolist()
+    keys = band_keys(np.frombuffer(bytes(signatures), dtype = np.uint32).reshape(len(labels), hasher.num_perm), multipliers).T
+    order = np.argsort(keys, axis = 1, kind = "mergesort").astype(np.int32)
+    keys = keys[np.arange(len(keys))[:, np.newaxis], order]
+
+    # Write the arrays and the meta data, which marks the index as complete
+    width = max([len(term) for term in terms] or [1])
+    arrays = {"labels": np.frombuffer(labels, dtype = np.int8) if labels else np.zeros(0, dtype = np.int8), "sizes": np.diff(indptr).astype(np.int32), "indptr": indptr, "indices": indices,
+        "terms": np.array(terms, dtype = "S{}".format(width)), "keys": np.ascontiguousarray(keys), "ids": np.ascontiguousarray(order),
+        "info_offsets": np.frombuffer(offsets, dtype = np.int64)}
+    for name, column in arrays.items():
+        with open(os.path.join(folder, name + ".bin"), "wb") as f:
+            f.write(column.tostring())
+    dtypes = dict((name, column.dtype.str) for name, column in arrays.items())
+    dtypes["info"] = np.dtype(np.uint8).str
+    with open(os.path.join(folder, "meta.json"), "w") as f:
+        json.dump({"version": FORMAT_VERSION, "articles": len(labels), "terms": len(terms), "num_perm": hasher.num_perm, "shingle": hasher.shingle, "seed": hasher.seed,
+            "rows": rows, "multipliers": multipliers, "dtypes": dtypes}, f)
+    return len(labels)
+
+
+
+class ArchiveIndex(object):
+    """
+    Class that queries an archive index, the arrays are memory-mapped read-only so that processes on the same machine share them
+
+    folder (string): full path of the index folder
+    """
+
+    def __init__(self, folder):
+        with open(os.path.join(folder, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError("Unsupported archive index version {} in {}".format(self.meta["version"], folder))
+        self.hasher = MinHasher(num_perm = self.meta["num_perm"], shingle = self.meta["shingle"], seed = self.meta["seed"])
+        self.multipliers = np.asarray(self.meta["multipliers"], dtype = np.uint64)
+
+        # Map the arrays, the band tables as one row per band
+        self.arrays = {}
+        for name, dtype in self.meta["dtypes"].items():
+            filename = os.path.join(folder, name + ".bin")
+            self.arrays[name] = np.memmap(filename, dtype = np.dtype(str(dtype)), mode = "r") if os.path.getsize(filename) else np.zeros(0, dtype = np.dtype(str(dtype)))
+        bands = self.meta["num_perm"] // self.meta["rows"]
+        self.keys = self.arrays["keys"].reshape(bands, self.meta["articles"])
+        self.ids = self.arrays["ids"].reshape(bands, self.meta["articles"])
+        self.labels, self.sizes, self.indptr, self.indices = self.arrays["labels"], self.arrays["sizes"], self.arrays["indptr"], self.arrays["indices"]
+
+        # Number of articles per section, to search small sections exactly
+        self.counts = np.bincount(self.labels) if len(self.labels) else np.zeros(0, dtype = np.int64)
+
+
+    def __len__(self):
+        return self.meta["articles"]
+
+
+    def wordset(self, words):
+        """
+        Looks up a list of words
+
+        words (list of strings): the user's words
+        returns tuple of (sorted distinct words, numpy array with the term numbers of those that are in the archive)
+        """
+        wordset = sorted(set(word.encode("utf-8") if isinstance(word, unicode) else word for word in words))
+        terms = self.arrays["terms"]
+        if not len(terms) or not wordset:
+            return wordset, np.zeros(0, dtype = np.int32)
+        query = np.array(wordset, dtype = terms.dtype)
+        positions = np.minimum(np.searchsorted(terms, query), len(terms) - 1)
+        return wordset, positions[terms[positions] == query].astype(np.int32)
+
+
+    def distances(self, articles, wordset, columns):
+        """
+        Computes the exact Jaccard distances between a word set and some articles
+
+        articles (numpy array): article numbers
+        wordset (list of strings): the user's distinct words
+        columns (numpy array): term numbers of the user's words that are in the archive
+        returns numpy array with one distance per article
+        """
+        if not len(articles):
+            return np.zeros(0)
+
+        # Words of all the articles after each other (gathered without a loop over the articles), intersections by summing the marked words per article
+        starts, lengths = self.indptr[articles], self.sizes[articles].astype(np.int64)
+        ends = np.cumsum(lengths)
+        words = self.indices[np.arange(ends[-1]) + np.repeat(starts - ends + lengths, lengths)]
+        marked = np.zeros(self.meta["terms"], dtype = np.int32)
+        marked[columns] = 1
+        intersect = np.add.reduceat(marked[words], ends - lengths).astype(np.float64)
+
+        # Similarity is the intersect divided by the union, converted to a distance
+        union = self.sizes[articles] + len(wordset) - intersect
+        return 1.0 - intersect / union
+
+
+    def top_k(self, words, k = 10, labels = None, candidates = 10000, max_hits = MAX_HITS):
+        """
+        Finds approximately the articles with the smallest Jaccard distance to a list of words
+
+        words (list of strings): the user's words
+        k (int): number of articles to be returned
+        labels (iterable over ints): encoded labels of the sections to recommend from, by default all
+        candidates (int): number of candidates that are ranked exactly, those that share the most bands with the user (None ranks
+            all articles that share a band, more candidates give a higher recall but take longer, see benchmarks/bench_archive.py)
+        max_hits (int): Only the smallest buckets with at most this many articles together are used (but at least one), which
+            bounds the time of the search independently of the size of the archive, None uses all buckets (see the module docstring)
+        returns list of tuples of (article number, distance), closest first
+        """
+        # Sections with no more articles than candidates are searched exactly
+        if labels is not None and candidates is not None and sum(self.counts[label] for label in labels if label < len(self.counts)) <= candidates:
+            return self.exact(words, k = k, labels = labels)
+        wordset, columns = self.wordset(words)
+        if not wordset or not len(self):
+            return []
+
+        # The user's bucket in every band, with a budget only the smallest buckets that fit into it
+        keys = band_keys(self.hasher.signature(wordset)[np.newaxis], self.multipliers)[0]
+        bounds = np.array([(np.searchsorted(self.keys[band], key, side = "left"), np.searchsorted(self.keys[band], key, side = "right")) for band, key in enumerate(keys)])
+        bands = np.arange(len(keys))
+        if max_hits is not None:
+            sizes = bounds[:, 1] - bounds[:, 0]
+            bands = np.argsort(sizes, kind = "mergesort")
+            bands = bands[:max(1, np.searchsorted(np.cumsum(sizes[bands]), max_hits, side = "right"))]
+
+        # The articles in these buckets
+        hits = np.concatenate([self.ids[band, bounds[band, 0]:bounds[band, 1]] for band in bands])
+        if labels is not None:
+            hits = hits[np.in1d(self.labels[hits], list(labels))]
+
+        # The candidates that share the most bands, i.e. have the largest estimated similarity, ranked exactly
+        articles, counts = np.unique(hits, return_counts = True)
+        if candidates is not None and len(articles) > candidates:
+            articles = np.sort(articles[np.argsort(-counts, kind = "mergesort")[:candidates]])
+        return self.rank(articles, wordset, columns, k)
+
+
+    def exact(self, words, k = 10, labels = None):
+        """
+        Finds the articles with the smallest Jaccard distance to a list of words by comparing with all of them
+
+        words (list of strings): the user's words
+        k (int): number of articles to be returned
+        labels (iterable over ints): encoded labels of the sections to recommend from, by default all
+        returns list of tuples of (article number, distance), closest first
+        """
+        wordset, columns = self.wordset(words)
+        if not wordset or not len(self):
+            return []
+        articles = np.arange(len(self)) if labels is None else np.flatnonzero(np.in1d(self.labels, list(labels)))
+        return self.rank(articles, wordset, columns, k)
+
+
+    def rank(self, articles, wordset, columns, k):
+        """
+        Ranks articles by their exact Jaccard distance, ties in the order of the articles
+
+        articles (numpy array): sorted article numbers
+        wordset (list of strings): the user's distinct words
+        columns (numpy array): term numbers of the user's words that are in the archive
+        k (int): number of articles to be returned
+        returns list of tuples of (article number, distance), closest first
+        """
+        distances = self.distances(articles, wordset, columns)
+        ranked = np.argsort(distances, kind = "mergesort")[:k]
+        return [(int(articles[idx]), float(distances[idx])) for idx in ranked]
+
+
+    def info(self, article):
+        """
+        Reads title, abstract and url of an article
+
+        article (int): article number
+        returns dictionary
+        """
+        offsets = self.arrays["info_offsets"]
+        return json.loads(self.arrays["info"][offsets[article]:offsets[article + 1]].tostring())
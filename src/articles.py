@@ -7,38 +7,135 @@ September 2015
 """
 
 # Imports
-import urllib2
 import httplib
 import json
+import gzip
 import sys
 import os
-import time
 
 # Get keys (requires a module named "apikeyspath.py" with your API key in the variable NYT_ARTICLE_SEARCH_KEY) and path to repository
 from apikeyspath import NYT_ARTICLE_SEARCH_KEY
 from apikeyspath import PATH_TO_REPO
 
+# Text cleaning and concurrent fetching
+from tokenizer import Tokenizer
+from harvester import Harvester, RateLimiter, QuotaExceeded
+from responsecache import ResponseCache, Checkpoint
+
+
+def make_folder(folder):
+    """
+    Makes a folder in the repository if it does not already exist
+
+    folder (string): name of the folder
+    returns full path of the folder
+    """
+    path = PATH_TO_REPO + folder
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return path
+
+
+
+class ArticleStream(object):
+    """
+    Class that writes articles as newline-delimited json to disc, page by page as they are fetched,
+    so that nothing needs to be kept in memory and a crash only loses the pages in flight
+
+    filename (string): filename without ending in the directory called "articles"
+    compress (boolean): If true, the file is gzip-compressed
+    """
+
+    def __init__(self, filename, compress = False):
+        self.filename = make_folder("articles") + "/" + filename + (".jsonl.gz" if compress else ".jsonl")
+        self.file = gzip.open(self.filename, "wb") if compress else open(self.filename, "w")
+
+
+    def write(self, articles):
+        """
+        Appends articles, one json document per line, and flushes them to disc
+
+        articles (list of dictionaries): cleaned articles
+        returns nothing
+        """
+        self.file.write("".join([json.dumps(article) + "\n" for article in articles]))
+        self.file.flush()
+
+
+    def close(self):
+        """
+        Closes the file
+
+        returns nothing
+        """
+        self.file.close()
+
+
 
 class Articles(object):
     """
     Class that holds functions to fetch and store NYT articles
+
+    harvester (Harvester): fetches the pages concurrently, by default 8 requests in flight and the Article Search API's quotas
+    base_url (string): url of the Article Search API
     """
 
-    def __init__(self):
+    def __init__(self, harvester = None, base_url = "https://api.nytimes.com/svc/search/v2/articlesearch.json"):
         # List of all articles
         self.all_articles = []
 
+        # Concurrent, rate-limited fetching and the API's url (can be pointed to a local server for testing)
+        self.harvester = harvester if harvester is not None else Harvester()
+        self.base_url = base_url
+        self.badcount = 0
+
+        # Tokenizer which removes all non alphabetic characters and individual letters
+        self.tokenizer = Tokenizer()
 
-    def fetch_articles(self, pages, items, sec_or_desk, begin_date, end_date):
+
+    def fetch_articles(self, pages, items, sec_or_desk, begin_date, end_date, stream = None):
         """
-        Fetches articles from NYT Article Search API
+        Fetches articles from NYT Article Search API. All pages are requested concurrently by the harvester, which respects the API's quotas
 
         pages (int): number of pages. Each page consists of 10 items
         items (list of strings): list of items used as keywords to fetch articles from
         sec_or_desk (boolean): If true, search in sections, otherwise in newsdesks
         begin_date (int): Begin date as YYYYMMDD
         end_date (int): End date as YYYYMMDD
-        returns nothing
+        stream (ArticleStream): If given, each page is written to the stream as soon as it is fetched instead of being kept in the list of all articles
+        returns number of pages that failed for good
+        """
+        # Counter for bad articles, which are not processed due to missing data
+        self.badcount = 0
+
+        # Prepare the urls for all pages
+        urls = [self.request_url(page, items, sec_or_desk, begin_date, end_date) for page in range(pages)]
+
+        # Either clean and write every page right away...
+        if stream is not None:
+            responses = self.harvester.fetch(urls, callback = lambda idx, response: stream.write(self.clean_page(response)))
+            return responses.count(None)
+
+        # ... or get the data for all pages
+        responses = self.harvester.fetch(urls)
+
+        # Clean and append to all articles, pages which failed for good are skipped
+        for response in responses:
+            if response is not None:
+                self.all_articles.extend(self.clean_page(response))
+        return responses.count(None)
+
+
+    def request_url(self, page, items, sec_or_desk, begin_date, end_date):
+        """
+        Builds the request url for one page of the NYT Article Search API
+
+        page (int): page number
+        items (list of strings): list of items used as keywords to fetch articles from
+        sec_or_desk (boolean): If true, search in sections, otherwise in newsdesks
+        begin_date (int): Begin date as YYYYMMDD
+        end_date (int): End date as YYYYMMDD
+        returns url (string)
         """
         # Prepare search string for url
         search = "%22+%22".join(items)
@@ -46,73 +143,56 @@ class Articles(object):
         # Section or newsdesk search?
         searchtype = "section_name" if sec_or_desk else "news_desk"
 
-        # List of all single alphabetic letters
-        singleletters = [chr(i) for i in range(97,123)] + [chr(i).upper() for i in range(97,123)]
+        return self.base_url + "?fq=" + searchtype + ".contains%3A%28%22" + search + "%22%29&fl=web_url%2Csnippet%2Clead_paragraph%2Cabstract%2Cheadline%2Ckeywords%2Cpub_date%2Cdocument_type%2Cnews_desk%2Ctype_of_material&page=" + str(page) + "&begin_date=" + str(begin_date) + "&end_date=" + str(end_date) + "&api-key=" + NYT_ARTICLE_SEARCH_KEY
 
-        # Counter for bad articles, which are not processed due to missing data
-        badcount = 0
 
-        # Run over all responses for all pages
-        for page in range(pages):
+    def clean_page(self, response):
+        """
+        Reorganizes and cleans the articles of one page
 
-            # There can be only made 10 calls per second to the NYT Article API, therefore wait for 0.1 seconds before each query
-            time.sleep(0.1)
+        response (string): json response of the NYT Article Search API
+        returns list of article dictionaries
+        """
+        # Load json response into python dictionary and reorganize some data
+        articles = json.loads(response)
+        articles_smooth = articles["response"]["docs"]
+        for i in range(len(articles_smooth)):
 
-            # Get the data
-            request_url = "https://api.nytimes.com/svc/search/v2/articlesearch.json?fq=" + searchtype + ".contains%3A%28%22" + search + "%22%29&fl=web_url%2Csnippet%2Clead_paragraph%2Cabstract%2Cheadline%2Ckeywords%2Cpub_date%2Cdocument_type%2Cnews_desk%2Ctype_of_material&page=" + str(page) + "&begin_date=" + str(begin_date) + "&end_date=" + str(end_date) + "&api-key=" + NYT_ARTICLE_SEARCH_KEY
+            # Make header column. If this fails, skip the article
             try:
-                response = urllib2.urlopen(request_url).read()
-            except urllib2.HTTPError, e:
-                print "Error code: " + str(e.code)
-                print "Error message: " + e.msg
-                print "Error hdrs:\n" + str(e.hdrs)
-                sys.exit()
-
-            # Load json response into python dictionary and reorganize some data
-            articles = json.loads(response)
-            articles_smooth = articles["response"]["docs"]
-            for i in range(len(articles_smooth)):
-
-                # Make header column. If this fails, skip the article
-                try:
-                    articles_smooth[i]["header"] = articles_smooth[i]["headline"]["main"]
-                except:
-                    badcount += 1
-                    print "Bad article #" + str(badcount) + ", skip and continue..."
-                    continue
-
-                # Make keywordlist column. If this fails, skip the article
-                try:
-                    articles_smooth[i]["keywordlist"] = " ".join([item["value"] for item in articles_smooth[i]["keywords"]])
-                except:
-                    badcount += 1
-                    print "Bad article #" + str(badcount) + ", skip and continue..."
-                    continue
+                articles_smooth[i]["header"] = articles_smooth[i]["headline"]["main"]
+            except:
+                self.badcount += 1
+                print "Bad article #" + str(self.badcount) + ", skip and continue..."
+                continue
 
-                # Make column with all word features. If this fails, skip the article. Also note that blogpost do not have the lead_paragraph feature
-                try:
-                    if articles_smooth[i]["document_type"] == "blogpost":
-                        articles_smooth[i]["allwords"] = " ".join([articles_smooth[i]["header"], articles_smooth[i]["keywordlist"], articles_smooth[i]["snippet"]])
-                    else:
-                        articles_smooth[i]["allwords"] = " ".join([articles_smooth[i]["header"], articles_smooth[i]["keywordlist"], articles_smooth[i]["lead_paragraph"], articles_smooth[i]["snippet"]])
-                except:
-                    badcount += 1
-                    print "Bad article #" + str(badcount) + ", skip and continue..."
-                    continue
+            # Make keywordlist column. If this fails, skip the article
+            try:
+                articles_smooth[i]["keywordlist"] = " ".join([item["value"] for item in articles_smooth[i]["keywords"]])
+            except:
+                self.badcount += 1
+                print "Bad article #" + str(self.badcount) + ", skip and continue..."
+                continue
 
-                # Clean all non alphabetic characters and throw away individual letters
-                wordlist = "".join( [char if char in singleletters else " " for char in articles_smooth[i]["allwords"]] ).split()
-                cleanwordlist = [word for word in wordlist if word not in singleletters]
+            # Make column with all word features. If this fails, skip the article. Also note that blogpost do not have the lead_paragraph feature
+            try:
+                if articles_smooth[i]["document_type"] == "blogpost":
+                    articles_smooth[i]["allwords"] = " ".join([articles_smooth[i]["header"], articles_smooth[i]["keywordlist"], articles_smooth[i]["snippet"]])
+                else:
+                    articles_smooth[i]["allwords"] = " ".join([articles_smooth[i]["header"], articles_smooth[i]["keywordlist"], articles_smooth[i]["lead_paragraph"], articles_smooth[i]["snippet"]])
+            except:
+                self.badcount += 1
+                print "Bad article #" + str(self.badcount) + ", skip and continue..."
+                continue
 
-                # Join as string, convert into regular string, and copy back onto allwords
-                articles_smooth[i]["allwords"] = " ".join(cleanwordlist)
+            # Clean all non alphabetic characters, throw away individual letters and copy back onto allwords
+            articles_smooth[i]["allwords"] = self.tokenizer.clean(articles_smooth[i]["allwords"])
 
-                # Delete old keywords and headline columns
-                del articles_smooth[i]["keywords"]
-                del articles_smooth[i]["headline"]
+            # Delete old keywords and headline columns
+            del articles_smooth[i]["keywords"]
+            del articles_smooth[i]["headline"]
 
-            # Append to all articles
-            self.all_articles.extend(articles_smooth)
+        return articles_smooth
 
 
     def write_articles(self, filename):
@@ -122,13 +202,8 @@ class Articles(object):
         filename (string): filename with directory called "Articles"
         returns nothing
         """
-        # Make folder for saving the data if it does not already exist
-        if not os.path.isdir(PATH_TO_REPO + "articles"):
-            cmd = "mkdir {}articles".format(PATH_TO_REPO)
-            os.system(cmd)
-
-        # And save the data
-        open(PATH_TO_REPO + "articles/" + filename + ".json", "w").write(json.dumps(self.all_articles))
+        # Make folder for saving the data if it does not already exist and save the data
+        open(make_folder("articles") + "/" + filename + ".json", "w").write(json.dumps(self.all_articles))
 
 
     def clear_articles(self):
@@ -151,30 +226,58 @@ def main():
     # Get training data for all other classes by search on sections
     CategoriesSections = {"World" : ["World"],"US" : ["U.S."], "NY" : ["N.Y.", "NY", "New+York"], "Business" : ["Business"], "Tech" : ["Technology"], "Science" : ["Science"], "Health" : ["Health"], "Sports" : ["Sports"], "Arts" : ["Arts"], "Style" : ["Style"], "Food" : ["Food"], "Travel" : ["Travel"], "RealEstate" : ["Real+Estate"]}
 
-    # Initialize class, set pages as well as begindates and enddates
-    AllArticles = Articles()
+    # Files that are complete from an earlier run are skipped altogether, and the day's requests are counted next to the
+    # checkpoint, so that a restart on the same day does not exceed the quota
+    checkpoint = Checkpoint(filename = make_folder("articles") + "/checkpoint.json")
+    limiter = RateLimiter(filename = make_folder("articles") + "/quota.json")
+
+    # Initialize class with a cache of all responses, so that a repeated or interrupted scrape only fetches the missing pages
+    # (and rebuilds the rest from disc), set pages as well as begindates and enddates
+    cache = ResponseCache(folder = make_folder("cache/articlesearch"))
+    AllArticles = Articles(harvester = Harvester(limiter = limiter, cache = cache))
     pages = 100
 
     # Define begin and end dates
     begin_dates = [20150301, 20140901, 20140301, 20130901, 20130301, 20120901, 20120301, 20110901, 20110301, 20100901]
     end_dates = [20150827, 20150228, 20140831, 20140228, 20130831, 20130228, 20120831, 20120229, 20110831, 20110228]
 
-    # Query the API and collect all articles for all categories (note that you typically cannot do this in one run, as the article API allows only 10.000 calls per day)
-    for key, sections in CategoriesSections.iteritems():
-        print "Scraping Section " + key + "..."
-        for start, end in zip(begin_dates, end_dates):
-            AllArticles.fetch_articles(pages = pages, items = sections, sec_or_desk = True, begin_date = start, end_date = end)
-            AllArticles.write_articles(filename = "Articles_" + key + "_start" + str(start) + "_end" + str(end))
-            AllArticles.clear_articles()
-        print "Scraping Section " + key + " done.\n"
-
-    for key, desks in CategoriesDesks.iteritems():
-        print "Scraping Newsdesks " + key + "..."
-        for start, end in zip(begin_dates, end_dates):
-            AllArticles.fetch_articles(pages = pages, items = desks, sec_or_desk = False, begin_date = start, end_date = end)
-            AllArticles.write_articles(filename = "Articles_" + key  + "_start" + str(start) + "_end" + str(end))
-            AllArticles.clear_articles()
-        print "Scraping Newsdesks " + key + " done.\n"
+    # Query the API and collect all articles for all categories (note that you typically cannot do this in one run, as the article API allows only 10.000 calls per day).
+    # Every page is written to a newline-delimited json file as soon as it arrives
+    try:
+        for key, sections in CategoriesSections.iteritems():
+            print "Scraping Section " + key + "..."
+            for start, end in zip(begin_dates, end_dates):
+                filename = "Articles_" + key + "_start" + str(start) + "_end" + str(end)
+                if checkpoint.done(filename):
+                    continue
+                stream = ArticleStream(filename = filename)
+                try:
+                    failed = AllArticles.fetch_articles(pages = pages, items = sections, sec_or_desk = True, begin_date = start, end_date = end, stream = stream)
+                finally:
+                    stream.close()
+                if failed == 0:
+                    checkpoint.mark(filename)
+            print "Scraping Section " + key + " done.\n"
+
+        for key, desks in CategoriesDesks.iteritems():
+            print "Scraping Newsdesks " + key + "..."
+            for start, end in zip(begin_dates, end_dates):
+                filename = "Articles_" + key + "_start" + str(start) + "_end" + str(end)
+                if checkpoint.done(filename):
+                    continue
+                stream = ArticleStream(filename = filename)
+                try:
+                    failed = AllArticles.fetch_articles(pages = pages, items = desks, sec_or_desk = False, begin_date = start, end_date = end, stream = stream)
+                finally:
+                    stream.close()
+                if failed == 0:
+                    checkpoint.mark(filename)
+            print "Scraping Newsdesks " + key + " done.\n"
+
+    except QuotaExceeded, e:
+        print "Stopping: " + str(e)
+        print "Fetched pages are cached, run again to continue where this run stopped"
+        sys.exit()
 
 
 
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Columnar on-disk format for the cleaned training data. A dataset is a folder with raw binary columns that can be
+memory-mapped and read column by column or in row slices:
+
+    meta.json      format version, number of rows and dtypes
+    labels.bin     encoded section labels (int8)
+    offsets.bin    start of each text in allwords.bin (int64, one more entry than rows)
+    allwords.bin   utf-8 encoded texts, one after the other
+"""
+
+# Imports
+import os
+import json
+import numpy as np
+import pandas as pd
+
+
+# Version of the on-disk layout, increase when it changes
+FORMAT_VERSION = 1
+
+
+class ColumnarWriter(object):
+    """
+    Class that writes a columnar dataset incrementally, so that the data never needs to be in memory at once
+
+    path (string): full path of the dataset folder
+    """
+
+    def __init__(self, path):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        self.rows = 0
+        self.end = 0
+
+        # The meta data of an earlier dataset in the same folder would mark the new, still partial columns as complete
+        if os.path.isfile(os.path.join(path, "meta.json")):
+            os.remove(os.path.join(path, "meta.json"))
+
+        # Open the columns, the offsets always start with zero
+        self.labels = open(os.path.join(path, "labels.bin"), "wb")
+        self.offsets = open(os.path.join(path, "offsets.bin"), "wb")
+        self.allwords = open(os.path.join(path, "allwords.bin"), "wb")
+        self.offsets.write(np.zeros(1, dtype = np.int64).tostring())
+
+
+    def append(self, texts, labels):
+        """
+        Appends rows
+
+        texts (iterable of strings): cleaned texts
+        labels (iterable of ints): encoded labels
+        returns nothing
+        """
+        encoded = [text.encode("utf-8") if isinstance(text, unicode) else text for text in texts]
+        ends = self.end + np.cumsum([len(text) for text in encoded], dtype = np.int64)
+        self.allwords.write("".join(encoded))
+        self.offsets.write(ends.tostring())
+        self.labels.write(np.asarray(labels, dtype = np.int8).tostring())
+        self.rows += len(encoded)
+        self.end = int(ends[-1]) if len(ends) else self.end
+
+
+    def close(self):
+        """
+        Closes the columns and writes the meta data, which marks the dataset as complete
+
+        returns nothing
+        """
+        for f in [self.labels, self.offsets, self.allwords]:
+            f.close()
+
+        # Via a temporary file, so that the meta data is either complete or missing
+        temporary = os.path.join(self.path, "meta.json.{}.tmp".format(os.getpid()))
+        with open(temporary, "w") as f:
+            json.dump({"version": FORMAT_VERSION, "rows": self.rows, "dtypes": {"labels": "int8", "offsets": "int64", "allwords": "uint8"}}, f)
+        os.rename(temporary, os.path.join(self.path, "meta.json"))
+
+
+
+def write_columnar(data, path):
+    """
+    Writes a dataframe with the columns "allwords" and "label" as columnar dataset
+
+    data (pandas dataframe): cleaned data
+    path (string): full path of the dataset folder
+    returns nothing
+    """
+    writer = ColumnarWriter(path)
+    writer.append(data["allwords"], data["label"])
+    writer.close()
+
+
+
+class ColumnarDataset(object):
+    """
+    Class that gives memory-mapped access to a columnar dataset
+
+    path (string): full path of the dataset folder
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError("Unsupported columnar dataset version {} in {}".format(self.meta["version"], path))
+        self.rows = self.meta["rows"]
+
+        # Memory-map the columns (an empty file cannot be mapped)
+        self.labels = self.map_column(path, "labels")
+        self.offsets = self.map_column(path, "offsets")
+        self.allwords = self.map_column(path, "allwords")
+
+
+    def map_column(self, path, column):
+        """
+        Memory-maps one column read-only
+
+        path (string): full path of the dataset folder
+        column (string): name of the column
+        returns numpy array
+        """
+        filename = os.path.join(path, column + ".bin")
+        dtype = np.dtype(str(self.meta["dtypes"][column]))
+        if os.path.getsize(filename) == 0:
+            return np.zeros(0, dtype = dtype)
+        return np.memmap(filename, dtype = dtype, mode = "r")
+
+
+    def __len__(self):
+        return self.rows
+
+
+    def texts(self, start = 0, stop = None):
+        """
+        Reads the texts of a row slice
+
+        start (int): first row
+        stop (int): row after the last one, by default the end of the dataset
+        returns list of strings
+        """
+        stop = self.rows if stop is None else min(stop, self.rows)
+        offsets = self.offsets[start:stop + 1]
+        if len(offsets) < 2:
+            return []
+
+        # Read the whole slice at once and cut it into the texts
+        blob = self.allwords[offsets[0]:offsets[-1]].tostring()
+        relative = (offsets - offsets[0]).tolist()
+        return [blob[relative[i]:relative[i + 1]] for i in range(len(relative) - 1)]
+
+
+    def take(self, indices):
+        """
+        Reads arbitrary rows, for example a random sample or a cross-validation fold
+
+        indices (iterable of ints): row numbers
+        returns tuple of (list of strings, numpy array of labels)
+        """
+        indices = np.asarray(indices, dtype = np.int64)
+        starts, stops = self.offsets[indices], self.offsets[indices + 1]
+        return [self.allwords[start:stop].tostring() for start, stop in zip(starts, stops)], np.asarray(self.labels[indices])
+
+
+    def permutation(self, seed = 0):
+        """
+        Random order of the rows, to shuffle the data when reading instead of storing it shuffled
+
+        seed (int): seed of the random order
+        returns numpy array of row numbers
+        """
+        return np.random.RandomState(seed).permutation(self.rows)
+
+
+    def to_frame(self, start = 0, stop = None, seed = None):
+        """
+        Reads a row slice into a dataframe with the columns "allwords" and "label"
+
+        start (int): first row
+        stop (int): row after the last one, by default the end of the dataset
+        seed (int): if given, the rows are shuffled with this seed first and the slice is taken from the shuffled rows
+        returns pandas dataframe
+        """
+        stop = self.rows if stop is None else min(stop, self.rows)
+        if seed is None:
+            return pd.DataFrame({"allwords": self.texts(start, stop), "label": np.asarray(self.labels[start:stop])}, columns = ["allwords", "label"])
+
+        # Rows of the shuffled slice. For a large slice read all texts in one go and pick the rows, otherwise read only the rows
+        indices = self.permutation(seed)[start:stop]
+        if len(indices) > self.rows // 4:
+            texts = self.texts()
+            return pd.DataFrame({"allwords": [texts[idx] for idx in indices], "label": np.asarray(self.labels[indices])}, columns = ["allwords", "label"])
+        texts, labels = self.take(indices)
+        return pd.DataFrame({"allwords": texts, "label": labels}, columns = ["allwords", "label"])
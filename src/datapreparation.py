@@ -7,8 +7,10 @@ September 2015
 """
 
 # Imports
-import glob
-import json
+import time
+import pickle
+import itertools
+import multiprocessing
 import pandas as pd
 import numpy as np
 import os
@@ -16,6 +18,69 @@ import os
 # Get path to repository (requires a module named "apikeyspath.py" with path to repo)
 from apikeyspath import PATH_TO_REPO
 
+# Reading the article shards and writing the columnar format
+import shards
+from columnar import ColumnarWriter, write_columnar
+
+# Detection of exact and near-duplicate articles, and the nearest neighbor index of the archive
+from minhash import MinHasher, Deduplicator
+from archiveindex import build_archive
+from tokenizer import Tokenizer
+
+
+def read_shard(task):
+    """
+    Reads only the text of all articles of one shard (on module level, so that it can be run in a process pool)
+
+    task (tuple): full path of the shard and its label
+    returns tuple of (list of strings, label)
+    """
+    filename, label = task
+    return [article.get("allwords") for article in shards.iter_articles(filename)], label
+
+
+def clean_shard(task):
+    """
+    Reads and cleans the texts of one shard like cleandata does, with vectorized string operations (on module level, so that it can be run in a process pool)
+
+    task (tuple): full path of the shard and its label
+    returns tuple of (pandas series of strings, label)
+    """
+    texts, label = read_shard(task)
+
+    # Drop missing and empty texts, i.e. texts without any word
+    texts = pd.Series(texts, dtype = object).dropna()
+    return texts[texts.str.strip().str.len() > 0], label
+
+
+def fingerprint_shard(task):
+    """
+    Reads and cleans the texts of one shard and makes their fingerprints for the deduplication (on module level, so that it can be run in a process pool)
+
+    task (tuple): full path of the shard and its label
+    returns tuple of (pandas series of strings, label, list of fingerprints)
+    """
+    texts, label = clean_shard(task)
+    hasher = MinHasher()
+    return texts, label, [hasher.fingerprint(text) for text in texts]
+
+
+def print_duplicates(deduplicator):
+    """
+    Prints how many duplicates were removed and between which sections
+
+    deduplicator (Deduplicator): deduplicator after all articles were added
+    returns report (dictionary)
+    """
+    report = deduplicator.report(names = shards.SECTIONS)
+    print "Removed {} exact and {} near-duplicates, kept {} articles".format(report["exact"], report["near"], report["kept"])
+    # The most frequent label conflicts, i.e. duplicates across sections
+    print "{} of them were labeled with a different section than the kept article".format(sum(count for kept, removed, count in report["conflicts"]))
+    for kept, removed, count in report["conflicts"][:10]:
+        print "    {} duplicates of {} articles removed from {}".format(count, kept, removed)
+    return report
+
+
 
 class DataPolisher(object):
     """
@@ -26,34 +91,38 @@ class DataPolisher(object):
         # Dataframe to keep the data
         self.data = pd.DataFrame()
 
+        # Report of the duplicates removed by the last deduplication (see Deduplicator.report)
+        self.duplicates = None
 
-    def loaddata(self, folder):
+
+    def loaddata(self, folder, processes = None):
         """
-        Loads the data
+        Loads the data. The shards are parsed in a process pool, only the text is kept and everything is combined once at the end
 
         folder (string): folder in which to look for the datafiles
+        processes (int): number of processes to parse the shards, by default one per cpu, 1 parses in this process
         returns nothing
         """
-
-        # Loop over all sections
-        for idx, section in enumerate(["Arts", "Business", "Food", "Health", "NY", "Politics", "RealEstate", "Science", "Sports", "Style", "Tech", "Travel", "US", "World"]):
-
-            # Get files and set up empty dataframe and list
-            files = glob.glob(PATH_TO_REPO + folder + "/Articles_" + section + "*.json")
-            sectiondata = pd.DataFrame()
-            list_ = []
-
-            # Loop over all files, read data into dataframe and append to list
-            for file_ in files:
-                df = pd.read_json(file_)
-                list_.append(df)
-
-            # Combine all frames and label them
-            sectiondata = pd.concat(list_)
-            sectiondata["label"] = idx
-
-            # Combine all on class' data variable
-            self.data = pd.concat([self.data,sectiondata])
+        # Get files of all sections together with their labels
+        start = time.time()
+        tasks = [(file_, idx) for idx, section in enumerate(shards.SECTIONS) for file_ in shards.find_shards(PATH_TO_REPO + folder, section)]
+        print "Found {} files in {:.2f} s".format(len(tasks), time.time() - start)
+
+        # Parse all files, keeping the order of the sections
+        start = time.time()
+        if processes == 1:
+            results = map(read_shard, tasks)
+        else:
+            pool = multiprocessing.Pool(processes = processes)
+            results = pool.map(read_shard, tasks, chunksize = 1)
+            pool.close()
+            pool.join()
+        print "Parsed {} files in {:.2f} s".format(len(tasks), time.time() - start)
+
+        # Combine all texts and labels in one go
+        start = time.time()
+        self.data = pd.DataFrame({"allwords": [text for texts, label in results for text in texts], "label": np.repeat([label for texts, label in results], [len(texts) for texts, label in results])}, columns = ["allwords", "label"])
+        print "Combined {} articles in {:.2f} s\n".format(len(self.data), time.time() - start)
 
 
     def cleandata(self):
@@ -66,8 +135,8 @@ class DataPolisher(object):
         # Drop empty entries
         self.data = self.data.dropna(subset = ['allwords'])
 
-        # Drop all columns but "allwords" and "label", convert to string
-        self.data.drop(self.data.columns[[0,2,3,4,5,6,8,9,10,11,12,13]], axis=1, inplace=True)
+        # Drop all columns but "allwords" and "label" (by name, the column order differs between json and newline-delimited json files), convert to string
+        self.data = self.data.drop([column for column in self.data.columns if column not in ["allwords", "label"]], axis=1)
         self.data["allwords"] = self.data["allwords"].astype(str)
 
         # Make length feature
@@ -86,11 +155,108 @@ class DataPolisher(object):
         self.data.drop('index', axis=1, inplace=True)
 
 
-    def writedata(self, filename):
+    def deduplicate(self):
+        """
+        Removes exact and near-duplicate articles from the cleaned data, keeping the first occurrence
+
+        returns report (dictionary, see Deduplicator.report)
+        """
+        hasher = MinHasher()
+        deduplicator = Deduplicator(hasher)
+        keep = [deduplicator.add(digest, signature, label) is None for (digest, signature), label in zip(map(hasher.fingerprint, self.data["allwords"]), self.data["label"])]
+
+        # Drop the duplicates, reset index
+        self.data = self.data[keep].reset_index(drop = True)
+        self.duplicates = print_duplicates(deduplicator)
+        return self.duplicates
+
+
+    def cleanshards(self, folder, filename, processes = None, deduplicate = True):
         """
-        Writes the data to pickle
+        Loads, cleans and writes the data shard by shard as columnar dataset, so that only a few shards are in memory at
+        any time and the data never needs to fit into memory as a whole. The rows are written in the order of the shards,
+        shuffle them when reading (see ColumnarDataset.to_frame)
 
-        filename (string): filename for pickled datafile
+        folder (string): folder in which to look for the datafiles
+        filename (string): folder name of the columnar dataset, in the data folder
+        processes (int): number of processes to clean the shards, by default one per cpu, 1 cleans in this process
+        deduplicate (boolean): If true, exact and near-duplicates of articles written before are dropped (the fingerprints
+            are made in the pool, the lookups in this process, so that the whole corpus is only one index)
+        returns number of rows written
+        """
+        # Get files of all sections together with their labels
+        tasks = [(file_, idx) for idx, section in enumerate(shards.SECTIONS) for file_ in shards.find_shards(PATH_TO_REPO + folder, section)]
+
+        # Make folder for saving the data if it does not already exist
+        if not os.path.isdir(PATH_TO_REPO + "data"):
+            os.makedirs(PATH_TO_REPO + "data")
+
+        # Clean the shards in a process pool and append each to the dataset as soon as it is done, in the order of the shards
+        start = time.time()
+        writer = ColumnarWriter(PATH_TO_REPO + "data/" + filename)
+        deduplicator = Deduplicator() if deduplicate else None
+        function = fingerprint_shard if deduplicate else clean_shard
+        pool = multiprocessing.Pool(processes = processes) if processes != 1 else None
+        try:
+            for result in (pool.imap(function, tasks, chunksize = 1) if pool is not None else itertools.imap(function, tasks)):
+                texts, label = result[:2]
+
+                # Drop the duplicates of articles written before
+                if deduplicator is not None:
+                    texts = texts[[deduplicator.add(digest, signature, label) is None for digest, signature in result[2]]]
+                writer.append(texts, np.full(len(texts), label, dtype = np.int8))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        writer.close()
+        print "Cleaned and wrote {} articles from {} files in {:.2f} s".format(writer.rows, len(tasks), time.time() - start)
+        if deduplicator is not None:
+            self.duplicates = print_duplicates(deduplicator)
+        print
+        return writer.rows
+
+
+    def indexarchive(self, folder, filename, stopwords_pickle = "stopwords.pkl"):
+        """
+        Builds the nearest neighbor index of all articles for the recommendations from the archive (see archiveindex.py).
+        An article that was scraped for several sections is only indexed for the first one
+
+        folder (string): folder in which to look for the datafiles
+        filename (string): folder name of the index, in the data folder
+        stopwords_pickle (string): filename of the pickled stopwords in the data folder, they are removed like the predictor does
+        returns number of indexed articles
+        """
+        # The predictor removes the stopwords from the articles it ranks, so do the same (if they were already written by the algorithm)
+        stopwords = []
+        if os.path.isfile(PATH_TO_REPO + "data/" + stopwords_pickle):
+            with open(PATH_TO_REPO + "data/" + stopwords_pickle) as f:
+                stopwords = pickle.load(f)
+        tokenizer = Tokenizer(stopwords = stopwords)
+
+        # Words, label and what the predictor shows of every article, one shard after the other
+        def items():
+            urls = set()
+            for label, section in enumerate(shards.SECTIONS):
+                for file_ in shards.find_shards(PATH_TO_REPO + folder, section):
+                    for article in shards.iter_articles(file_):
+                        if not article.get("allwords") or article.get("web_url") in urls:
+                            continue
+                        urls.add(article.get("web_url"))
+                        yield tokenizer.tokenize(article["allwords"]), label, {"title": article.get("header"), "abstract": article.get("snippet") or article.get("abstract"), "url": article.get("web_url")}
+
+        start = time.time()
+        number_of_articles = build_archive(items(), PATH_TO_REPO + "data/" + filename)
+        print "Indexed {} articles of the archive in {:.2f} s\n".format(number_of_articles, time.time() - start)
+        return number_of_articles
+
+
+    def writedata(self, filename, columnar = False):
+        """
+        Writes the data to pickle or as memory-mappable columnar dataset
+
+        filename (string): filename for pickled datafile, or folder name of the columnar dataset
+        columnar (boolean): If true, write the columnar format (see columnar.py) instead of a pickle
         returns nothing
         """
 
@@ -99,7 +265,10 @@ class DataPolisher(object):
             cmd = "mkdir {}data".format(PATH_TO_REPO)
             os.system(cmd)
 
-        self.data.to_pickle(PATH_TO_REPO + "data/" + filename)
+        if columnar:
+            write_columnar(self.data, PATH_TO_REPO + "data/" + filename)
+        else:
+            self.data.to_pickle(PATH_TO_REPO + "data/" + filename)
 
 
 
@@ -107,11 +276,12 @@ def main():
     """
     Main function
     """
-    # Make class, then load, clean and write data
+    # Make class, then load, clean and write the data shard by shard (it is shuffled when the algorithm reads it)
     MyDataPolisher = DataPolisher()
-    MyDataPolisher.loaddata(folder = "articles")
-    MyDataPolisher.cleandata()
-    MyDataPolisher.writedata(filename = "clean_nyt_training_data.pkl")
+    MyDataPolisher.cleanshards(folder = "articles", filename = "clean_nyt_training_data")
+
+    # Index all articles for the recommendations from the archive
+    MyDataPolisher.indexarchive(folder = "articles", filename = "archive")
 
 
 
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Concurrent, rate-limited fetching of API responses
+"""
+
+# Imports
+import os
+import json
+import time
+import random
+import socket
+import urllib2
+import threading
+import Queue
+
+from responsecache import atomic_write
+
+
+class QuotaExceeded(Exception):
+    """
+    Raised when the daily quota of an API is used up
+    """
+    pass
+
+
+class TokenBucket(object):
+    """
+    Token bucket that refills continuously at a fixed rate (not thread-safe on its own, see RateLimiter)
+
+    rate (float): tokens added per second
+    capacity (float): maximal number of tokens, i.e. the allowed burst
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last = time.time()
+
+
+    def wait_time(self):
+        """
+        Refills the bucket and computes how long to wait for the next token
+
+        returns waiting time in seconds (float), zero if a token is available
+        """
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+
+    def take(self):
+        """
+        Takes one token
+
+        returns nothing
+        """
+        self.tokens -= 1.0
+
+
+
+class DayCounter(object):
+    """
+    Counter of the requests in the current day (fixed windows of calendar days in UTC, when the APIs reset their quotas),
+    optionally kept in a json file so that a restart does not reset it (not thread-safe on its own, see RateLimiter)
+
+    limit (int): allowed requests per day
+    filename (string): full path of the file with the count, None to count in memory only
+    """
+
+    def __init__(self, limit, filename = None):
+        self.limit = limit
+        self.filename = filename
+        self.day, self.count = self.today(), 0
+        if filename is not None and os.path.isfile(filename):
+            with open(filename) as f:
+                state = json.load(f)
+            if state["day"] == self.day:
+                self.count = state["count"]
+
+
+    def today(self):
+        """
+        Number of the current day
+
+        returns int
+        """
+        return int(time.time() // 86400)
+
+
+    def remaining(self):
+        """
+        Starts a new window if the day is over and computes how many requests are left today
+
+        returns int
+        """
+        day = self.today()
+        if day != self.day:
+            self.day, self.count = day, 0
+        return self.limit - self.count
+
+
+    def reset_in(self):
+        """
+        Time until the quota resets
+
+        returns time in seconds (float)
+        """
+        return (self.day + 1) * 86400 - time.time()
+
+
+    def take(self):
+        """
+        Counts one request, and writes the count if there is a file
+
+        returns nothing
+        """
+        self.count += 1
+        if self.filename is not None:
+            atomic_write(self.filename, json.dumps({"day": self.day, "count": self.count}))
+
+
+
+class RateLimiter(object):
+    """
+    Thread-safe limiter that enforces a per-second and a per-day quota, shared by all fetching threads
+
+    per_second (float): allowed requests per second
+    per_day (int): allowed requests per day, QuotaExceeded is raised as soon as they are used up
+    filename (string): full path of a file that keeps the count of the day's requests across runs, None to count in memory only
+    """
+
+    def __init__(self, per_second = 10, per_day = 10000, filename = None):
+        self.second_bucket = TokenBucket(rate = per_second, capacity = per_second)
+        self.day_counter = DayCounter(limit = per_day, filename = filename)
+        self.lock = threading.Lock()
+
+
+    def acquire(self):
+        """
+        Blocks until a request may be made
+
+        returns nothing
+        """
+        while True:
+            with self.lock:
+                if self.day_counter.remaining() <= 0:
+                    raise QuotaExceeded("Daily quota used up, next request possible in {:.0f} s".format(self.day_counter.reset_in()))
+                wait = self.second_bucket.wait_time()
+                if wait == 0.0:
+                    self.second_bucket.take()
+                    self.day_counter.take()
+                    return
+
+            # Sleep outside of the lock, so that the other threads can check as well
+            time.sleep(wait)
+
+
+
+class Harvester(object):
+    """
+    Class that keeps several requests in flight while respecting the API's quotas. Responses with status 429 or 5xx
+    and network errors are retried with exponential backoff
+
+    workers (int): number of concurrent requests
+    limiter (RateLimiter): shared rate limiter, by default 10 requests per second and 10.000 per day (the NYT Article Search API's limits)
+    max_retries (int): number of retries per request
+    backoff (float): base waiting time in seconds before the first retry, doubled with each further retry
+    timeout (float): timeout in seconds for each request
+    cache (ResponseCache): if given, responses are taken from this cache without a request (and without using the quota),
+                           and fetched responses are stored in it
+    """
+
+    def __init__(self, workers = 8, limiter = None, max_retries = 5, backoff = 1.0, timeout = 30.0, cache = None):
+        self.workers = workers
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache
+
+
+    def fetch_one(self, url):
+        """
+        Fetches one url, retrying on rate limit responses, server errors and network errors
+
+        url (string): url to be fetched
+        returns response body (string)
+        """
+        # Cached responses cost neither time nor quota
+        if self.cache is not None:
+            body = self.cache.get(url)
+            if body is not None:
+                return body
+
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                body = urllib2.urlopen(url, timeout = self.timeout).read()
+                if self.cache is not None:
+                    self.cache.put(url, body)
+                return body
+            except urllib2.HTTPError, e:
+                if (e.code != 429 and e.code < 500) or attempt >= self.max_retries:
+                    raise
+                retry_after = e.hdrs.get("Retry-After") if e.hdrs is not None else None
+                wait = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * 2**attempt
+            except (urllib2.URLError, socket.error), e:
+                if attempt >= self.max_retries:
+                    raise
+                wait = self.backoff * 2**attempt
+
+            # Back off, with some jitter so the threads do not retry in lockstep
+            time.sleep(wait * random.uniform(1.0, 1.5))
+            attempt += 1
+
+
+    def fetch(self, urls, callback = None):
+        """
+        Fetches all urls concurrently
+
+        urls (list of strings): urls to be fetched
+        callback (function): if given, called as callback(index, response body) as soon as a response arrives (one call at a time),
+                             and the responses are not kept. A page whose callback raises an exception counts as failed
+        returns list of response bodies in the order of the urls (True instead if a callback is given), None for requests that failed for good
+        """
+        results = [None] * len(urls)
+        todo = Queue.Queue()
+        for idx, url in enumerate(urls):
+            todo.put((idx, url))
+        quota = []
+        callback_lock = threading.Lock()
+
+        def work():
+            while not quota:
+                try:
+                    idx, url = todo.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    response = self.fetch_one(url)
+                    if callback is None:
+                        results[idx] = response
+                    else:
+                        with callback_lock:
+                            try:
+                                callback(idx, response)
+                            except Exception, e:
+                                print "Error in the callback: " + repr(e)
+                                print "Giving up on request #" + str(idx)
+                                continue
+                        results[idx] = True
+                except QuotaExceeded, e:
+                    quota.append(e)
+                except urllib2.HTTPError, e:
+                    print "Error code: " + str(e.code)
+                    print "Error message: " + str(e.msg)
+                    print "Giving up on request #" + str(idx)
+                except (urllib2.URLError, socket.error), e:
+                    print "Network error: " + str(e)
+                    print "Giving up on request #" + str(idx)
+
+        # Run the worker threads until all urls are done
+        threads = [threading.Thread(target = work) for i in range(min(self.workers, len(urls)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Stop everything if the quota is used up
+        if quota:
+            raise quota[0]
+
+        return results
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Standalone inference engine that fuses the tf-idf weighting and the Logistic Regression into one pass over the tokens
+(NumPy only, no scikit-learn needed for serving; the same file is copied into the website folder, keep both versions identical)
+"""
+
+# Imports
+import re
+import numpy as np
+
+
+class InferenceEngine(object):
+    """
+    Class that scores texts with the arrays of a model file. The idf weights are folded into the coefficients
+    once, so that scoring a batch is a single gather and segment sum over the tokens of all texts. Everything is kept
+    in numpy arrays and no python objects per term, so that worker processes forked after loading share the memory
+    instead of copying it as soon as they touch it (see website/gunicorn_config.py)
+
+    modelfile (ModelFile): loaded model file
+    """
+
+    def __init__(self, modelfile):
+        settings = modelfile.header["vectorizer"]
+        self.lowercase = settings["lowercase"]
+        self.token_pattern = re.compile(settings["token_pattern"])
+        self.norm = settings["norm"]
+        self.sublinear_tf = settings["sublinear_tf"]
+        self.multi_class = modelfile.header["classifier"]["multi_class"]
+        if settings.get("analyzer", "word") != "word":
+            raise ValueError("Only word analyzers are supported, not " + str(settings["analyzer"]))
+        self.min_n, self.max_n = settings.get("ngram_range", [1, 1])
+
+        # The vectorizer removes stop words before it forms n-grams. Without n-grams, it is enough (and faster) to leave them out of the vocabulary
+        stop_words = frozenset(settings.get("stop_words", []))
+        self.stop_words = stop_words if self.max_n > 1 else frozenset()
+
+        # Vocabulary as sorted terms with their columns to look up tokens by binary search (a dictionary would be a python
+        # object per term, and reference counting writes to all of them)
+        vocabulary = sorted((term, col) for col, term in enumerate(modelfile.terms()) if term not in stop_words)
+        self.terms = np.array([term for term, col in vocabulary] or [u""], dtype = np.unicode_)
+        self.columns = np.array([col for term, col in vocabulary] or [-1], dtype = np.int64)
+        del vocabulary
+
+        # Idf and the idf-scaled coefficients with one row per term
+        self.idf = np.asarray(modelfile.arrays["idf"])
+        self.weights = np.ascontiguousarray((modelfile.arrays["coef"] * self.idf).T)
+        self.intercept = np.asarray(modelfile.arrays["intercept"])
+        self.classes = np.asarray(modelfile.arrays["classes"])
+
+
+    def tokenize(self, text):
+        """
+        Splits a text into tokens and n-grams of tokens exactly like the Tfidf vectorizer does
+
+        text (string): text
+        returns list of tokens and n-grams
+        """
+        if isinstance(text, str):
+            text = text.decode("utf-8")
+        if self.lowercase:
+            text = text.lower()
+        tokens = self.token_pattern.findall(text)
+        if self.stop_words:
+            tokens = [token for token in tokens if token not in self.stop_words]
+        if self.max_n == 1:
+            return tokens
+
+        # N-grams of consecutive tokens, joined by a space
+        ngrams = list(tokens) if self.min_n == 1 else []
+        for n in range(max(self.min_n, 2), min(self.max_n, len(tokens)) + 1):
+            ngrams.extend(u" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return ngrams
+
+
+    def lookup(self, token_lists):
+        """
+        Looks up the tokens of a batch of texts in the vocabulary, all at once
+
+        token_lists (list of lists of strings): tokens of each text
+        returns tuple of (numpy array of texts, numpy array of columns), one entry per known token
+        """
+        tokens = np.array([token for tokens in token_lists for token in tokens], dtype = np.unicode_)
+        rows = np.repeat(np.arange(len(token_lists), dtype = np.int64), [len(tokens_) for tokens_ in token_lists])
+        if not len(tokens):
+            return rows, rows
+
+        # Tokens longer than all terms are no terms, the others are compared as fixed-width strings like the terms
+        if tokens.dtype.itemsize > self.terms.dtype.itemsize:
+            short = np.char.str_len(tokens) * np.dtype((np.unicode_, 1)).itemsize <= self.terms.dtype.itemsize
+            tokens, rows = tokens[short].astype(self.terms.dtype), rows[short]
+        positions = np.minimum(np.searchsorted(self.terms, tokens), len(self.terms) - 1)
+        known = self.terms[positions] == tokens
+        return rows[known], self.columns[positions[known]]
+
+
+    def decision_function(self, token_lists):
+        """
+        Computes the decision values of the classifier for a batch of tokenized texts
+
+        token_lists (list of lists of strings): tokens of each text
+        returns numpy array with one row per text and one column per class
+        """
+        # Columns of all known tokens and the text they belong to
+        rows, cols = self.lookup(token_lists)
+
+        scores = np.zeros((len(token_lists), len(self.intercept)))
+        if len(cols):
+            # Term counts per text, ordered by text
+            keys, counts = np.unique(rows * len(self.idf) + cols, return_counts = True)
+            rows, cols = keys // len(self.idf), keys % len(self.idf)
+            tf = np.log(counts) + 1.0 if self.sublinear_tf else counts.astype(np.float64)
+
+            # Normalization of the tf-idf vectors, texts without known tokens stay zero
+            if self.norm == "l2":
+                norms = np.sqrt(np.bincount(rows, weights = (tf * self.idf[cols])**2))
+            elif self.norm == "l1":
+                norms = np.bincount(rows, weights = tf * self.idf[cols])
+            else:
+                norms = np.ones(len(token_lists))
+
+            # Sum the weighted coefficients of the tokens of each text
+            starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+            contributions = self.weights[cols] * (tf / norms[rows])[:, np.newaxis]
+            scores[rows[starts]] = np.add.reduceat(contributions, starts, axis = 0)
+
+        return scores + self.intercept
+
+
+    def predict(self, texts):
+        """
+        Predicts the labels of a batch of texts
+
+        texts (list of strings): texts, cleaned like the training data
+        returns tuple of (numpy array of labels, numpy array of decision values with one row per text)
+        """
+        scores = self.decision_function([self.tokenize(text) for text in texts])
+        return self.classes[np.argmax(scores, axis = 1)], scores
+
+
+    def predict_proba(self, scores):
+        """
+        Turns decision values into class probabilities, like the Logistic Regression does
+
+        scores (numpy array): decision values with one row per text
+        returns numpy array of probabilities with one row per text
+        """
+        if self.multi_class == "multinomial":
+            probabilities = np.exp(scores - scores.max(axis = 1)[:, np.newaxis])
+        else:
+            probabilities = 1.0 / (1.0 + np.exp(-scores))
+        return probabilities / probabilities.sum(axis = 1)[:, np.newaxis]
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+On-disc cache of vectorized training data, so that retraining only the classifier skips tokenizing and vectorizing
+"""
+
+# Imports
+import os
+import glob
+import hashlib
+import threading
+import numpy as np
+import scipy.sparse as sp
+import sklearn
+
+from modelfile import set_idf
+
+
+class MatrixCache(object):
+    """
+    Class that stores the document-term matrix of a dataset together with the fitted vocabulary and idf weights of the
+    vectorizer, in one .npz file per dataset and vectorizer settings (arrays only, scipy's save_npz is not available in
+    older versions). When the files take more than the maximal size, the least recently used ones are deleted
+
+    folder (string): folder for the cached matrices
+    max_bytes (int): maximal size of all cached matrices together
+    """
+
+    def __init__(self, folder, max_bytes = 2 * 1024**3):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+
+    def key(self, texts, settings):
+        """
+        Hashes a dataset and the settings of a vectorizer
+
+        texts (iterable over strings): texts of the dataset, in order
+        settings (dictionary): parameters of the vectorizer, as returned by its get_params
+        returns key (string)
+        """
+        digest = hashlib.sha1()
+        for text in texts:
+            digest.update(text.encode("utf-8") if isinstance(text, unicode) else text)
+            digest.update("\0")
+        digest.update(repr(sorted(settings.items())))
+        digest.update(sklearn.__version__)
+        return digest.hexdigest()
+
+
+    def filename(self, key):
+        """
+        Filename of a cached matrix
+
+        key (string): key as returned by the key method
+        returns full path
+        """
+        return os.path.join(self.folder, key + ".npz")
+
+
+    def get(self, key, tfidf):
+        """
+        Loads a cached matrix and restores the fitted state of the vectorizer
+
+        key (string): key as returned by the key method
+        tfidf (TfidfVectorizer): unfitted vectorizer with the settings the key was made with, fitted in place on a hit
+        returns sparse matrix, or None if it is not cached
+        """
+        filename = self.filename(key)
+        if not os.path.isfile(filename):
+            return None
+        with np.load(filename) as arrays:
+            X = sp.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), shape = tuple(arrays["shape"]))
+            terms = arrays["terms"].tostring().decode("utf-8").split("\n") if len(arrays["terms"]) else []
+            idf = arrays["idf"]
+
+        # The vocabulary and the idf weights are all a fitted vectorizer needs
+        tfidf.vocabulary_ = dict((term, col) for col, term in enumerate(terms))
+        tfidf.fixed_vocabulary_ = False
+        tfidf.stop_words_ = set()
+        set_idf(tfidf, idf)
+
+        # Mark as recently used
+        os.utime(filename, None)
+        return X
+
+
+    def put(self, key, X, tfidf):
+        """
+        Stores a matrix with the fitted state of its vectorizer, then evicts old matrices if the cache is too large
+
+        key (string): key as returned by the key method
+        X (sparse matrix): document-term matrix
+        tfidf (TfidfVectorizer): fitted vectorizer
+        returns nothing
+        """
+        X = X.tocsr()
+        terms = sorted(tfidf.vocabulary_, key = tfidf.vocabulary_.get)
+        filename = self.filename(key)
+        temporary = "{}.{}.{}.tmp.npz".format(filename[:-4], os.getpid(), threading.current_thread().ident)
+        np.savez(temporary, data = X.data, indices = X.indices, indptr = X.indptr, shape = np.array(X.shape), idf = tfidf.idf_,
+            terms = np.frombuffer("\n".join(terms).encode("utf-8"), dtype = np.uint8))
+        os.rename(temporary, filename)
+        self.evict()
+
+
+    def evict(self):
+        """
+        Deletes the least recently used matrices until all together fit into the maximal size
+
+        returns list of deleted filenames
+        """
+        files = sorted((os.path.getmtime(filename), os.path.getsize(filename), filename) for filename in glob.glob(os.path.join(self.folder, "*.npz")) if ".tmp." not in filename)
+        total = sum(size for mtime, size, filename in files)
+        deleted = []
+        for mtime, size, filename in files:
+            if total <= self.max_bytes:
+                break
+            os.remove(filename)
+            deleted.append(filename)
+            total -= size
+        return deleted
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Compact, memory-mappable model artifact holding only what inference needs: the vocabulary, the idf vector,
+the coefficient matrix, the intercepts and the label names
+(the same file is copied into the website folder, keep both versions identical)
+
+Layout of a model file (all numbers little-endian):
+
+    8 bytes     magic "RLYTMODL"
+    4 bytes     format version (uint32)
+    4 bytes     length of the json header (uint32)
+    header      json with the vectorizer and classifier settings and the dtype, shape and offset of every array
+    arrays      raw arrays, each starting at a multiple of 64 bytes
+"""
+
+# Imports
+import json
+import struct
+import numpy as np
+
+
+# Magic bytes and version of the on-disk layout, increase the version when the layout changes
+MAGIC = "RLYTMODL"
+FORMAT_VERSION = 1
+
+# Arrays start at multiples of this many bytes
+ALIGNMENT = 64
+
+# Settings of the Tfidf vectorizer that the model file cannot reproduce unless they have these values
+REQUIRED_SETTINGS = {"input": "content", "analyzer": "word", "preprocessor": None, "tokenizer": None, "strip_accents": None, "binary": False, "use_idf": True}
+
+
+def set_idf(tfidf, idf):
+    """
+    Sets the idf weights of a Tfidf vectorizer without fitting it. scikit-learn 0.20 and newer have a setter for them, the
+    older versions from 0.17 on (like the website's pinned one) keep them as diagonal matrix in the internal transformer
+
+    tfidf (TfidfVectorizer): vectorizer with a vocabulary
+    idf (numpy array): idf weight of each column
+    returns nothing
+    """
+    import sklearn
+    import scipy.sparse as sp
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    if TfidfVectorizer.idf_.fset is not None:
+        tfidf.idf_ = idf
+        return
+    if tuple(int(part) for part in sklearn.__version__.split(".")[:2]) < (0, 17):
+        raise ValueError("Setting the idf weights needs scikit-learn 0.17 or newer, not " + sklearn.__version__)
+    tfidf._tfidf._idf_diag = sp.spdiags(idf, diags = 0, m = len(idf), n = len(idf), format = "csr")
+
+
+def export_model(model, tfidf, filename, label_names = None):
+    """
+    Writes a fitted Logistic Regression model and its Tfidf vectorizer as model file
+
+    model (LogisticRegression): fitted classifier
+    tfidf (TfidfVectorizer): fitted text vectorizer
+    filename (string): full path of the model file
+    label_names (dictionary): names of the encoded labels
+    returns nothing
+    """
+    # Only what the inference engine does like the vectorizer can be exported
+    params = tfidf.get_params()
+    unsupported = sorted(name for name, value in REQUIRED_SETTINGS.items() if params.get(name, value) != value)
+    if unsupported:
+        raise ValueError("The model file cannot reproduce the vectorizer settings " + ", ".join("{}={!r}".format(name, params[name]) for name in unsupported))
+    if not hasattr(tfidf, "vocabulary_") or not hasattr(tfidf, "idf_"):
+        raise ValueError("Only fitted Tfidf vectorizers with a vocabulary can be exported")
+
+    # Terms ordered by their column, stored as one utf-8 blob with offsets
+    terms = sorted(tfidf.vocabulary_, key = tfidf.vocabulary_.get)
+    encoded = [term.encode("utf-8") if isinstance(term, unicode) else term for term in terms]
+    term_offsets = np.zeros(len(encoded) + 1, dtype = np.int64)
+    term_offsets[1:] = np.cumsum([len(term) for term in encoded])
+
+    # Which way the classifier turns decision values into probabilities
+    multi_class = getattr(model, "multi_class", "ovr")
+    if multi_class not in ["ovr", "multinomial"]:
+        multi_class = "multinomial" if model.solver != "liblinear" and len(model.classes_) > 2 else "ovr"
+
+    arrays = [("terms", np.frombuffer("".join(encoded), dtype = np.uint8)),
+              ("term_offsets", term_offsets),
+              ("idf", np.asarray(tfidf.idf_, dtype = np.float64)),
+              ("coef", np.ascontiguousarray(model.coef_, dtype = np.float64)),
+              ("intercept", np.asarray(model.intercept_, dtype = np.float64)),
+              ("classes", np.asarray(model.classes_, dtype = np.int64))]
+
+    # All stop words, as they are removed before the n-grams are formed (optional when reading, files written before they were
+    # recorded have none), and the n-gram range (files written before it was recorded are unigram models)
+    stop_words = sorted(tfidf.get_stop_words() or [])
+
+    header = {"vectorizer": {"lowercase": tfidf.lowercase, "token_pattern": tfidf.token_pattern, "norm": tfidf.norm, "sublinear_tf": tfidf.sublinear_tf, "stop_words": stop_words,
+                             "analyzer": tfidf.analyzer, "ngram_range": list(tfidf.ngram_range)},
+              "classifier": {"multi_class": multi_class},
+              "label_names": dict((str(key), value) for key, value in (label_names or {}).items()),
+              "arrays": {}}
+
+    # Offsets of the arrays relative to the start of the data section
+    offset = 0
+    for name, array in arrays:
+        header["arrays"][name] = {"dtype": array.dtype.newbyteorder("<").str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    # The data section starts aligned after the header
+    header_bytes = json.dumps(header, sort_keys = True)
+    start = -(-(16 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+    header_bytes += " " * (start - 16 - len(header_bytes))
+
+    with open(filename, "wb") as f:
+        f.write(MAGIC + struct.pack("<II", FORMAT_VERSION, len(header_bytes)) + header_bytes)
+        for name, array in arrays:
+            f.seek(start + header["arrays"][name]["offset"])
+            f.write(array.astype(array.dtype.newbyteorder("<")).tostring())
+        f.truncate(start + offset)
+
+
+
+class ModelFile(object):
+    """
+    Class that reads a model file, the arrays are memory-mapped read-only by default
+
+    filename (string): full path of the model file
+    mmap (boolean): If true, memory-map the arrays, otherwise read them into memory
+    """
+
+    def __init__(self, filename, mmap = True):
+        with open(filename, "rb") as f:
+            if f.read(8) != MAGIC:
+                raise ValueError("Not a model file: " + filename)
+            version, length = struct.unpack("<II", f.read(8))
+            if version != FORMAT_VERSION:
+                raise ValueError("Unsupported model file version {} in {}".format(version, filename))
+            self.header = json.loads(f.read(length))
+            start = 16 + length
+
+            # Map or read every array
+            self.arrays = {}
+            for name, spec in self.header["arrays"].items():
+                dtype, shape = np.dtype(str(spec["dtype"])), tuple(spec["shape"])
+                if mmap and np.prod(shape) > 0:
+                    self.arrays[name] = np.memmap(filename, dtype = dtype, mode = "r", offset = start + spec["offset"], shape = shape)
+                else:
+                    f.seek(start + spec["offset"])
+                    self.arrays[name] = np.fromstring(f.read(int(np.prod(shape)) * dtype.itemsize), dtype = dtype).reshape(shape)
+
+        # Label names with integer keys, as in the predictor's label dictionary
+        self.label_names = dict((int(key), value) for key, value in self.header["label_names"].items())
+        self.vocabulary_ = None
+
+
+    def terms(self):
+        """
+        Decodes the vocabulary terms
+
+        returns list of strings, ordered by their column
+        """
+        raw = self.arrays["terms"].tostring()
+        offsets = self.arrays["term_offsets"].tolist()
+        return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+    def vocabulary(self):
+        """
+        Maps every term to its column, built once on first use
+
+        returns dictionary
+        """
+        if self.vocabulary_ is None:
+            self.vocabulary_ = dict((term, idx) for idx, term in enumerate(self.terms()))
+        return self.vocabulary_
+
+
+    def vectorizer(self):
+        """
+        Rebuilds a Tfidf vectorizer for transforming texts, without any pickling
+
+        returns TfidfVectorizer
+        """
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        settings = self.header["vectorizer"]
+        tfidf = TfidfVectorizer(vocabulary = self.vocabulary(), lowercase = settings["lowercase"], token_pattern = settings["token_pattern"], norm = settings["norm"], sublinear_tf = settings["sublinear_tf"],
+            stop_words = settings.get("stop_words") or None, analyzer = settings.get("analyzer", "word"), ngram_range = tuple(settings.get("ngram_range", [1, 1])))
+        tfidf.vocabulary_ = tfidf.vocabulary
+        tfidf.fixed_vocabulary_ = True
+        set_idf(tfidf, np.array(self.arrays["idf"]))
+        return tfidf
+
+
+    def classifier(self):
+        """
+        Rebuilds the Logistic Regression classifier for predictions, without any pickling
+
+        returns LogisticRegression
+        """
+        from sklearn.linear_model import LogisticRegression
+
+        model = LogisticRegression(multi_class = self.header["classifier"]["multi_class"])
+        model.coef_ = self.arrays["coef"]
+        model.intercept_ = self.arrays["intercept"]
+        model.classes_ = np.asarray(self.arrays["classes"])
+        return model
@@ -7,9 +7,9 @@ September 2015
 """
 
 # Imports
+import os
 import sys
 import pickle
-import tweepy
 import urllib2
 import httplib
 import json
@@ -22,6 +22,16 @@ from apikeyspath import NYT_TOP_STORIES_KEY
 from apikeyspath import TW_TOKEN_KEY, TW_TOKEN, TW_CON_SECRET_KEY, TW_CON_SECRET
 from apikeyspath import PATH_TO_REPO
 
+# Text cleaning and fast model loading
+from tokenizer import Tokenizer
+from modelfile import ModelFile
+from inference import InferenceEngine
+from topstories import TopStoriesCache
+from ranking import ArticleIndex
+from archiveindex import ArchiveIndex
+from tweetcache import TweetCache
+from timeline import TimelineFetcher
+
 
 
 class Predictor(object):
@@ -30,12 +40,20 @@ class Predictor(object):
 
     model_pickle (pickle): Pickled Logistic Regression model
     tfidf_pickle (pickle): Pickled Tfidf text vectorizer
+    tweet_folder (string): Folder in which the users' cleaned tweets are stored, by default they are only kept in memory
+    archive (string): Folder name of the nearest neighbor index of the article archive in the data folder (see archiveindex.py), by default there is none
     """
 
-    def __init__(self, model_pickle, tfidf_pickle, stopwords_pickle):
-        # Load the model, the text vectorizer, and the stopwords
-        self.model = pickle.load(open(PATH_TO_REPO + "data/" + model_pickle))
-        self.tfidf = pickle.load(open(PATH_TO_REPO + "data/" + tfidf_pickle))
+    def __init__(self, model_pickle, tfidf_pickle, stopwords_pickle, model_file = None, tweet_folder = None, archive = None):
+        # Load the model and the text vectorizer. From the memory-mapped model file if there is one, which is then scored by the fused
+        # inference engine without scikit-learn, otherwise unpickle them. Then load the stopwords
+        if model_file is not None:
+            self.engine = InferenceEngine(ModelFile(PATH_TO_REPO + "data/" + model_file))
+            self.model, self.tfidf = None, None
+        else:
+            self.engine = None
+            self.model = pickle.load(open(PATH_TO_REPO + "data/" + model_pickle))
+            self.tfidf = pickle.load(open(PATH_TO_REPO + "data/" + tfidf_pickle))
         self.stopwords = pickle.load(open(PATH_TO_REPO + "data/" + stopwords_pickle))
 
         # Label dictionary for nice categories
@@ -45,15 +63,21 @@ class Predictor(object):
         self.label_dict_NYT = {0: "arts", 1: "business", 2: "dining", 3: "health", 4: "nyregion", 5: "politics", 6: "realestate", 7: "science", \
              8: "sports", 9: "fashion", 10: "technology", 11: "travel", 12: "national", 13: "world"}
 
-        # Set up the Twitter access
-        auth = tweepy.OAuthHandler(TW_CON_SECRET_KEY, TW_CON_SECRET)
-        auth.set_access_token(TW_TOKEN_KEY, TW_TOKEN)
+        # Set up the Twitter access, fetching whole timelines in pages of 200 tweets and keeping track of the rate limit
+        self.timeline = TimelineFetcher(TW_CON_SECRET_KEY, TW_CON_SECRET, TW_TOKEN_KEY, TW_TOKEN, page_size = 200)
+
+        # Tokenizers that clean all non alphabetic characters and single letters. For tweets, also remove the "RT", which all retweets have, and for articles the stopwords
+        self.tweet_tokenizer = Tokenizer(stopwords = ["RT"])
+        self.article_tokenizer = Tokenizer(stopwords = self.stopwords)
+
+        # Top stories per section, tokenized once into an index for ranking them, kept for ten minutes and refreshed in the background
+        self.topstories = TopStoriesCache(api_key = NYT_TOP_STORIES_KEY, ttl = 600, transform = lambda articles: ArticleIndex(articles, self.article_tokenizer))
 
-        # Set up the Twitter API
-        self.api = tweepy.API(auth)
+        # Latest cleaned tweets of each user, so that returning users only need their new tweets to be fetched
+        self.tweetcache = TweetCache(max_users = 1000, folder = tweet_folder)
 
-        # Helper list of all single alphabetic letters
-        self.singleletters = [chr(i) for i in range(97,123)] + [chr(i).upper() for i in range(97,123)]
+        # All scraped articles, to recommend from the archive and not only from the current top stories
+        self.archive = ArchiveIndex(PATH_TO_REPO + "data/" + archive) if archive is not None else None
 
 
     def fetch_tweets(self, user, number_of_tweets):
@@ -64,18 +88,27 @@ class Predictor(object):
         number_of_tweets (int): Number of latest tweets to be read and then used for recommendation
         returns list of tweets
         """
-        # List of tweets to be filled
-        tweets = []
+        # Tweets we already know, only use them if there are enough or if they are the user's whole timeline
+        known = self.tweetcache.get(user)
+        if known is not None and len(known) < number_of_tweets and not self.tweetcache.complete(user):
+            known = None
+
+        # If the rate limit is nearly used up, keep the remaining requests for new users and serve the known tweets as they are
+        if known is not None and self.timeline.low(reserve = 10):
+            return [text for tweet_id, text in known[:number_of_tweets]]
+
+        # Get only the tweets newer than the known ones, or all of them
+        statuses = self.timeline.fetch(user, number_of_tweets, since_id = known[0][0] if known is not None else None)
+
+        # Clean the new ones from non-alphabetic characters, the "RT" and single character words, and merge them with the known ones
+        tweets = zip([tweet_id for tweet_id, text in statuses], self.tweet_tokenizer.clean_batch([text for tweet_id, text in statuses]))
 
-        # Get the tweets and clean them from non-alphabetic characters. Also, remove the "RT", which all retweets have. Furthermore, remove singe character words
-        for status in tweepy.Cursor(self.api.user_timeline, id=user).items(number_of_tweets):
-            text = status.text
-            wordlist = "".join( [char if char in self.singleletters else " " for char in text] ).split()
-            cleanwordlist = [word for word in wordlist if word not in self.singleletters + ["RT"]]
-            tweets.append(" ".join(cleanwordlist))
+        # Fewer tweets than asked for means that the whole timeline is known, since the known ones were either all of it or enough
+        tweets = (tweets + (known or []))[:number_of_tweets]
+        self.tweetcache.put(user, tweets, complete = len(tweets) < number_of_tweets)
 
         # Return the tweet list
-        return tweets
+        return [text for tweet_id, text in tweets]
 
 
     def predict_class(self, tweets, number_of_classes):
@@ -86,11 +119,12 @@ class Predictor(object):
         number_of_classes (int): Number of classes to be recommended (It does not make much sense though, to recommend more than two or maximally three classes, beyond that it's pretty random)
         returns sorted list of most probable classes
         """
-        # Vectorize tweets
-        vec_tweets = self.tfidf.transform(tweets)
-
-        # Predict label for each tweet
-        pred = self.model.predict(vec_tweets)
+        # Predict label for each tweet, either in one pass with the inference engine or by vectorizing the tweets first
+        if self.engine is not None:
+            pred = self.engine.predict(tweets)[0]
+        else:
+            vec_tweets = self.tfidf.transform(tweets)
+            pred = self.model.predict(vec_tweets)
 
         # Return most common labels
         try:
@@ -104,15 +138,86 @@ class Predictor(object):
         return returnlist
 
 
-    def recommend_article(self, tweets, labels):
+    def predict_sections(self, tweets, number_of_sections):
+        """
+        Predicts the sections of the New York Times the user may be interested in, by averaging the class probabilities
+        of all tweets into one distribution for the user (unlike predict_class, this never has too few sections)
+
+        tweets (list of strings): Aggregated tweets, each in one string
+        number_of_sections (int): Number of sections to be recommended
+        returns list of tuples of (encoded label, probability), most probable first
+        """
+        if not tweets:
+            raise ValueError("There are no tweets to predict sections from")
+
+        # Class probabilities of each tweet
+        if self.engine is not None:
+            probabilities = self.engine.predict_proba(self.engine.predict(tweets)[1])
+            classes = self.engine.classes
+        else:
+            probabilities = self.model.predict_proba(self.tfidf.transform(tweets))
+            classes = self.model.classes_
+
+        # Average over the tweets and take the sections with the most probability mass
+        distribution = probabilities.mean(axis = 0)
+        ranked = np.argsort(-distribution, kind = "mergesort")[:number_of_sections]
+        return [(int(classes[idx]), float(distribution[idx])) for idx in ranked]
+
+
+    def recommend_sections(self, tweets, sections, number_of_articles = 3):
+        """
+        Recommends NYT articles from several sections at once. The sections are fetched in parallel, and the articles
+        of all of them are merged into one ranking by their Jaccard similarity weighted with the section's probability
+
+        tweets (list of strings): Aggregated tweets in one string
+        sections (list of tuples): (encoded label, probability) as returned by predict_sections
+        number_of_articles (int): Number of articles to be recommended in total
+        returns list of tuples of (section, title, abstract, url, score), best first
+        """
+        # Start fetching all sections at the same time (cached sections are not fetched again)
+        for label, probability in sections:
+            self.topstories.prefetch(self.label_dict_NYT[label])
+
+        # Split tweets into individual words and remove stopwords
+        tweetwordlist = [word for tweet in tweets for word in tweet.split() if word not in self.article_tokenizer.stopwords]
+
+        # Best articles of each section, a section that cannot be fetched is left out
+        candidates = []
+        for label, probability in sections:
+            try:
+                index = self.topstories.get(self.label_dict_NYT[label])
+            except Exception, e:
+                print "Fetching the top stories of " + self.label_dict_NYT[label] + " failed: " + str(e)
+                continue
+            for recommended, distance in index.top_k(tweetwordlist, k = number_of_articles):
+                candidates.append((probability * (1.0 - distance), self.label_dict[label], index.articles[recommended]))
+
+        # Merge into one ranking, articles that are in several sections only appear once
+        recommendations, urls = [], set()
+        for score, section, article in sorted(candidates, key = lambda candidate: -candidate[0]):
+            if article["url"] not in urls and len(recommendations) < number_of_articles:
+                urls.add(article["url"])
+                recommendations.append((section, HTMLParser().unescape(article["title"]), HTMLParser().unescape(article["abstract"]), article["url"], score))
+        return recommendations
+
+
+    def recommend_article(self, tweets, labels, number_of_articles = 1):
         """
         Recommend a NYT article based on the provided label
 
         labels (iterable over ints): encoded labels of sections to be used for recommendation
         tweets (list of strings): Aggregated tweets in one string
+        number_of_articles (int): Number of articles to be recommended per section
         returns nothing
         """
 
+        # Split tweets into individual words and remove stopwords
+        tweetwordlist = [word for tweet in tweets for word in tweet.split() if word not in self.article_tokenizer.stopwords]
+
+        # Start fetching all sections at the same time
+        for label in labels:
+            self.topstories.prefetch(self.label_dict_NYT[label])
+
         # Set counter and get recommendation for all passed labels
         counter = 0
         for label in labels:
@@ -120,43 +225,17 @@ class Predictor(object):
             # Increment counter (just for the printing part...)
             counter += 1
 
-            # Get the top stories from the section, this should yield usually 30 artices
-            request_url = "https://api.nytimes.com/svc/topstories/v2/" + self.label_dict_NYT[label] + ".json?api-key=" + NYT_TOP_STORIES_KEY
+            # Get the index of the top stories from the section (cached for a while, see topstories.py), this should yield usually 30 artices
             try:
-                response = urllib2.urlopen(request_url).read()
+                index = self.topstories.get(self.label_dict_NYT[label])
             except urllib2.HTTPError, e:
                 print "Error code: " + str(e.code)
                 print "Error message: " + e.msg
                 print "Error hdrs:\n" + str(e.hdrs)
                 sys.exit()
 
-            # Load json response into python dictionary and randomly choose an article
-            articles = json.loads(response)
-
-            # List of Jaccard distances between articles and tweets
-            jaccarddistances = []
-
-            # Split tweets into individual words and remove stopwords
-            tweetwordlist = [word for tweet in tweets for word in tweet.split() if word not in self.stopwords]
-
-            # Loop over all articles and calculate closest article to user's tweets based on Jaccard distance
-            for idx in range(articles["num_results"]):
-
-                # Use all possible informations we have about the article and feed into long string
-                wordstring = " ".join([articles["results"][idx]["title"], articles["results"][idx]["abstract"], articles["results"][idx]["section"], articles["results"][idx]["subsection"], " ".join([string for string in articles["results"][idx]["des_facet"]]), " ".join([string for string in articles["results"][idx]["org_facet"]]), " ".join([string for string in articles["results"][idx]["per_facet"]])])
-
-                # Clean all numbers, punktuation and everything else apart from alphabetic characters. Also remove single character words and stopwords
-                wordlist = "".join( [char if char in self.singleletters else " " for char in wordstring] ).split()
-                cleanwordlist = [word for word in wordlist if word not in self.singleletters + self.stopwords]
-
-                # Remove stopwords and calculate Jaccard distances and append to list
-                jaccarddistances.append(self.jaccard_dist(tweetwordlist, cleanwordlist))
-
-            # Argsort
-            argsortedarray = np.argsort(jaccarddistances)
-
-            # Recommend closest article
-            recommended = argsortedarray[0]
+            # Rank all articles by their Jaccard distance to the user's tweets in one go and recommend the closest ones
+            ranking = index.top_k(tweetwordlist, k = number_of_articles)
 
             # Make some variety in the sentences...
             sentencestarts = ["You are probably", "It seems like you are also", "However, you are possibly also", "Furthermore, you could even be"]
@@ -167,9 +246,34 @@ class Predictor(object):
             else:
                 print sentencestarts[counter-1] + " interested in the topic: " + self.label_dict[label]
             print "Maybe you find the following article from this topic interesting...\n"
-            print "TITLE:\n" + HTMLParser().unescape(articles["results"][recommended]["title"]) + "\n"
-            print "ABSTRACT:\n" + HTMLParser().unescape(articles["results"][recommended]["abstract"]) + "\n"
-            print "URL:\n" + HTMLParser().unescape(articles["results"][recommended]["url"]) + "\n\n"
+            for recommended, distance in ranking:
+                print "TITLE:\n" + HTMLParser().unescape(index.articles[recommended]["title"]) + "\n"
+                print "ABSTRACT:\n" + HTMLParser().unescape(index.articles[recommended]["abstract"]) + "\n"
+                print "URL:\n" + HTMLParser().unescape(index.articles[recommended]["url"]) + "\n\n"
+
+
+    def recommend_archive(self, tweets, labels = None, number_of_articles = 3):
+        """
+        Recommends the articles of the archive with the smallest Jaccard distance to the tweets, found approximately by the archive index:
+        the search takes about the same time for any size of the archive, but finds fewer of the closest articles the larger the archive
+        is (recall of the top 10 was 0.97 with 100k articles and 0.89 with 200k, see archiveindex.py)
+
+        tweets (list of strings): Aggregated tweets in one string
+        labels (iterable over ints): encoded labels of the sections to recommend from, by default all
+        number_of_articles (int): Number of articles to be recommended
+        returns list of tuples of (section, title, abstract, url, distance), closest first
+        """
+        if self.archive is None:
+            raise ValueError("The predictor was made without an archive index")
+
+        # Split tweets into individual words and remove stopwords
+        tweetwordlist = [word for tweet in tweets for word in tweet.split() if word not in self.article_tokenizer.stopwords]
+
+        recommendations = []
+        for recommended, distance in self.archive.top_k(tweetwordlist, k = number_of_articles, labels = labels):
+            info = self.archive.info(recommended)
+            recommendations.append((self.label_dict[int(self.archive.labels[recommended])], HTMLParser().unescape(info["title"]), HTMLParser().unescape(info["abstract"]), info["url"], distance))
+        return recommendations
 
 
     def jaccard_dist(self, list1, list2):
@@ -196,18 +300,38 @@ def main():
     """
     Main function
     """
-    # Make predictor class, fetch tweets, predict_class
-    MyPredictor = Predictor(model_pickle = "log_regression_model.pkl", tfidf_pickle = "tfidf_vectorizer.pkl", stopwords_pickle = "stopwords.pkl")
+    # Make predictor class (with the archive index if datapreparation.py built one), fetch tweets, predict_class
+    MyPredictor = Predictor(model_pickle = "log_regression_model.pkl", tfidf_pickle = "tfidf_vectorizer.pkl", stopwords_pickle = "stopwords.pkl", model_file = "model.bin",
+        archive = "archive" if os.path.isdir(PATH_TO_REPO + "data/archive") else None)
 
     # Fetch the tweets with command line input as twitter handle
     tweets = MyPredictor.fetch_tweets(user = '{}'.format(sys.argv[1]), number_of_tweets = 100)
 
+    # With a number of sections as second command line input, recommend from that many sections by their probabilities
+    if len(sys.argv) > 2:
+        sections = MyPredictor.predict_sections(tweets = tweets, number_of_sections = int(sys.argv[2]))
+        print "Your sections: " + ", ".join([MyPredictor.label_dict[label] + " ({:.0%})".format(probability) for label, probability in sections]) + "\n"
+        for section, title, abstract, url, score in MyPredictor.recommend_sections(tweets = tweets, sections = sections, number_of_articles = 3):
+            print "SECTION: " + section + "\n"
+            print "TITLE:\n" + title + "\n"
+            print "ABSTRACT:\n" + abstract + "\n"
+            print "URL:\n" + url + "\n\n"
+        return
+
     # Predict the label
     labels = MyPredictor.predict_class(tweets = tweets, number_of_classes = 1)
 
     # Recommend an article
     MyPredictor.recommend_article(tweets = tweets, labels = labels)
 
+    # And the closest articles of the same section from the archive
+    if MyPredictor.archive is not None:
+        print "From the archive of this topic...\n"
+        for section, title, abstract, url, distance in MyPredictor.recommend_archive(tweets = tweets, labels = labels, number_of_articles = 3):
+            print "TITLE:\n" + title + "\n"
+            print "ABSTRACT:\n" + abstract + "\n"
+            print "URL:\n" + url + "\n\n"
+
 
 
 if __name__ == '__main__':
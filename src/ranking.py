@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Ranking of a section's top stories by their Jaccard distance to the user's tweets
+(the same file is copied into the website folder, keep both versions identical)
+"""
+
+# Imports
+import numpy as np
+import scipy.sparse as sp
+
+
+def article_text(article):
+    """
+    Uses all possible informations we have about an article and feeds them into one long string
+
+    article (dictionary): article as returned by the NYT Top Stories API
+    returns string
+    """
+    return " ".join([article["title"], article["abstract"], article["section"], article["subsection"], " ".join([string for string in article["des_facet"]]), " ".join([string for string in article["org_facet"]]), " ".join([string for string in article["per_facet"]])])
+
+
+
+class ArticleIndex(object):
+    """
+    Class that tokenizes the articles of a Top Stories response once and keeps their word sets as binary sparse
+    matrix (one row per article, one column per word), so that all articles are scored against a user in one go
+
+    articles (dictionary): response of the NYT Top Stories API
+    tokenizer (Tokenizer): cleans the article texts, including the removal of stopwords
+    """
+
+    def __init__(self, articles, tokenizer):
+        self.articles = articles["results"][:articles["num_results"]]
+
+        # Word sets of all articles and the vocabulary of all their words
+        wordsets = [set(tokenizer.tokenize(article_text(article))) for article in self.articles]
+        self.vocabulary = {}
+        for wordset in wordsets:
+            for word in wordset:
+                self.vocabulary.setdefault(word, len(self.vocabulary))
+
+        # Binary article-word matrix and the size of each word set
+        cols = [self.vocabulary[word] for wordset in wordsets for word in wordset]
+        indptr = np.r_[0, np.cumsum([len(wordset) for wordset in wordsets])]
+        self.matrix = sp.csr_matrix((np.ones(len(cols)), cols, indptr), shape = (len(wordsets), len(self.vocabulary)))
+        self.sizes = np.diff(indptr).astype(np.float64)
+
+
+    def distances(self, words):
+        """
+        Computes the Jaccard distances between a list of words and all articles
+
+        words (list of strings): the user's words
+        returns numpy array with one distance per article
+        """
+        wordset = set(words)
+
+        # Intersections with all articles in one sparse product, words not in any article cannot intersect
+        query = np.zeros(len(self.vocabulary))
+        query[[self.vocabulary[word] for word in wordset if word in self.vocabulary]] = 1.0
+        intersect = self.matrix.dot(query)
+
+        # Similarity is the intersect divided by the union, converted to a distance (empty sets have distance one)
+        union = self.sizes + len(wordset) - intersect
+        return 1.0 - np.divide(intersect, union, out = np.zeros(len(union)), where = union > 0)
+
+
+    def top_k(self, words, k = 1):
+        """
+        Ranks the articles by their Jaccard distance to a list of words
+
+        words (list of strings): the user's words
+        k (int): number of articles to be returned
+        returns list of tuples of (article index, distance), closest first
+        """
+        distances = self.distances(words)
+        ranked = np.argsort(distances, kind = "mergesort")[:k]
+        return [(int(idx), float(distances[idx])) for idx in ranked]
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Persistent cache of API responses, addressed by a hash of the normalized request without the API key, and a checkpoint
+of finished work, so that interrupted or repeated scrapes only fetch what is missing
+"""
+
+# Imports
+import os
+import gzip
+import json
+import hashlib
+import urllib
+import urlparse
+import threading
+
+
+def atomic_write(filename, data, compress = False):
+    """
+    Writes a file via a temporary file, so that a crash never leaves a broken file behind
+
+    filename (string): full path
+    data (string): content
+    compress (boolean): If true, the file is gzip-compressed
+    returns nothing
+    """
+    temporary = "{}.{}.{}.tmp".format(filename, os.getpid(), threading.current_thread().ident)
+    with (gzip.open(temporary, "wb") if compress else open(temporary, "wb")) as f:
+        f.write(data)
+    os.rename(temporary, filename)
+
+
+
+class ResponseCache(object):
+    """
+    Class that keeps response bodies on disc, one gzipped file per request. Requests are normalized first: the parameters
+    that do not change the response (like the API key) are dropped and the remaining ones sorted, so the same page is
+    found again whatever key or parameter order it was requested with
+
+    folder (string): folder for the cached responses
+    ignore (iterable over strings): query parameters that are not part of the key
+    """
+
+    def __init__(self, folder, ignore = ("api-key",)):
+        self.folder = folder
+        self.ignore = frozenset(ignore)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        # Counters
+        self.lock = threading.Lock()
+        self.hits, self.misses, self.writes = 0, 0, 0
+
+
+    def normalize(self, url):
+        """
+        Normalizes a request url
+
+        url (string): request url
+        returns url without the ignored parameters, with sorted parameters and lowercase scheme and host
+        """
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+        params = sorted((name, value) for name, value in urlparse.parse_qsl(query, keep_blank_values = True) if name not in self.ignore)
+        return urlparse.urlunsplit((scheme.lower(), netloc.lower(), path, urllib.urlencode(params), ""))
+
+
+    def filename(self, url):
+        """
+        Filename of the cached response of a request, in subfolders by the first two characters of the hash
+
+        url (string): request url
+        returns full path
+        """
+        key = hashlib.sha1(self.normalize(url)).hexdigest()
+        return os.path.join(self.folder, key[:2], key + ".gz")
+
+
+    def get(self, url):
+        """
+        Gets the cached response of a request
+
+        url (string): request url
+        returns response body (string), or None if it is not cached
+        """
+        filename = self.filename(url)
+        if not os.path.isfile(filename):
+            with self.lock:
+                self.misses += 1
+            return None
+        with gzip.open(filename, "rb") as f:
+            body = f.read()
+        with self.lock:
+            self.hits += 1
+        return body
+
+
+    def put(self, url, body):
+        """
+        Stores the response of a request
+
+        url (string): request url
+        body (string): response body
+        returns nothing
+        """
+        filename = self.filename(url)
+        if not os.path.isdir(os.path.dirname(filename)):
+            try:
+                os.makedirs(os.path.dirname(filename))
+            except OSError:
+                # Another thread made it in the meantime
+                pass
+        atomic_write(filename, body, compress = True)
+        with self.lock:
+            self.writes += 1
+
+
+
+class Checkpoint(object):
+    """
+    Class that remembers which pieces of work are finished, in a json file that is rewritten after every piece
+
+    filename (string): full path of the checkpoint file
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.finished = set()
+        if os.path.isfile(filename):
+            with open(filename) as f:
+                self.finished = set(json.load(f))
+
+
+    def done(self, name):
+        """
+        Checks whether a piece of work is finished
+
+        name (string): name of the piece of work
+        returns boolean
+        """
+        return name in self.finished
+
+
+    def mark(self, name):
+        """
+        Marks a piece of work as finished
+
+        name (string): name of the piece of work
+        returns nothing
+        """
+        self.finished.add(name)
+        atomic_write(self.filename, json.dumps(sorted(self.finished)))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Helpers for reading the scraped article shards ("Articles_<section>_start<begin>_end<end>.json", or streamed as ".jsonl" / ".jsonl.gz")
+without loading them all at once
+"""
+
+# Imports
+import glob
+import gzip
+import json
+import random
+
+
+# All sections in the order of their encoded labels
+SECTIONS = ["Arts", "Business", "Food", "Health", "NY", "Politics", "RealEstate", "Science", "Sports", "Style", "Tech", "Travel", "US", "World"]
+
+
+def find_shards(folder, section):
+    """
+    Finds all shards of a section
+
+    folder (string): full path of the folder in which to look for the datafiles
+    section (string): section name as used in the filenames
+    returns sorted list of filenames
+    """
+    return sorted(glob.glob(folder + "/Articles_" + section + "_*.json") + glob.glob(folder + "/Articles_" + section + "_*.jsonl") + glob.glob(folder + "/Articles_" + section + "_*.jsonl.gz"))
+
+
+def iter_articles(filename):
+    """
+    Iterates over the articles of one shard. Newline-delimited shards are read line by line,
+    json shards are loaded at once (a shard holds at most 100 pages with 10 articles each)
+
+    filename (string): full path of the shard
+    returns generator over article dictionaries
+    """
+    # Json list
+    if filename.endswith(".json"):
+        with open(filename) as f:
+            articles = json.load(f)
+        for article in articles:
+            yield article
+        return
+
+    # Newline-delimited json, possibly compressed
+    with (gzip.open(filename) if filename.endswith(".gz") else open(filename)) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_section(folder, section):
+    """
+    Iterates over the cleaned text of all articles of a section, one shard after the other
+
+    folder (string): full path of the folder in which to look for the datafiles
+    section (string): section name as used in the filenames
+    returns generator over strings
+    """
+    for filename in find_shards(folder, section):
+        for article in iter_articles(filename):
+            # Skip articles without words, as the data cleaning does
+            allwords = article.get("allwords")
+            if allwords:
+                yield allwords
+
+
+def iter_chunks(folder, chunksize, seed = 0):
+    """
+    Iterates over all articles in chunks of bounded size. The sections are interleaved so that every chunk contains all classes,
+    only one shard per section is held in memory at any time
+
+    folder (string): full path of the folder in which to look for the datafiles
+    chunksize (int): maximal number of articles per chunk
+    seed (int): seed for shuffling the articles within each chunk
+    returns generator over tuples of (list of strings, list of labels)
+    """
+    rng = random.Random(seed)
+    iterators = dict((label, iter_section(folder, section)) for label, section in enumerate(SECTIONS))
+    chunk = []
+
+    # Take one article of each section in turn until all sections are exhausted
+    while iterators:
+        for label in sorted(iterators.keys()):
+            try:
+                chunk.append((next(iterators[label]), label))
+            except StopIteration:
+                del iterators[label]
+                continue
+
+            # Hand out full chunks
+            if len(chunk) == chunksize:
+                rng.shuffle(chunk)
+                yield [text for text, _ in chunk], [label_ for _, label_ in chunk]
+                chunk = []
+
+    # And the remainder
+    if chunk:
+        rng.shuffle(chunk)
+        yield [text for text, _ in chunk], [label_ for _, label_ in chunk]
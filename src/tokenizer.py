@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Tokenizer shared by the article scraper and the predictors
+(the same file is copied into the website folder, keep both versions identical)
+"""
+
+# Imports
+import re
+
+
+# Runs of at least two alphabetic ASCII letters. Everything else (numbers, punctuation, non-ASCII characters)
+# separates words and single letters are dropped, exactly like the old character-by-character cleaning did
+WORD_PATTERN = re.compile(r"[A-Za-z]{2,}")
+
+
+class Tokenizer(object):
+    """
+    Class that cleans text down to alphabetic words and removes unwanted words
+
+    stopwords (iterable of strings): words to be removed after cleaning (matched case-sensitively)
+    """
+
+    def __init__(self, stopwords = ()):
+        # Frozenset for constant time lookups
+        self.stopwords = frozenset(stopwords)
+
+
+    def tokenize(self, text):
+        """
+        Splits a text into clean words
+
+        text (string): raw text
+        returns list of words
+        """
+        # Only filter if there is something to filter
+        if not self.stopwords:
+            return WORD_PATTERN.findall(text)
+        return [word for word in WORD_PATTERN.findall(text) if word not in self.stopwords]
+
+
+    def clean(self, text):
+        """
+        Cleans a text and joins the remaining words with single spaces
+
+        text (string): raw text
+        returns cleaned string
+        """
+        return " ".join(self.tokenize(text))
+
+
+    def tokenize_batch(self, texts):
+        """
+        Splits a list of texts into clean words
+
+        texts (list of strings): raw texts
+        returns list of lists of words
+        """
+        return [self.tokenize(text) for text in texts]
+
+
+    def clean_batch(self, texts):
+        """
+        Cleans a list of texts
+
+        texts (list of strings): raw texts
+        returns list of cleaned strings
+        """
+        return [" ".join(words) for words in self.tokenize_batch(texts)]
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Cache for the NYT Top Stories of each section, so that most requests do not need to call the API
+(the same file is copied into the website folder, keep both versions identical)
+"""
+
+# Imports
+import time
+import json
+import urllib2
+import threading
+from collections import OrderedDict
+
+
+class TopStoriesCache(object):
+    """
+    Class that keeps the Top Stories per section for a while. Fresh entries are served directly, stale entries are served
+    while a background thread refreshes them, and only missing or too old entries are fetched on the request thread.
+    Concurrent requests for the same missing section fetch it only once
+
+    api_key (string): key for the NYT Top Stories API
+    ttl (float): seconds for which an entry is fresh
+    max_stale (float): seconds after the ttl for which a stale entry may still be served while it is refreshed
+    max_size (int): maximal number of sections kept, the least recently used one is dropped first
+    transform (function): if given, applied once to every fetched response (a dictionary) and its result is cached instead
+    base_url (string): url of the Top Stories API, the section and ".json" are appended
+    timeout (float): timeout in seconds for each request, a fetch holds the lock of its section, so it must not hang
+    """
+
+    def __init__(self, api_key, ttl = 600, max_stale = 3600, max_size = 32, transform = None, base_url = "https://api.nytimes.com/svc/topstories/v2/", timeout = 10.0):
+        self.api_key = api_key
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_size = max_size
+        self.transform = transform
+        self.base_url = base_url
+        self.timeout = timeout
+
+        # Entries as section -> (time of fetching, value), in order of their last use
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.section_locks = {}
+        self.refreshing = set()
+
+        # Counters
+        self.hits, self.stale_hits, self.misses, self.fetches, self.errors, self.prefetches = 0, 0, 0, 0, 0, 0
+
+
+    def fetch(self, section):
+        """
+        Fetches the Top Stories of a section from the API
+
+        section (string): section as used by the Top Stories API
+        returns response as dictionary (or as transformed)
+        """
+        request_url = self.base_url + section + ".json?api-key=" + self.api_key
+        articles = json.loads(urllib2.urlopen(request_url, timeout = self.timeout).read())
+        with self.lock:
+            self.fetches += 1
+        return self.transform(articles) if self.transform is not None else articles
+
+
+    def load(self, section):
+        """
+        Fetches a section and stores it, unless another thread has just done so
+
+        section (string): section as used by the Top Stories API
+        returns cached value
+        """
+        with self.lock:
+            section_lock = self.section_locks.setdefault(section, threading.Lock())
+
+        with section_lock:
+            # Someone else may have fetched the section while we were waiting
+            with self.lock:
+                entry = self.entries.get(section)
+                if entry is not None and time.time() - entry[0] < self.ttl:
+                    return entry[1]
+
+            value = self.fetch(section)
+
+            # Store, and drop the least recently used sections if there are too many
+            with self.lock:
+                self.entries.pop(section, None)
+                self.entries[section] = (time.time(), value)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last = False)
+            return value
+
+
+    def refresh(self, section):
+        """
+        Refreshes a section in the background, keeping the stale entry if this fails
+
+        section (string): section as used by the Top Stories API
+        returns nothing
+        """
+        try:
+            self.load(section)
+        except Exception, e:
+            with self.lock:
+                self.errors += 1
+            print "Refreshing the top stories of " + section + " failed: " + str(e)
+        finally:
+            with self.lock:
+                self.refreshing.discard(section)
+
+
+    def prefetch(self, section):
+        """
+        Starts fetching a section in the background if it is not fresh, so that a later get finds it (or waits for it)
+
+        section (string): section as used by the Top Stories API
+        returns nothing
+        """
+        with self.lock:
+            entry = self.entries.get(section)
+            if (entry is not None and time.time() - entry[0] < self.ttl) or section in self.refreshing:
+                return
+            self.refreshing.add(section)
+            self.prefetches += 1
+        thread = threading.Thread(target = self.refresh, args = (section,))
+        thread.daemon = True
+        thread.start()
+
+
+    def get(self, section):
+        """
+        Gets the Top Stories of a section
+
+        section (string): section as used by the Top Stories API
+        returns response as dictionary (or as transformed)
+        """
+        with self.lock:
+            entry = self.entries.pop(section, None)
+            if entry is not None:
+                # Mark as recently used
+                self.entries[section] = entry
+                age = time.time() - entry[0]
+
+                # Fresh
+                if age < self.ttl:
+                    self.hits += 1
+                    return entry[1]
+
+                # Stale, but still good enough while it is refreshed
+                if age < self.ttl + self.max_stale:
+                    self.stale_hits += 1
+                    if section not in self.refreshing:
+                        self.refreshing.add(section)
+                        thread = threading.Thread(target = self.refresh, args = (section,))
+                        thread.daemon = True
+                        thread.start()
+                    return entry[1]
+
+            self.misses += 1
+
+        # Missing or too old
+        try:
+            return self.load(section)
+        except Exception:
+            with self.lock:
+                self.errors += 1
+            raise
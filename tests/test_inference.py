@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Tests that the fused inference engine predicts exactly like the pickled scikit-learn vectorizer and model it was exported from
+(run with python -m unittest discover tests)
+"""
+
+# Imports
+import os
+import sys
+import gzip
+import json
+import pickle
+import random
+import shutil
+import tempfile
+import unittest
+import warnings
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+# The modules under test live in the src folder, the model artifacts in the data folder
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPO, "src"))
+from modelfile import export_model, ModelFile
+from inference import InferenceEngine
+
+
+def load_texts():
+    """
+    Loads the tweets of the benchmark fixtures with one of five labels per user
+
+    returns tuple of (list of texts, list of labels)
+    """
+    with gzip.open(os.path.join(REPO, "benchmarks", "fixtures", "timelines.json.gz")) as f:
+        timelines = json.load(f)
+    texts, labels = [], []
+    for idx, user in enumerate(sorted(timelines)):
+        for status in timelines[user][:200]:
+            texts.append(status["text"])
+            labels.append(idx % 5)
+    return texts, labels
+
+
+
+class InferenceEngineTest(unittest.TestCase):
+    """
+    Compares labels, decision values and probabilities of the inference engine with scikit-learn
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.texts, cls.labels = load_texts()
+        cls.folder = tempfile.mkdtemp(prefix = "rlyt-test-")
+
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder)
+
+
+    def assertSamePredictions(self, engine, model, tfidf, texts):
+        """
+        Asserts that the engine predicts like the vectorizer and the model
+
+        engine (InferenceEngine): engine under test
+        model (LogisticRegression): fitted classifier
+        tfidf (TfidfVectorizer): fitted vectorizer
+        texts (list of strings): texts to be predicted
+        returns nothing
+        """
+        X = tfidf.transform(texts)
+        labels, scores = engine.predict(texts)
+        np.testing.assert_array_equal(labels, model.predict(X))
+        np.testing.assert_allclose(scores, model.decision_function(X), rtol = 1e-10, atol = 1e-10)
+        np.testing.assert_allclose(engine.predict_proba(scores), model.predict_proba(X), rtol = 1e-10, atol = 1e-10)
+
+
+    def test_pickles(self):
+        """
+        The model file in the data folder predicts like the pickles it was exported from
+        """
+        filenames = [os.path.join(REPO, "data", name) for name in ["log_regression_model.pkl", "tfidf_vectorizer.pkl", "model.bin"]]
+        if not all(os.path.isfile(filename) for filename in filenames):
+            self.skipTest("No trained model in the data folder")
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            with open(filenames[0]) as f:
+                model = pickle.load(f)
+            with open(filenames[1]) as f:
+                tfidf = pickle.load(f)
+        engine = InferenceEngine(ModelFile(filenames[2]))
+
+        # Words of the vocabulary mixed with unknown words and stop words, including empty texts
+        rng = random.Random(0)
+        terms = sorted(tfidf.vocabulary_)
+        texts = [" ".join([rng.choice(terms) if rng.random() < 0.5 else rng.choice(["Trump", "lol", "RT", "amazing", "the"]) for j in range(rng.randint(0, 20))]) for i in range(2000)]
+        self.assertSamePredictions(engine, model, tfidf, texts + self.texts[:500])
+
+
+    def test_exported(self):
+        """
+        Freshly exported models predict like the vectorizer and the model, for all supported settings
+        """
+        settings = [({}, {}),
+                    ({"ngram_range": (1, 2)}, {}),
+                    ({"ngram_range": (2, 3), "sublinear_tf": True}, {}),
+                    ({"norm": "l1", "lowercase": False}, {}),
+                    ({"norm": None}, {"multi_class": "multinomial", "solver": "lbfgs", "max_iter": 1000})]
+        for tfidf_settings, model_settings in settings:
+            tfidf = TfidfVectorizer(stop_words = "english", min_df = 3, **tfidf_settings)
+            X = tfidf.fit_transform(self.texts)
+            model = LogisticRegression(**dict({"solver": "liblinear", "multi_class": "ovr"}, **model_settings)).fit(X, self.labels)
+            filename = os.path.join(self.folder, "model.bin")
+            export_model(model, tfidf, filename)
+            self.assertSamePredictions(InferenceEngine(ModelFile(filename)), model, tfidf, self.texts)
+
+            # The vectorizer rebuilt from the model file transforms like the original one
+            self.assertAlmostEqual(abs(ModelFile(filename).vectorizer().transform(self.texts) - X).max(), 0.0)
+
+
+    def test_unsupported(self):
+        """
+        Vectorizers the model file cannot reproduce are not exported
+        """
+        for tfidf_settings in [{"analyzer": "char"}, {"use_idf": False}, {"binary": True}, {"strip_accents": "ascii"}, {"tokenizer": lambda text: text.split()}]:
+            tfidf = TfidfVectorizer(min_df = 3, **tfidf_settings)
+            model = LogisticRegression(solver = "liblinear", multi_class = "ovr").fit(tfidf.fit_transform(self.texts), self.labels)
+            with self.assertRaises(ValueError):
+                export_model(model, tfidf, os.path.join(self.folder, "unsupported.bin"))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Tests that the deduplicator finds exact and near-duplicates, also of texts that were not the first in their buckets
+(run with python -m unittest discover tests)
+"""
+
+# Imports
+import os
+import sys
+import unittest
+import numpy as np
+
+# The modules under test live in the src folder
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPO, "src"))
+from minhash import MinHasher, Deduplicator
+
+
+
+class DeduplicatorTest(unittest.TestCase):
+    """
+    Adds fingerprints of texts and of made up signatures to a deduplicator and checks which ones are removed
+    """
+
+    def setUp(self):
+        self.hasher = MinHasher()
+        self.deduplicator = Deduplicator(self.hasher)
+        self.rng = np.random.RandomState(0)
+
+
+    def add(self, text, label = 0):
+        """
+        Adds a text
+
+        text (string): text
+        label (int): label of the text
+        returns row number of the text it duplicates, or None if it was kept
+        """
+        digest, signature = self.hasher.fingerprint(text)
+        return self.deduplicator.add(digest, signature, label)
+
+
+    def test_texts(self):
+        """
+        Copies with other case and whitespace are exact duplicates, copies with one word changed near-duplicates
+        """
+        words = ["word{}".format(self.rng.randint(10**6)) for idx in range(100)]
+        changed = words[:50] + ["other"] + words[51:]
+        self.assertIsNone(self.add(" ".join(words)))
+        self.assertIsNone(self.add(" ".join(reversed(words))))
+        self.assertEqual(self.add("  ".join(words).upper()), 0)
+        self.assertEqual(self.add(" ".join(changed), label = 1), 0)
+        self.assertEqual(self.deduplicator.report(), {"kept": 2, "exact": 1, "near": 1, "conflicts": [(0, 1, 1)]})
+
+
+    def test_shared_bucket(self):
+        """
+        A near-duplicate that shares a band only with a kept text that came second in that band's bucket is still found
+        """
+        rows = self.deduplicator.rows
+        first = self.rng.randint(2**32, size = self.hasher.num_perm).astype(np.uint32)
+
+        # The second text agrees with the first one in the first band only, so it is kept in the same bucket
+        second = self.rng.randint(2**32, size = self.hasher.num_perm).astype(np.uint32)
+        second[:rows] = first[:rows]
+
+        # The third one agrees with the second one in all but one hash function of every other band
+        third = second.copy()
+        third[rows::rows] += 1
+        self.assertIsNone(self.deduplicator.add("first", first, 0))
+        self.assertIsNone(self.deduplicator.add("second", second, 0))
+        self.assertEqual(self.deduplicator.add("third", third, 0), 1)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
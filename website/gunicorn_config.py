@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Configuration of the gunicorn server that runs the website (see Procfile)
+"""
+
+# Imports
+import os
+import gc
+import shutil
+import tempfile
+
+# Several processes, each with a few threads. Requests mostly wait for the Twitter and New York Times APIs, so the
+# threads keep a process busy while the caches and the model are shared within it. Heroku sets WEB_CONCURRENCY
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.environ.get("THREADS", 8))
+
+# Load the app, and with it the predictor and its model, once in the master process before the workers are forked, so that
+# the workers share its memory instead of each loading a copy. The model arrays are numpy arrays or memory-mapped, which the
+# workers only read, so their pages stay shared (see benchmarks/bench_workers.py)
+preload_app = True
+
+
+def pre_fork(server, worker):
+    """
+    Collects garbage before every fork: what survives moves to the oldest generation, which the workers rarely collect,
+    so that the garbage collector does not write to (and thereby copy) the pages of the preloaded objects
+
+    server (Arbiter): gunicorn's master
+    worker (Worker): the worker about to be forked
+    returns nothing
+    """
+    gc.collect()
+
+
+# Folder in which every worker writes its metrics, so that /metrics shows those of all workers whichever one answers
+# (see metrics.py). Unless one is given, a new one is made before the app is loaded and removed when the server stops
+made_metrics_folder = "METRICS_FOLDER" not in os.environ
+if made_metrics_folder:
+    os.environ["METRICS_FOLDER"] = tempfile.mkdtemp(prefix = "rlyt-metrics-")
+
+
+def on_exit(server):
+    """
+    Removes the folder of the metrics when the server stops, if it was made here
+
+    server (Arbiter): gunicorn's master
+    returns nothing
+    """
+    if made_metrics_folder:
+        shutil.rmtree(os.environ["METRICS_FOLDER"], ignore_errors = True)
+
+
+# Give slow upstream calls some time, but do not let a hanging one block a thread forever
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Bind to the port heroku provides
+bind = "0.0.0.0:" + os.environ.get("PORT", "5000")
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Counters, gauges and latency histograms of the website, exposed in the Prometheus text format without any dependency.
+Every gunicorn worker process keeps its own metrics, and with a shared folder also writes them to a memory-mapped file
+of its own in there, so that whichever worker answers a scrape combines the values of all of them: counters and
+histograms are summed over the workers (including the ones that ended, so they never decrease), gauges are the value a
+worker sampled last (like prometheus_client's multiprocess mode, see website/gunicorn_config.py)
+"""
+
+# Imports
+import os
+import glob
+import json
+import mmap
+import time
+import bisect
+import struct
+import threading
+from contextlib import contextmanager
+
+# Upper bounds of the latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labels):
+    """
+    Formats labels for the exposition
+
+    labels (tuple of tuples): (name, value) pairs, sorted by name
+    returns string like {name="value",...}, or an empty string without labels
+    """
+    if not labels:
+        return ""
+    return "{" + ",".join(['{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in labels]) + "}"
+
+
+def format_value(value):
+    """
+    Formats a sample value for the exposition
+
+    value (number): value
+    returns string
+    """
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+
+class Histogram(object):
+    """
+    Class that counts observations in cumulative buckets, as well as their number and sum
+
+    buckets (tuple of floats): upper bounds of the buckets, ascending
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+
+    def observe(self, value):
+        """
+        Counts an observation
+
+        value (float): observed value
+        returns nothing
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+    def samples(self):
+        """
+        Cumulative bucket counts, the last bucket being +Inf
+
+        returns list of tuples of (upper bound, count)
+        """
+        cumulative, total = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+
+
+class SharedValues(object):
+    """
+    Class that keeps named values of one process in a memory-mapped file, which other processes read. Only the owning process
+    writes (not thread-safe on its own, see Metrics). The file starts with the number of used bytes, followed by the entries,
+    each the length of its name, the name (utf-8, padded to 8 bytes), the value and the time it was set (float64)
+
+    filename (string): full path of the file, it is created
+    size (int): initial size of the file in bytes, it doubles when it is full
+    """
+
+    def __init__(self, filename, size = 65536):
+        self.filename = filename
+        self.pid = os.getpid()
+        self.file = open(filename, "w+b")
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.used = 8
+        struct.pack_into("<Q", self.map, 0, self.used)
+
+        # Offsets of the values as name -> offset
+        self.offsets = {}
+
+
+    def set(self, name, value):
+        """
+        Sets a value, adding the entry if it is new
+
+        name (string): name of the value
+        value (float): value
+        returns nothing
+        """
+        offset = self.offsets.get(name)
+        if offset is None:
+            encoded = name.encode("utf-8")
+            length = 4 + len(encoded) + -(4 + len(encoded)) % 8
+            while self.used + length + 16 > len(self.map):
+                size = 2 * len(self.map)
+                self.map.close()
+                self.file.truncate(size)
+                self.map = mmap.mmap(self.file.fileno(), size)
+
+            # The name first and the number of used bytes last, so that readers never see a half written entry
+            struct.pack_into("<I", self.map, self.used, len(encoded))
+            self.map[self.used + 4:self.used + 4 + len(encoded)] = encoded
+            offset = self.offsets[name] = self.used + length
+            struct.pack_into("<dd", self.map, offset, value, time.time())
+            self.used = offset + 16
+            struct.pack_into("<Q", self.map, 0, self.used)
+        else:
+            struct.pack_into("<dd", self.map, offset, value, time.time())
+
+
+    @staticmethod
+    def read(filename):
+        """
+        Reads the values of a file, which another process may be writing
+
+        filename (string): full path of the file
+        returns list of tuples of (name, value, time it was set)
+        """
+        with open(filename, "rb") as f:
+            data = f.read()
+        if len(data) < 8:
+            return []
+        used = min(struct.unpack_from("<Q", data, 0)[0], len(data))
+        values, position = [], 8
+        while position + 4 <= used:
+            length = struct.unpack_from("<I", data, position)[0]
+            offset = position + 4 + length + -(4 + length) % 8
+            if offset + 16 > used:
+                break
+            value, stamp = struct.unpack_from("<dd", data, offset)
+            values.append((data[position + 4:position + 4 + length].decode("utf-8"), value, stamp))
+            position = offset + 16
+        return values
+
+
+
+class Metrics(object):
+    """
+    Class that keeps the metrics of the website. Counters and histograms are updated while serving, gauges are
+    functions that are only called when the metrics are exposed (e.g. to read the counters of the caches)
+
+    prefix (string): prefix of all metric names
+    buckets (tuple of floats): upper bounds of the latency buckets in seconds
+    folder (string): if given, folder shared by the worker processes, whose values are then combined when they are exposed
+        (gauges are sampled when sync is called, e.g. after every request, and when the metrics are exposed)
+    """
+
+    def __init__(self, prefix = "rlyt", buckets = DEFAULT_BUCKETS, folder = None):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.folder = folder
+        self.lock = threading.Lock()
+
+        # Metrics as name -> (type, help, {labels -> value or histogram}) and gauges as name -> (type, help, function, label)
+        self.metrics = {}
+        self.gauges = {}
+
+        # File of this process in the shared folder, opened on first use so that every process forked from this one gets its own
+        self.values = None
+        if folder is not None and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+
+    def share(self, name, kind, documentation, key, part, value):
+        """
+        Writes a value to the file of this process in the shared folder, if there is one (call with the lock held)
+
+        name (string): name without prefix
+        kind (string): "counter", "gauge" or "histogram"
+        documentation (string): help text
+        key (tuple of tuples): labels of the sample
+        part (int or string): index of the bucket or "sum" for histograms, None otherwise
+        value (float): value
+        returns nothing
+        """
+        if self.folder is None:
+            return
+        if self.values is None or self.values.pid != os.getpid():
+            self.values = SharedValues(os.path.join(self.folder, "{}.db".format(os.getpid())))
+        self.values.set(json.dumps([name, kind, documentation, [list(pair) for pair in key], part]), value)
+
+
+    def family(self, name, kind, documentation):
+        """
+        Gets the samples of a metric, creating it if needed (call with the lock held)
+
+        name (string): name without prefix
+        kind (string): "counter" or "histogram"
+        documentation (string): help text
+        returns dictionary of labels -> value or histogram
+        """
+        if name not in self.metrics:
+            self.metrics[name] = (kind, documentation, {})
+        return self.metrics[name][2]
+
+
+    def increment(self, name, amount = 1, documentation = "", **labels):
+        """
+        Increments a counter
+
+        name (string): name without prefix, should end with "_total"
+        amount (number): increment
+        documentation (string): help text, used when the counter is created
+        labels (strings): labels of the sample
+        returns nothing
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            samples = self.family(name, "counter", documentation)
+            samples[key] = samples.get(key, 0) + amount
+            self.share(name, "counter", documentation, key, None, samples[key])
+
+
+    def observe(self, name, value, documentation = "", **labels):
+        """
+        Adds an observation to a histogram
+
+        name (string): name without prefix
+        value (float): observed value
+        documentation (string): help text, used when the histogram is created
+        labels (strings): labels of the sample
+        returns nothing
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            samples = self.family(name, "histogram", documentation)
+            if key not in samples:
+                samples[key] = Histogram(self.buckets)
+            histogram = samples[key]
+            histogram.observe(value)
+            index = bisect.bisect_left(histogram.buckets, value)
+            self.share(name, "histogram", documentation, key, index, histogram.counts[index])
+            self.share(name, "histogram", documentation, key, "sum", histogram.sum)
+
+
+    def gauge(self, name, function, documentation = "", kind = "gauge", label = None):
+        """
+        Registers a value that is read when the metrics are exposed
+
+        name (string): name without prefix
+        function (function): returns a number or None (no sample), or with a label a dictionary of label value -> number
+        documentation (string): help text
+        kind (string): "gauge", or "counter" for values that only grow (like the counters of the caches)
+        label (string): name of the label, if the function returns several samples
+        returns nothing
+        """
+        with self.lock:
+            self.gauges[name] = (kind, documentation, function, label)
+
+
+    def sample(self):
+        """
+        Reads all gauges, a failing one is left out rather than breaking the whole exposition
+
+        returns list of tuples of (name, kind, help, {labels -> value})
+        """
+        with self.lock:
+            gauges = self.gauges.items()
+        sampled = []
+        for name, (kind, documentation, function, label) in sorted(gauges):
+            try:
+                value = function()
+            except Exception:
+                continue
+            samples = dict((((label, labelvalue),), sample) for labelvalue, sample in value.items()) if label is not None else {(): value}
+            sampled.append((name, kind, documentation, dict((key, sample) for key, sample in samples.items() if sample is not None)))
+        return sampled
+
+
+    def sync(self):
+        """
+        Writes the current values of the gauges to the shared folder, if there is one
+
+        returns nothing
+        """
+        if self.folder is None:
+            return
+        sampled = self.sample()
+        with self.lock:
+            for name, kind, documentation, samples in sampled:
+                for key, value in samples.items():
+                    self.share(name, kind, documentation, key, None, value)
+
+
+    def collect(self):
+        """
+        Combines the values of all processes in the shared folder: counters and histograms are summed, of the gauges the
+        last sampled value is taken
+
+        returns list of tuples of (name, kind, help, {labels -> value or histogram})
+        """
+        metrics, stamps = {}, {}
+        for filename in sorted(glob.glob(os.path.join(self.folder, "*.db"))):
+            try:
+                values = SharedValues.read(filename)
+            except (IOError, OSError):
+                continue
+            for entry, value, stamp in values:
+                name, kind, documentation, labels, part = json.loads(entry)
+                key = tuple(tuple(pair) for pair in labels)
+                samples = metrics.setdefault(name, (kind, documentation, {}))[2]
+                if kind == "histogram":
+                    histogram = samples.setdefault(key, Histogram(self.buckets))
+                    if part == "sum":
+                        histogram.sum += value
+                    else:
+                        histogram.counts[part] += int(value)
+                elif kind == "gauge":
+                    if stamp >= stamps.get((name, key), 0.0):
+                        samples[key], stamps[(name, key)] = value, stamp
+                else:
+                    samples[key] = samples.get(key, 0) + (int(value) if value == int(value) else value)
+        return [(name, kind, documentation, samples) for name, (kind, documentation, samples) in metrics.items()]
+
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Measures the duration of a stage of the request path, and counts the stage's errors
+
+        stage (string): name of the stage
+        returns context manager
+        """
+        start = time.time()
+        try:
+            yield
+        except Exception:
+            self.increment("stage_errors_total", documentation = "Errors per stage of the request path", stage = stage)
+            raise
+        finally:
+            self.observe("stage_duration_seconds", time.time() - start, documentation = "Duration per stage of the request path in seconds", stage = stage)
+
+
+    def exposition(self):
+        """
+        Writes all metrics in the Prometheus text format, of all processes if there is a shared folder
+
+        returns string
+        """
+        if self.folder is not None:
+            self.sync()
+            metrics = self.collect()
+        else:
+            with self.lock:
+                metrics = [(name, kind, documentation, dict(samples)) for name, (kind, documentation, samples) in self.metrics.items()]
+            metrics += self.sample()
+
+        lines = []
+        for name, kind, documentation, samples in sorted(metrics):
+            name = self.prefix + "_" + name
+            lines += ["# HELP {} {}".format(name, documentation), "# TYPE {} {}".format(name, kind)]
+            for key, value in sorted(samples.items()):
+                if kind == "histogram":
+                    with self.lock:
+                        buckets, total, count = value.samples(), value.sum, sum(value.counts)
+                    for bound, cumulative in buckets:
+                        lines.append(name + "_bucket" + format_labels(key + (("le", format_value(bound)),)) + " " + str(cumulative))
+                    lines.append(name + "_sum" + format_labels(key) + " " + format_value(total))
+                    lines.append(name + "_count" + format_labels(key) + " " + str(count))
+                else:
+                    lines.append(name + format_labels(key) + " " + format_value(value))
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Detection of exact and near-duplicate texts with MinHash signatures and locality-sensitive hashing (LSH), in one pass
+over the corpus: every text is compared only with the texts that share a band of its signature, not with all others
+(the same file is copied into the website folder, keep both versions identical)
+"""
+
+# Imports
+import zlib
+import hashlib
+import itertools
+import collections
+import numpy as np
+
+
+# Largest prime below 2**32, the hash functions are (a * x + b) mod PRIME, which fits into 64 bits for x, a, b < PRIME
+PRIME = np.uint64(4294967291)
+
+
+class MinHasher(object):
+    """
+    Class that makes fingerprints of texts: a hash of the exact words and a MinHash signature of the word shingles, whose
+    agreement with another signature estimates the Jaccard similarity of the two shingle sets
+
+    num_perm (int): number of hash functions, i.e. length of the signatures
+    shingle (int): number of consecutive words per shingle
+    seed (int): seed of the hash functions, texts are only comparable with the same seed
+    """
+
+    def __init__(self, num_perm = 64, shingle = 3, seed = 1):
+        self.num_perm = num_perm
+        self.shingle = shingle
+        self.seed = seed
+
+        # Parameters of the hash functions, as columns so that all functions are applied to all shingles at once
+        random = np.random.RandomState(seed)
+        self.a = random.randint(1, int(PRIME), size = num_perm).astype(np.uint64)[:, np.newaxis]
+        self.b = random.randint(0, int(PRIME), size = num_perm).astype(np.uint64)[:, np.newaxis]
+        self.mix = random.randint(1, 2**31, size = shingle).astype(np.uint64)
+
+
+    def shingles(self, words):
+        """
+        Hashes the shingles of a text
+
+        words (list of strings): words of the text
+        returns numpy array of shingle hashes
+        """
+        # The crc32 of the words (signed in python 2, casting to uint32 makes them unsigned)
+        hashes = np.fromiter(itertools.imap(zlib.crc32, words), dtype = np.int64, count = len(words)).astype(np.uint32).astype(np.uint64)
+
+        # Texts shorter than a shingle are a single shingle, otherwise combine the hashes of consecutive words
+        if len(hashes) <= self.shingle:
+            return np.array([(hashes * self.mix[:len(hashes)]).sum() % PRIME], dtype = np.uint64)
+        combined = np.zeros(len(hashes) - self.shingle + 1, dtype = np.uint64)
+        for offset in range(self.shingle):
+            combined += hashes[offset:len(hashes) - self.shingle + 1 + offset] * self.mix[offset]
+        return np.unique(combined % PRIME)
+
+
+    def signature(self, words):
+        """
+        Makes the MinHash signature of a list of words
+
+        words (list of strings): words of the text (byte strings, so that the hashes do not depend on the encoding)
+        returns numpy array of uint32
+        """
+        return ((self.a * self.shingles(words) + self.b) % PRIME).min(axis = 1).astype(np.uint32)
+
+
+    def fingerprint(self, text):
+        """
+        Makes the fingerprint of a text, case and whitespace are ignored
+
+        text (string): text
+        returns tuple of (sha1 digest of the words (string), MinHash signature (numpy array of uint32))
+        """
+        words = (text.encode("utf-8") if isinstance(text, unicode) else text).lower().split()
+        return hashlib.sha1(" ".join(words)).digest(), self.signature(words)
+
+
+
+class Deduplicator(object):
+    """
+    Class that keeps the first occurrence of every text and reports later exact or near-duplicates of it. Near-duplicates
+    are found by LSH: the signatures are cut into bands and texts sharing a band become candidates, which are duplicates if
+    their signatures agree in at least a threshold fraction of hash functions (with 8 bands of 8 hash functions, pairs with
+    a Jaccard similarity of 0.8 are found with a probability of over 0.99, pairs below 0.5 rarely become candidates).
+    Every bucket keeps the first bucket_size texts of its band hash, beyond that the later texts are only found by their
+    other bands
+
+    hasher (MinHasher): hasher the fingerprints are made with, by default MinHasher()
+    bands (int): number of bands, must divide the signature length
+    threshold (float): minimal estimated Jaccard similarity of near-duplicates
+    bucket_size (int): maximal number of texts per bucket, which bounds the comparisons per text
+    """
+
+    def __init__(self, hasher = None, bands = 8, threshold = 0.8, bucket_size = 16):
+        self.hasher = hasher if hasher is not None else MinHasher()
+        if self.hasher.num_perm % bands:
+            raise ValueError("The number of bands ({}) must divide the signature length ({})".format(bands, self.hasher.num_perm))
+        self.bands = bands
+        self.rows = self.hasher.num_perm // bands
+        self.threshold = threshold
+        self.bucket_size = bucket_size
+
+        # Index of the kept texts: digests to row numbers, band hashes to lists of row numbers, signatures and labels by row number
+        self.digests = {}
+        self.buckets = [{} for band in range(bands)]
+        self.signatures = np.zeros((1024, self.hasher.num_perm), dtype = np.uint32)
+        self.labels = []
+
+        # Counters of the removed texts, conflicts by (label of the kept text, label of the removed text)
+        self.exact, self.near = 0, 0
+        self.conflicts = collections.Counter()
+
+
+    def add(self, digest, signature, label):
+        """
+        Adds a text unless it duplicates a text added before
+
+        digest (string): sha1 digest of the text, as made by MinHasher.fingerprint
+        signature (numpy array): MinHash signature of the text, as made by MinHasher.fingerprint
+        label (int): label of the text
+        returns row number of the text it duplicates, or None if it was kept
+        """
+        # Exact duplicate
+        original = self.digests.get(digest)
+        if original is not None:
+            self.exact += 1
+            return self.removed(original, label)
+
+        # Near-duplicate, the most similar of the texts that share a band
+        keys = [hash(signature[band * self.rows:(band + 1) * self.rows].tostring()) for band in range(self.bands)]
+        candidates = sorted(set(row for band, key in enumerate(keys) for row in self.buckets[band].get(key, ())))
+        if candidates:
+            similarities = (self.signatures[candidates] == signature).mean(axis = 1)
+            best = similarities.argmax()
+            if similarities[best] >= self.threshold:
+                self.near += 1
+                return self.removed(candidates[best], label)
+
+        # Keep it, the signature array grows by doubling
+        row = len(self.labels)
+        if row == len(self.signatures):
+            self.signatures = np.resize(self.signatures, (2 * row, self.hasher.num_perm))
+        self.signatures[row] = signature
+        self.labels.append(label)
+        self.digests[digest] = row
+        for band, key in enumerate(keys):
+            bucket = self.buckets[band].setdefault(key, [])
+            if len(bucket) < self.bucket_size:
+                bucket.append(row)
+        return None
+
+
+    def removed(self, original, label):
+        """
+        Counts a removed text as label conflict if its label differs from the one of the kept text
+
+        original (int): row number of the kept text
+        label (int): label of the removed text
+        returns row number of the kept text
+        """
+        if self.labels[original] != label:
+            self.conflicts[(self.labels[original], label)] += 1
+        return original
+
+
+    def report(self, names = None):
+        """
+        Summarizes the removed texts
+
+        names (list of strings): names of the labels, to report conflicts by name
+        returns dictionary
+        """
+        name = (lambda label: names[label]) if names is not None else (lambda label: label)
+        return {"kept": len(self.labels), "exact": self.exact, "near": self.near,
+            "conflicts": [(name(kept), name(removed), count) for (kept, removed), count in self.conflicts.most_common()]}
@@ -11,13 +11,23 @@ September 2015
 import os
 import sys
 import pickle
-import tweepy
 import urllib2
 import httplib
 import json
+import threading
 import numpy as np
 from HTMLParser import HTMLParser
 from collections import Counter
+from multiprocessing.pool import ThreadPool
+from tokenizer import Tokenizer
+from modelfile import ModelFile
+from inference import InferenceEngine
+from topstories import TopStoriesCache
+from ranking import ArticleIndex
+from archiveindex import ArchiveIndex
+from tweetcache import TweetCache
+from timeline import TimelineFetcher
+from metrics import Metrics
 
 # Keys need to be set in the heroku environment, get them
 TW_CON_SECRET_KEY = os.environ.get('TW_CON_SECRET_KEY')
@@ -32,12 +42,20 @@ class Predictor(object):
 
     model_pickle (pickle): Pickled Logistic Regression model
     tfidf_pickle (pickle): Pickled Tfidf text vectorizer
+    tweet_folder (string): Folder in which the users' cleaned tweets are stored, by default they are only kept in memory
+    archive (string): Folder of the nearest neighbor index of the article archive (see archiveindex.py), by default there is none
     """
 
-    def __init__(self, model_pickle, tfidf_pickle, stopwords_pickle):
-        # Load the model, the text vectorizer, and the stopwords
-        self.model = pickle.load(open(model_pickle))
-        self.tfidf = pickle.load(open(tfidf_pickle))
+    def __init__(self, model_pickle, tfidf_pickle, stopwords_pickle, model_file = None, tweet_folder = None, archive = None):
+        # Load the model and the text vectorizer. From the memory-mapped model file if there is one, which is then scored by the fused
+        # inference engine without scikit-learn, otherwise unpickle them. Then load the stopwords
+        if model_file is not None:
+            self.engine = InferenceEngine(ModelFile(model_file))
+            self.model, self.tfidf = None, None
+        else:
+            self.engine = None
+            self.model = pickle.load(open(model_pickle))
+            self.tfidf = pickle.load(open(tfidf_pickle))
         self.stopwords = pickle.load(open(stopwords_pickle))
 
         # Label dictionary for nice categories
@@ -47,15 +65,39 @@ class Predictor(object):
         self.label_dict_NYT = {0: "arts", 1: "business", 2: "dining", 3: "health", 4: "nyregion", 5: "politics", 6: "realestate", 7: "science", \
              8: "sports", 9: "fashion", 10: "technology", 11: "travel", 12: "national", 13: "world"}
 
-        # Set up the Twitter access
-        auth = tweepy.OAuthHandler(TW_CON_SECRET_KEY, TW_CON_SECRET)
-        auth.set_access_token(TW_TOKEN_KEY, TW_TOKEN)
+        # Set up the Twitter access, fetching whole timelines in pages of 200 tweets and keeping track of the rate limit
+        self.timeline = TimelineFetcher(TW_CON_SECRET_KEY, TW_CON_SECRET, TW_TOKEN_KEY, TW_TOKEN, page_size = 200)
 
-        # Set up the Twitter API
-        self.api = tweepy.API(auth)
+        # Tokenizers that clean all non alphabetic characters and single letters. For tweets, also remove the "RT", which all retweets have, and for articles the stopwords
+        self.tweet_tokenizer = Tokenizer(stopwords = ["RT"])
+        self.article_tokenizer = Tokenizer(stopwords = self.stopwords)
 
-        # Helper list of all single alphabetic letters
-        self.singleletters = [chr(i) for i in range(97,123)] + [chr(i).upper() for i in range(97,123)]
+        # Top stories per section, tokenized once into an index for ranking them, kept for ten minutes and refreshed in the background
+        self.topstories = TopStoriesCache(api_key = NYT_TOP_STORIES_KEY, ttl = 600, transform = lambda articles: ArticleIndex(articles, self.article_tokenizer))
+
+        # Latest cleaned tweets of each user, so that returning users only need their new tweets to be fetched
+        self.tweetcache = TweetCache(max_users = 1000, folder = tweet_folder)
+
+        # All scraped articles, to recommend from the archive and not only from the current top stories
+        self.archive = ArchiveIndex(archive) if archive is not None else None
+
+        # How often each section was recommended, to guess the sections of new users
+        self.recommended = Counter()
+        self.lock = threading.Lock()
+
+        # Timers and counters of the request path, and the counters of the caches and the Twitter rate limit read when they are exposed,
+        # combined over the worker processes if gunicorn gave them a shared folder (see gunicorn_config.py)
+        self.metrics = Metrics(folder = os.environ.get("METRICS_FOLDER"))
+        self.metrics.gauge("topstories_lookups_total", lambda: {"hit": self.topstories.hits, "stale": self.topstories.stale_hits, "miss": self.topstories.misses}, "Top Stories cache lookups by result", kind = "counter", label = "result")
+        self.metrics.gauge("topstories_fetches_total", lambda: self.topstories.fetches, "Calls of the NYT Top Stories API", kind = "counter")
+        self.metrics.gauge("topstories_prefetches_total", lambda: self.topstories.prefetches, "Speculative fetches of sections", kind = "counter")
+        self.metrics.gauge("topstories_errors_total", lambda: self.topstories.errors, "Failed calls of the NYT Top Stories API", kind = "counter")
+        self.metrics.gauge("tweetcache_lookups_total", lambda: {"hit": self.tweetcache.hits, "miss": self.tweetcache.misses}, "Tweet cache lookups by result", kind = "counter", label = "result")
+        self.metrics.gauge("twitter_requests_total", lambda: self.timeline.requests, "Calls of the Twitter timeline API", kind = "counter")
+        self.metrics.gauge("twitter_rate_limited_total", lambda: self.timeline.rate_limited, "Calls of the Twitter timeline API rejected by the rate limit", kind = "counter")
+        self.metrics.gauge("twitter_rate_limit_remaining", lambda: self.timeline.budget()["remaining"], "Remaining calls of the Twitter timeline API in the current window")
+        self.metrics.gauge("twitter_rate_limit_limit", lambda: self.timeline.budget()["limit"], "Calls of the Twitter timeline API per window")
+        self.metrics.gauge("twitter_rate_limit_reset_seconds", lambda: self.timeline.budget()["reset_in"], "Seconds until the Twitter rate limit window resets")
 
 
     def fetch_tweets(self, user, number_of_tweets):
@@ -66,18 +108,49 @@ class Predictor(object):
         number_of_tweets (int): Number of latest tweets to be read and then used for recommendation
         returns list of tweets
         """
-        # List of tweets to be filled
-        tweets = []
+        # Tweets we already know, only use them if there are enough or if they are the user's whole timeline
+        known = self.tweetcache.get(user)
+        if known is not None and len(known) < number_of_tweets and not self.tweetcache.complete(user):
+            known = None
 
-        # Get the tweets and clean them from non-alphabetic characters. Also, remove the "RT", which all retweets have. Furthermore, remove singe character words
-        for status in tweepy.Cursor(self.api.user_timeline, id=user).items(number_of_tweets):
-            text = status.text
-            wordlist = "".join( [char if char in self.singleletters else " " for char in text] ).split()
-            cleanwordlist = [word for word in wordlist if word not in self.singleletters + ["RT"]]
-            tweets.append(" ".join(cleanwordlist))
+        # If the rate limit is nearly used up, keep the remaining requests for new users and serve the known tweets as they are
+        if known is not None and self.timeline.low(reserve = 10):
+            self.metrics.increment("twitter_budget_saved_total", documentation = "Users served their known tweets because the rate limit was nearly used up")
+            return [text for tweet_id, text in known[:number_of_tweets]]
+
+        # Get only the tweets newer than the known ones, or all of them
+        with self.metrics.timer("fetch_tweets"):
+            statuses = self.timeline.fetch(user, number_of_tweets, since_id = known[0][0] if known is not None else None)
+        self.metrics.increment("tweets_fetched_total", len(statuses), documentation = "Tweets fetched from Twitter")
+
+        # Clean the new ones from non-alphabetic characters, the "RT" and single character words, and merge them with the known ones
+        with self.metrics.timer("tokenize"):
+            tweets = zip([tweet_id for tweet_id, text in statuses], self.tweet_tokenizer.clean_batch([text for tweet_id, text in statuses]))
+
+        # Fewer tweets than asked for means that the whole timeline is known, since the known ones were either all of it or enough
+        tweets = (tweets + (known or []))[:number_of_tweets]
+        self.tweetcache.put(user, tweets, complete = len(tweets) < number_of_tweets)
 
         # Return the tweet list
-        return tweets
+        return [text for tweet_id, text in tweets]
+
+
+    def predict_tweets(self, tweets):
+        """
+        Predicts the label of each tweet, either in one pass with the inference engine or by vectorizing the tweets first
+
+        tweets (list of strings): cleaned tweets, possibly of many users
+        returns numpy array of labels
+        """
+        self.metrics.increment("tweets_scored_total", len(tweets), documentation = "Tweets scored by the model")
+        if self.engine is not None:
+            # The engine vectorizes and predicts in one pass
+            with self.metrics.timer("predict"):
+                return self.engine.predict(tweets)[0]
+        with self.metrics.timer("transform"):
+            vec_tweets = self.tfidf.transform(tweets)
+        with self.metrics.timer("predict"):
+            return self.model.predict(vec_tweets)
 
 
     def predict_class(self, tweets, number_of_classes):
@@ -88,11 +161,8 @@ class Predictor(object):
         number_of_classes (int): Number of classes to be recommended (It does not make much sense though, to recommend more than two or maximally three classes, beyond that it's pretty random)
         returns sorted list of most probable classes
         """
-        # Vectorize tweets
-        vec_tweets = self.tfidf.transform(tweets)
-
         # Predict label for each tweet
-        pred = self.model.predict(vec_tweets)
+        pred = self.predict_tweets(tweets)
 
         # Return most common labels
         try:
@@ -105,6 +175,119 @@ class Predictor(object):
         return returnlist
 
 
+    def predict_sections(self, tweets, number_of_sections):
+        """
+        Predicts the sections of the New York Times the user may be interested in, by averaging the class probabilities
+        of all tweets into one distribution for the user (unlike predict_class, this never has too few sections)
+
+        tweets (list of strings): Aggregated tweets, each in one string
+        number_of_sections (int): Number of sections to be recommended
+        returns list of tuples of (encoded label, probability), most probable first
+        """
+        if not tweets:
+            raise ValueError("There are no tweets to predict sections from")
+
+        # Class probabilities of each tweet
+        self.metrics.increment("tweets_scored_total", len(tweets), documentation = "Tweets scored by the model")
+        if self.engine is not None:
+            with self.metrics.timer("predict"):
+                probabilities = self.engine.predict_proba(self.engine.predict(tweets)[1])
+            classes = self.engine.classes
+        else:
+            with self.metrics.timer("transform"):
+                vec_tweets = self.tfidf.transform(tweets)
+            with self.metrics.timer("predict"):
+                probabilities = self.model.predict_proba(vec_tweets)
+            classes = self.model.classes_
+
+        # Average over the tweets and take the sections with the most probability mass
+        distribution = probabilities.mean(axis = 0)
+        ranked = np.argsort(-distribution, kind = "mergesort")[:number_of_sections]
+        return [(int(classes[idx]), float(distribution[idx])) for idx in ranked]
+
+
+    def recommend_sections(self, tweets, sections, number_of_articles = 3):
+        """
+        Recommends NYT articles from several sections at once. The sections are fetched in parallel, and the articles
+        of all of them are merged into one ranking by their Jaccard similarity weighted with the section's probability
+
+        tweets (list of strings): Aggregated tweets in one string
+        sections (list of tuples): (encoded label, probability) as returned by predict_sections
+        number_of_articles (int): Number of articles to be recommended in total
+        returns list of tuples of (section, title, abstract, url, score), best first
+        """
+        # Start fetching all sections at the same time (cached sections are not fetched again)
+        for label, probability in sections:
+            self.topstories.prefetch(self.label_dict_NYT[label])
+
+        # Split tweets into individual words and remove stopwords
+        tweetwordlist = [word for tweet in tweets for word in tweet.split() if word not in self.article_tokenizer.stopwords]
+
+        # Best articles of each section, a section that cannot be fetched is left out
+        candidates = []
+        for label, probability in sections:
+            try:
+                with self.metrics.timer("topstories"):
+                    index = self.topstories.get(self.label_dict_NYT[label])
+            except Exception, e:
+                print "Fetching the top stories of " + self.label_dict_NYT[label] + " failed: " + str(e)
+                continue
+            with self.metrics.timer("ranking"):
+                ranking = index.top_k(tweetwordlist, k = number_of_articles)
+            for recommended, distance in ranking:
+                candidates.append((probability * (1.0 - distance), self.label_dict[label], index.articles[recommended]))
+
+        # Merge into one ranking, articles that are in several sections only appear once
+        recommendations, urls = [], set()
+        for score, section, article in sorted(candidates, key = lambda candidate: -candidate[0]):
+            if article["url"] not in urls and len(recommendations) < number_of_articles:
+                urls.add(article["url"])
+                recommendations.append((section, HTMLParser().unescape(article["title"]), HTMLParser().unescape(article["abstract"]), article["url"], score))
+        return recommendations
+
+
+    def likely_labels(self, user, number_of_labels):
+        """
+        Guesses the sections of a user before the timeline is fetched, from the known tweets of the user if there are
+        any and otherwise (or in addition) from the sections recommended most often so far
+
+        user (string): twitter handle without the "@"
+        number_of_labels (int): Number of sections to be guessed
+        returns list of encoded labels, most likely first
+        """
+        labels = []
+        known = self.tweetcache.peek(user)
+        if known:
+            labels = [label for label, count in Counter(self.predict_tweets([text for tweet_id, text in known])).most_common(number_of_labels)]
+        with self.lock:
+            labels += [label for label, count in self.recommended.most_common(number_of_labels) if label not in labels]
+        return labels[:number_of_labels]
+
+
+    def recommend_user(self, user, number_of_tweets = 100, speculate = 2):
+        """
+        Recommends an article to a user. The top stories of the sections the user is likely interested in are fetched
+        while the timeline downloads, so that usually only the slower of both calls adds to the latency
+
+        user (string): twitter handle without the "@"
+        number_of_tweets (int): Number of latest tweets to be read and then used for recommendation
+        speculate (int): Number of sections fetched speculatively
+        returns tuple of (section, title, abstract, url)
+        """
+        # Start fetching the likely sections in the background (nothing happens for sections that are cached and fresh)
+        for label in self.likely_labels(user, speculate):
+            self.topstories.prefetch(self.label_dict_NYT[label])
+
+        # Meanwhile fetch the tweets and predict the section
+        tweets = self.fetch_tweets(user = user, number_of_tweets = number_of_tweets)
+        label = self.predict_class(tweets = tweets, number_of_classes = 1)[0]
+        with self.lock:
+            self.recommended[label] += 1
+
+        # Recommend, waiting for the section if it is still being fetched
+        return self.recommend_article(tweets = tweets, label = label)
+
+
     def recommend_article(self, tweets, label):
         """
         Recommend a NYT article based on the provided label
@@ -113,47 +296,137 @@ class Predictor(object):
         tweets (list of strings): Aggregated tweets in one string
         returns nothing
         """
+        return self.recommend_articles(tweets = tweets, label = label, number_of_articles = 1)[0]
+
+
+    def recommend_articles(self, tweets, label, number_of_articles):
+        """
+        Recommend several NYT articles from the section of the provided label
+
+        label (int): encoded label of the section to be used for recommendation
+        tweets (list of strings): Aggregated tweets in one string
+        number_of_articles (int): Number of articles to be recommended
+        returns list of tuples of (section, title, abstract, url), closest article first
+        """
 
-        # Get the top stories from the section, this should yield usually 30 artices
-        request_url = "https://api.nytimes.com/svc/topstories/v2/" + self.label_dict_NYT[label] + ".json?api-key=" + NYT_TOP_STORIES_KEY
+        # Get the index of the top stories from the section (cached for a while, see topstories.py), this should yield usually 30 artices
         try:
-            response = urllib2.urlopen(request_url).read()
+            with self.metrics.timer("topstories"):
+                index = self.topstories.get(self.label_dict_NYT[label])
         except urllib2.HTTPError, e:
             print "Error code: " + str(e.code)
             print "Error message: " + e.msg
             print "Error hdrs:\n" + str(e.hdrs)
             sys.exit()
 
-        # Load json response into python dictionary and randomly choose an article
-        articles = json.loads(response)
+        return self.rank_articles(index = index, tweets = tweets, label = label, number_of_articles = number_of_articles)
+
 
-        # List of Jaccard distances between articles and tweets
-        jaccarddistances = []
+    def rank_articles(self, index, tweets, label, number_of_articles):
+        """
+        Ranks the top stories of a section for a user
 
+        index (ArticleIndex): indexed top stories of the section
+        tweets (list of strings): Aggregated tweets in one string
+        label (int): encoded label of the section
+        number_of_articles (int): Number of articles to be recommended
+        returns list of tuples of (section, title, abstract, url), closest article first
+        """
         # Split tweets into individual words and remove stopwords
-        tweetwordlist = [word for tweet in tweets for word in tweet.split() if word not in self.stopwords]
+        tweetwordlist = [word for tweet in tweets for word in tweet.split() if word not in self.article_tokenizer.stopwords]
 
-        # Loop over all articles and calculate closest article to user's tweets based on Jaccard distance
-        for idx in range(articles["num_results"]):
+        # Rank all articles by their Jaccard distance to the user's tweets in one go
+        with self.metrics.timer("ranking"):
+            ranking = index.top_k(tweetwordlist, k = number_of_articles)
 
-            # Use all possible informations we have about the article and feed into long string
-            wordstring = " ".join([articles["results"][idx]["title"], articles["results"][idx]["abstract"], articles["results"][idx]["section"], articles["results"][idx]["subsection"], " ".join([string for string in articles["results"][idx]["des_facet"]]), " ".join([string for string in articles["results"][idx]["org_facet"]]), " ".join([string for string in articles["results"][idx]["per_facet"]])])
+        # Return recommendations
+        return [(self.label_dict[label], HTMLParser().unescape(index.articles[recommended]["title"]), HTMLParser().unescape(index.articles[recommended]["abstract"]), index.articles[recommended]["url"]) for recommended, distance in ranking]
 
-            # Clean all numbers, punktuation and everything else apart from alphabetic characters. Also remove single character words
-            wordlist = "".join( [char if char in self.singleletters else " " for char in wordstring] ).split()
-            cleanwordlist = [word for word in wordlist if word not in self.singleletters + self.stopwords]
 
-            # Calculate Jaccard distances and append to list
-            jaccarddistances.append(self.jaccard_dist(tweetwordlist, cleanwordlist))
+    def recommend_batch(self, users, number_of_tweets = 100, number_of_articles = 1, workers = 8):
+        """
+        Recommends articles to many users at once. The timelines are fetched concurrently, all tweets are scored in a
+        single call, and the users are grouped by their section so that every section's top stories are needed only once
+
+        users (list of strings): twitter handles without the "@"
+        number_of_tweets (int): Number of latest tweets of each user to be used for recommendation
+        number_of_articles (int): Number of articles to be recommended per user
+        workers (int): Number of timelines fetched at the same time
+        returns dictionary of user -> (label, list of tuples of (section, title, abstract, url)), or user -> error message
+        """
+        users = list(dict.fromkeys(users))
+        results = {}
+
+        # Fetch the timelines concurrently, a failure only affects its own user
+        def fetch(user):
+            try:
+                return self.fetch_tweets(user = user, number_of_tweets = number_of_tweets)
+            except Exception, e:
+                return e
+        pool = ThreadPool(max(1, min(workers, len(users))))
+        try:
+            timelines = pool.map(fetch, users)
+        finally:
+            pool.close()
+
+        # Keep the users with tweets
+        fetched = []
+        for user, tweets in zip(users, timelines):
+            if isinstance(tweets, Exception):
+                results[user] = "Fetching the tweets failed: " + str(tweets)
+            elif not tweets:
+                results[user] = "There are no tweets"
+            else:
+                fetched.append((user, tweets))
+
+        # Score the tweets of all users in one go and take every user's most common label
+        if fetched:
+            pred = self.predict_tweets([tweet for user, tweets in fetched for tweet in tweets])
+            bounds = np.cumsum([0] + [len(tweets) for user, tweets in fetched])
+            labels = [Counter(pred[start:stop]).most_common(1)[0][0] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+            # Group the users by section, get each section's top stories once and rank them for all of its users
+            groups = {}
+            for (user, tweets), label in zip(fetched, labels):
+                groups.setdefault(label, []).append((user, tweets))
+            for label, group in groups.items():
+                try:
+                    with self.metrics.timer("topstories"):
+                        index = self.topstories.get(self.label_dict_NYT[label])
+                except Exception, e:
+                    for user, tweets in group:
+                        results[user] = "Fetching the top stories failed: " + str(e)
+                    continue
+                for user, tweets in group:
+                    results[user] = (label, self.rank_articles(index = index, tweets = tweets, label = label, number_of_articles = number_of_articles))
+
+        return results
+
+
+    def recommend_archive(self, tweets, labels = None, number_of_articles = 3):
+        """
+        Recommends the articles of the archive with the smallest Jaccard distance to the tweets, found approximately by the archive index:
+        the search takes about the same time for any size of the archive, but finds fewer of the closest articles the larger the archive
+        is (recall of the top 10 was 0.97 with 100k articles and 0.89 with 200k, see archiveindex.py)
 
-        # Argsort
-        argsortedarray = np.argsort(jaccarddistances)
+        tweets (list of strings): Aggregated tweets in one string
+        labels (iterable over ints): encoded labels of the sections to recommend from, by default all
+        number_of_articles (int): Number of articles to be recommended
+        returns list of tuples of (section, title, abstract, url, distance), closest first
+        """
+        if self.archive is None:
+            raise ValueError("The predictor was made without an archive index")
 
-        # Recommend closest article
-        recommended = argsortedarray[0]
+        # Split tweets into individual words and remove stopwords
+        tweetwordlist = [word for tweet in tweets for word in tweet.split() if word not in self.article_tokenizer.stopwords]
 
-        # Return recommendations
-        return self.label_dict[label], HTMLParser().unescape(articles["results"][recommended]["title"]), HTMLParser().unescape(articles["results"][recommended]["abstract"]), articles["results"][recommended]["url"]
+        with self.metrics.timer("archive"):
+            ranking = self.archive.top_k(tweetwordlist, k = number_of_articles, labels = labels)
+        recommendations = []
+        for recommended, distance in ranking:
+            info = self.archive.info(recommended)
+            recommendations.append((self.label_dict[int(self.archive.labels[recommended])], HTMLParser().unescape(info["title"]), HTMLParser().unescape(info["abstract"]), info["url"], distance))
+        return recommendations
 
 
     def jaccard_dist(self, list1, list2):
@@ -181,7 +454,7 @@ def main():
     Main function
     """
     # Make predictor class, fetch tweets, predict_class
-    MyPredictor = Predictor(model_pickle = "log_regression_model.pkl", tfidf_pickle = "tfidf_vectorizer.pkl", stopwords_pickle = "stopwords.pkl")
+    MyPredictor = Predictor(model_pickle = "log_regression_model.pkl", tfidf_pickle = "tfidf_vectorizer.pkl", stopwords_pickle = "stopwords.pkl", model_file = "model.bin")
 
     # Fetch the tweets with command line input as twitter handle
     tweets = MyPredictor.fetch_tweets(user = '{}'.format(sys.argv[1]), number_of_tweets = 100)
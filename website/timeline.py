@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Fetcher for Twitter user timelines that uses the largest page size and keeps track of the remaining rate limit budget
+(the same file is copied into the website folder, keep both versions identical)
+"""
+
+# Imports
+import time
+import threading
+import requests
+from requests_oauthlib import OAuth1
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when the timeline rate limit is used up, before wasting a request on it
+    """
+    pass
+
+
+class TimelineFetcher(object):
+    """
+    Class that fetches the latest tweets of users with as few requests as possible. Every response's rate limit headers
+    are recorded, so that callers can check the remaining budget and serve cached results before the limit is hit
+
+    consumer_key (string): Twitter consumer key
+    consumer_secret (string): Twitter consumer secret
+    token_key (string): Twitter access token key
+    token_secret (string): Twitter access token secret
+    page_size (int): tweets per request, 200 is the most the timeline endpoint allows
+    base_url (string): url of the Twitter REST API
+    timeout (float): timeout in seconds for each request
+    """
+
+    def __init__(self, consumer_key, consumer_secret, token_key, token_secret, page_size = 200, base_url = "https://api.twitter.com/1.1/", timeout = 10.0):
+        self.auth = OAuth1(consumer_key, consumer_secret, token_key, token_secret)
+        self.session = requests.Session()
+        self.page_size = page_size
+        self.base_url = base_url
+        self.timeout = timeout
+
+        # Rate limit budget as reported by the last response
+        self.lock = threading.Lock()
+        self.limit, self.remaining, self.reset = None, None, None
+
+        # Counters
+        self.requests, self.rate_limited = 0, 0
+
+
+    def budget(self):
+        """
+        Reports the remaining rate limit budget of the timeline endpoint
+
+        returns dictionary with the limit and the remaining requests of the current window (None if unknown yet) and the seconds until it resets
+        """
+        with self.lock:
+            return {"limit": self.limit, "remaining": self.remaining, "reset_in": max(0.0, self.reset - time.time()) if self.reset is not None else None}
+
+
+    def low(self, reserve = 0):
+        """
+        Checks whether the budget is (nearly) used up for the current window
+
+        reserve (int): number of requests to be kept in reserve
+        returns boolean
+        """
+        with self.lock:
+            return self.remaining is not None and self.remaining <= reserve and self.reset is not None and self.reset > time.time()
+
+
+    def record(self, response):
+        """
+        Records the rate limit headers of a response
+
+        response (requests response): response of the timeline endpoint
+        returns nothing
+        """
+        headers = response.headers
+        with self.lock:
+            self.requests += 1
+            if "x-rate-limit-remaining" in headers:
+                self.limit = int(headers.get("x-rate-limit-limit", 0)) or self.limit
+                self.remaining = int(headers["x-rate-limit-remaining"])
+                self.reset = float(headers.get("x-rate-limit-reset", 0)) or self.reset
+
+
+    def fetch(self, user, number_of_tweets, since_id = None):
+        """
+        Fetches the latest tweets of a user
+
+        user (string): twitter handle without the "@"
+        number_of_tweets (int): maximal number of tweets
+        since_id (int): if given, only tweets newer than this one are fetched
+        returns list of (tweet id, text), newest first
+        """
+        tweets = []
+        max_id = None
+        while len(tweets) < number_of_tweets:
+            if self.low():
+                raise RateLimitExceeded("Timeline rate limit used up, resets in {:.0f} s".format(self.budget()["reset_in"]))
+
+            # Ask only for what we need: no user objects and no entities
+            params = {"screen_name": user, "count": min(self.page_size, number_of_tweets - len(tweets)), "trim_user": "true", "include_entities": "false"}
+            if since_id is not None:
+                params["since_id"] = since_id
+            if max_id is not None:
+                params["max_id"] = max_id
+
+            response = self.session.get(self.base_url + "statuses/user_timeline.json", params = params, auth = self.auth, timeout = self.timeout)
+            self.record(response)
+            if response.status_code == 429:
+                with self.lock:
+                    self.rate_limited += 1
+                raise RateLimitExceeded("Timeline rate limit exceeded")
+            response.raise_for_status()
+
+            # An empty page means there are no more tweets, and so does a short one when only the newer tweets are asked for
+            # (without since_id Twitter may return short pages before the end), otherwise continue below the oldest one
+            page = response.json()
+            if not page:
+                break
+            tweets.extend([(status["id"], status["text"]) for status in page])
+            if since_id is not None and len(page) < params["count"]:
+                break
+            max_id = page[-1]["id"] - 1
+
+        return tweets[:number_of_tweets]
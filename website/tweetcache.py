@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+"""
+Per-user store of cleaned tweets, so that returning users only need their new tweets to be fetched
+(the same file is copied into the website folder, keep both versions identical)
+"""
+
+# Imports
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+
+
+class TweetCache(object):
+    """
+    Class that keeps the latest cleaned tweets of each user, newest first, in memory and optionally on disc, and whether they are
+    the user's whole timeline (so that users with only a few tweets need not be fetched in full again). The least recently used
+    users are dropped from memory first
+
+    max_users (int): maximal number of users kept in memory
+    folder (string): if given, every user's tweets are also written to a json file in this folder and read from there after a restart
+    """
+
+    def __init__(self, max_users = 1000, folder = None):
+        self.max_users = max_users
+        self.folder = folder
+        if folder is not None and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        # Entries as user -> (list of (tweet id, cleaned text), whole timeline or not), in order of their last use
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        # Counters
+        self.hits, self.misses = 0, 0
+
+
+    def filename(self, user):
+        """
+        Filename of a user's tweets on disc (Twitter handles only contain letters, digits and underscores)
+
+        user (string): twitter handle without the "@"
+        returns full path
+        """
+        return os.path.join(self.folder, re.sub(r"[^a-z0-9_]", "_", user.lower()) + ".json")
+
+
+    def get(self, user):
+        """
+        Gets the stored tweets of a user
+
+        user (string): twitter handle without the "@"
+        returns list of (tweet id, cleaned text), newest first, or None if the user is unknown
+        """
+        key = user.lower()
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.entries[key] = entry
+                self.hits += 1
+                return entry[0]
+
+        # Fall back to the disc (files of older versions hold only the list of tweets)
+        if self.folder is not None and os.path.isfile(self.filename(key)):
+            with open(self.filename(key)) as f:
+                stored = json.load(f)
+            if isinstance(stored, list):
+                stored = {"tweets": stored, "complete": False}
+            tweets = [(tweet_id, text) for tweet_id, text in stored["tweets"]]
+            self.put(user, tweets, complete = stored["complete"], write = False)
+            with self.lock:
+                self.hits += 1
+            return tweets
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+
+    def peek(self, user):
+        """
+        Looks up the tweets of a user in memory, without counting it as use
+
+        user (string): twitter handle without the "@"
+        returns list of (tweet id, cleaned text), newest first, or None if the user is not in memory
+        """
+        with self.lock:
+            entry = self.entries.get(user.lower())
+            return entry[0] if entry is not None else None
+
+
+    def complete(self, user):
+        """
+        Looks up whether the stored tweets of a user in memory reach back to the user's first tweet, without counting it as use
+
+        user (string): twitter handle without the "@"
+        returns boolean, False if the user is not in memory
+        """
+        with self.lock:
+            entry = self.entries.get(user.lower())
+            return entry is not None and entry[1]
+
+
+    def put(self, user, tweets, complete = False, write = True):
+        """
+        Stores the tweets of a user
+
+        user (string): twitter handle without the "@"
+        tweets (list of tuples): (tweet id, cleaned text), newest first
+        complete (boolean): If true, the tweets are the user's whole timeline
+        write (boolean): If true, also write them to disc (if there is a folder)
+        returns nothing
+        """
+        key = user.lower()
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (tweets, complete)
+            while len(self.entries) > self.max_users:
+                self.entries.popitem(last = False)
+
+        # Write to a temporary file first, so that a crash never leaves a broken file behind
+        if write and self.folder is not None:
+            filename = self.filename(key)
+            temporary = "{}.{}.{}.tmp".format(filename, os.getpid(), threading.current_thread().ident)
+            with open(temporary, "w") as f:
+                json.dump({"tweets": tweets, "complete": complete}, f)
+            os.rename(temporary, filename)
@@ -12,12 +12,35 @@ __author__ = "Karsten Kreis"
 __status__ = "Development"
 
 # Imports
-from flask import Flask, render_template, request
+import os
+import time
+from flask import Flask, Response, render_template, request, jsonify
 import predictor
 
 # Initialize Flask app and the predictor
 app = Flask(__name__)
-MyPredictor = predictor.Predictor(model_pickle = "log_regression_model.pkl", tfidf_pickle = "tfidf_vectorizer.pkl", stopwords_pickle = "stopwords.pkl")
+MAX_BATCH_SIZE = 1000
+MAX_ARTICLES = 20
+MyPredictor = predictor.Predictor(model_pickle = "log_regression_model.pkl", tfidf_pickle = "tfidf_vectorizer.pkl", stopwords_pickle = "stopwords.pkl", model_file = "model.bin",
+    archive = "archive" if os.path.isdir("archive") else None)
+
+
+def parse_count(value, maximum):
+    """
+    Parses a number of articles given in a request
+
+    value (int or string): the number as given in the json body or the query string
+    maximum (int): largest allowed number
+    returns int, or None if the value is not a whole number between 1 and the maximum
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, long, basestring)):
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        return None
+    return number if 1 <= number <= maximum else None
+
 
 # Render the normal website
 @app.route('/')
@@ -32,19 +55,85 @@ def show_tweets():
     twitterhandle = request.form['screen_name'].encode('ascii', 'ignore').lower().strip()
 
     # Tweets, section, recommendation
+    start = time.time()
     try:
-        tweets = MyPredictor.fetch_tweets(user = twitterhandle, number_of_tweets = 100)
-        labels = MyPredictor.predict_class(tweets = tweets, number_of_classes = 1)
-        label, title, abstract, url = MyPredictor.recommend_article(tweets = tweets, label = labels[0])
+        label, title, abstract, url = MyPredictor.recommend_user(user = twitterhandle, number_of_tweets = 100, speculate = 2)
 
     # Error? Probably the Twitter handle was unknown
     except:
+        MyPredictor.metrics.increment("requests_total", documentation = "Requests by endpoint and outcome", endpoint = "show", outcome = "error")
         return render_template('/index.html', twitterhandle = "", topic = "An error occured. Maybe the Twitter user does not exist or there are no tweets?\nAlternatively, maybe the Twitter or the New York Times API did not work. Unfortunately, this happens sometimes... try again later in this case.", bla = "Entered Twitter handle was: " + twitterhandle, title = "", abstract = "" , url = "")
 
     # Otherwise return recommendation and reload the website including this data
+    MyPredictor.metrics.increment("requests_total", documentation = "Requests by endpoint and outcome", endpoint = "show", outcome = "ok")
+    MyPredictor.metrics.observe("request_duration_seconds", time.time() - start, documentation = "Duration of successful requests in seconds", endpoint = "show")
     return render_template('/index.html', twitterhandle = "Your Twitter handle: " + twitterhandle, topic = "You are probably interested in this topic: " + str(label), bla = "Maybe you find the following article from this topic interesting... ", title = "TITLE: " + title, abstract = "ABSTRACT: " + abstract, url = url)
 
+# Recommendations for many Twitter handles at once, e.g. for newsletters. Expects json like {"screen_names": ["handle", ...], "number_of_articles": 1}
+@app.route('/batch', methods=['POST'])
+def batch():
+
+    # Twitter handles and number of articles per handle
+    data = request.get_json(force = True, silent = True)
+    data = data if isinstance(data, dict) else {}
+    screen_names = data.get('screen_names')
+    if not isinstance(screen_names, list) or not 1 <= len(screen_names) <= MAX_BATCH_SIZE or not all(isinstance(handle, basestring) for handle in screen_names):
+        return jsonify(error = "Provide between 1 and " + str(MAX_BATCH_SIZE) + " Twitter handles as a list of strings in screen_names"), 400
+    number_of_articles = parse_count(data.get('number_of_articles', 1), MAX_ARTICLES)
+    if number_of_articles is None:
+        return jsonify(error = "Provide number_of_articles as a whole number between 1 and " + str(MAX_ARTICLES)), 400
+    twitterhandles = [handle.encode('ascii', 'ignore').lower().strip() for handle in screen_names]
+
+    # Recommendations for all handles, or the reason why there are none
+    start = time.time()
+    recommendations = {}
+    for twitterhandle, result in MyPredictor.recommend_batch(users = twitterhandles, number_of_tweets = 100, number_of_articles = number_of_articles).items():
+        if isinstance(result, tuple):
+            label, articles = result
+            recommendations[twitterhandle] = {"topic": MyPredictor.label_dict[label], "articles": [{"title": title, "abstract": abstract, "url": url} for section, title, abstract, url in articles]}
+        else:
+            recommendations[twitterhandle] = {"error": result}
+    MyPredictor.metrics.increment("requests_total", documentation = "Requests by endpoint and outcome", endpoint = "batch", outcome = "ok")
+    MyPredictor.metrics.observe("request_duration_seconds", time.time() - start, documentation = "Duration of successful requests in seconds", endpoint = "batch")
+    return jsonify(recommendations = recommendations)
+
+# Recommendations from the whole article archive, e.g. /archive?screen_name=handle&number_of_articles=3, with &section=0 from all sections instead of the predicted one
+@app.route('/archive')
+def archive():
+
+    # Only if the website was deployed with an archive index
+    if MyPredictor.archive is None:
+        return jsonify(error = "There is no article archive"), 404
+    twitterhandle = request.args.get('screen_name', '').encode('ascii', 'ignore').lower().strip()
+    number_of_articles = parse_count(request.args.get('number_of_articles', 3), MAX_ARTICLES)
+    if number_of_articles is None:
+        return jsonify(error = "Provide number_of_articles as a whole number between 1 and " + str(MAX_ARTICLES)), 400
+
+    # Tweets, section, closest articles of the archive
+    start = time.time()
+    try:
+        tweets = MyPredictor.fetch_tweets(user = twitterhandle, number_of_tweets = 100)
+        label = MyPredictor.predict_sections(tweets = tweets, number_of_sections = 1)[0][0]
+        articles = MyPredictor.recommend_archive(tweets = tweets, labels = [label] if request.args.get('section', '1') != '0' else None, number_of_articles = number_of_articles)
+    except Exception:
+        MyPredictor.metrics.increment("requests_total", documentation = "Requests by endpoint and outcome", endpoint = "archive", outcome = "error")
+        return jsonify(error = "No recommendations for " + twitterhandle + ", maybe the Twitter user does not exist or there are no tweets"), 400
+    MyPredictor.metrics.increment("requests_total", documentation = "Requests by endpoint and outcome", endpoint = "archive", outcome = "ok")
+    MyPredictor.metrics.observe("request_duration_seconds", time.time() - start, documentation = "Duration of successful requests in seconds", endpoint = "archive")
+    return jsonify(topic = MyPredictor.label_dict[label], articles = [{"section": section, "title": title, "abstract": abstract, "url": url, "distance": distance} for section, title, abstract, url, distance in articles])
+
+# Share the current values of the gauges with the other worker processes after every request
+@app.after_request
+def sync_metrics(response):
+    MyPredictor.metrics.sync()
+    return response
+
+# Timers and counters of all worker processes in the Prometheus text format
+@app.route('/metrics')
+def metrics():
+    return Response(MyPredictor.metrics.exposition(), mimetype = 'text/plain; version=0.0.4')
+
 # Run the server
 if __name__ == '__main__':
     # app.run(debug=True)
-    app.run(host='0.0.0.0', debug=False) # Never have debug = True when hosting a public website!
+    app.run(host='0.0.0.0', debug=False, threaded=True) # Never have debug = True when hosting a public website! In production, gunicorn runs the app (see Procfile)